@@ -1,6 +1,6 @@
 """Pydantic models for request/response schemas."""
 from pydantic import BaseModel, Field, ConfigDict
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Literal
 from datetime import datetime, timezone
 import uuid
 
@@ -64,6 +64,21 @@ class PhotoUpload(BaseModel):
     is_primary: bool = False
 
 
+class RecurrenceRule(BaseModel):
+    """Repeat a schedule every ``interval`` days or weeks, ``count`` times or until a date."""
+    frequency: Literal["daily", "weekly"] = "weekly"
+    interval: int = Field(1, ge=1, le=52)
+    count: Optional[int] = Field(None, ge=1, le=366)
+    until: Optional[str] = None
+
+
+class Waypoint(BaseModel):
+    latitude: float
+    longitude: float
+    name: Optional[str] = None
+    eta: Optional[str] = None
+
+
 class TravelSchedule(BaseModel):
     model_config = ConfigDict(extra="ignore")
     schedule_id: str = Field(default_factory=lambda: f"sched_{uuid.uuid4().hex[:12]}")
@@ -76,6 +91,10 @@ class TravelSchedule(BaseModel):
     end_date: str
     notes: Optional[str] = None
     looking_to_meet: bool = True
+    recurrence: Optional[RecurrenceRule] = None
+    series_end_date: Optional[str] = None
+    # The route itself lives in schedule_routes
+    has_route: bool = False
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 
@@ -88,6 +107,9 @@ class TravelScheduleCreate(BaseModel):
     end_date: str
     notes: Optional[str] = None
     looking_to_meet: bool = True
+    recurrence: Optional[RecurrenceRule] = None
+    waypoints: Optional[List[Waypoint]] = None
+    polyline: Optional[str] = None
 
 
 class ChatMessage(BaseModel):
@@ -128,10 +150,29 @@ class Notification(BaseModel):
     title: str
     message: str
     data: Dict[str, Any] = {}
+    content: Optional[str] = None
+    from_user_id: Optional[str] = None
+    from_user_name: Optional[str] = None
+    from_user_photo: Optional[str] = None
     read: bool = False
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 
+class ResumableUploadCreate(BaseModel):
+    filename: str
+    content_type: str
+    size: int = Field(gt=0)
+    media_type: Literal["image", "video"] = "image"
+
+
+class UploadIntentCreate(BaseModel):
+    filename: str
+    content_type: str
+    size: int = Field(gt=0)
+    media_type: Literal["image", "video"] = "image"
+    purpose: Literal["media", "profile_photo", "gallery"] = "media"
+
+
 class TypingStatus(BaseModel):
     conversation_id: str
     user_id: str
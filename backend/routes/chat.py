@@ -5,17 +5,18 @@ import uuid
 
 from services.database import db
 from services.websocket import manager
+from services.typing_indicators import typing_tracker
+from services.counters import unread_counters
+from services.notifications import notification_service
+from services.loaders import card_photos
 from models.schemas import ChatMessage, ChatMessageCreate
-from utils.helpers import get_current_user, get_conversation_id, create_notification
+from utils.helpers import get_current_user, get_conversation_id, create_message_notification
 
 router = APIRouter(tags=["chat"])
 
 
-@router.get("/conversations")
-async def get_conversations(request: Request):
-    """Get all conversations for current user."""
-    current_user = await get_current_user(request)
-    
+async def list_conversations(current_user: dict) -> dict:
+    """Build the conversation list for a user."""
     messages = await db.messages.find({
         "$or": [
             {"sender_id": current_user["user_id"]},
@@ -34,12 +35,14 @@ async def get_conversations(request: Request):
                 "last_message": msg,
                 "unread_count": 0
             }
-        if msg["recipient_id"] == current_user["user_id"] and not msg.get("read", False):
-            conversations[conv_id]["unread_count"] += 1
+    
+    counters = await unread_counters.get(current_user["user_id"])
+    for conv_id, conv in conversations.items():
+        conv["unread_count"] = max(counters.get("chats", {}).get(conv_id, 0), 0)
     
     other_ids = [c["other_user_id"] for c in conversations.values()]
     users = await db.users.find({"user_id": {"$in": other_ids}}, {"_id": 0, "password_hash": 0}).to_list(100)
-    user_map = {u["user_id"]: u for u in users}
+    user_map = {u["user_id"]: card_photos(u) for u in users}
     
     result = []
     for conv in conversations.values():
@@ -50,26 +53,38 @@ async def get_conversations(request: Request):
     return {"conversations": result}
 
 
-@router.get("/chat/{user_id}")
-async def get_chat_messages(user_id: str, request: Request):
-    """Get chat messages with a specific user."""
+@router.get("/conversations")
+async def get_conversations(request: Request):
+    """Get all conversations for current user."""
     current_user = await get_current_user(request)
+    return await list_conversations(current_user)
+
+
+async def fetch_chat_messages(current_user: dict, user_id: str) -> dict:
+    """Load a conversation and mark the user's incoming messages read."""
     conv_id = get_conversation_id(current_user["user_id"], user_id)
     
     messages = await db.messages.find({"conversation_id": conv_id}, {"_id": 0}).sort("created_at", 1).to_list(100)
     
-    await db.messages.update_many(
+    result = await db.messages.update_many(
         {"conversation_id": conv_id, "recipient_id": current_user["user_id"], "read": False},
         {"$set": {"read": True, "read_at": datetime.now(timezone.utc).isoformat()}}
     )
+    await unread_counters.add_chat(current_user["user_id"], conv_id, -result.modified_count)
+    await notification_service.mark_conversation_read(current_user["user_id"], conv_id)
     
     return {"messages": messages}
 
 
-@router.post("/chat/{user_id}")
-async def send_message(user_id: str, request: Request, message: ChatMessageCreate):
-    """Send a text message to a user."""
+@router.get("/chat/{user_id}")
+async def get_chat_messages(user_id: str, request: Request):
+    """Get chat messages with a specific user."""
     current_user = await get_current_user(request)
+    return await fetch_chat_messages(current_user, user_id)
+
+
+async def deliver_message(current_user: dict, user_id: str, message: ChatMessageCreate) -> dict:
+    """Store a text message between matched users and push it to the recipient."""
     conv_id = get_conversation_id(current_user["user_id"], user_id)
     
     my_like = await db.matches.find_one({
@@ -96,13 +111,14 @@ async def send_message(user_id: str, request: Request, message: ChatMessageCreat
     doc["created_at"] = doc["created_at"].isoformat()
     await db.messages.insert_one(doc)
     doc.pop("_id", None)
+    await unread_counters.add_chat(user_id, conv_id, 1)
+    await typing_tracker.clear(current_user["user_id"], user_id)
     
-    await create_notification(
+    await create_message_notification(
         user_id=user_id,
-        notif_type="new_message",
-        title="New Message",
-        message=f"{current_user.get('name', 'Someone')}: {message.content[:50]}...",
-        data={"sender_id": current_user["user_id"], "conversation_id": conv_id}
+        sender=current_user,
+        conversation_id=conv_id,
+        first_text=f"{current_user.get('name', 'Someone')}: {message.content[:50]}..."
     )
     
     if user_id in manager.active_connections:
@@ -111,10 +127,15 @@ async def send_message(user_id: str, request: Request, message: ChatMessageCreat
     return doc
 
 
-@router.post("/chat/{user_id}/read")
-async def mark_messages_read(user_id: str, request: Request):
-    """Mark all messages from a user as read and notify them."""
+@router.post("/chat/{user_id}")
+async def send_message(user_id: str, request: Request, message: ChatMessageCreate):
+    """Send a text message to a user."""
     current_user = await get_current_user(request)
+    return await deliver_message(current_user, user_id, message)
+
+
+async def mark_conversation_read(current_user: dict, user_id: str) -> dict:
+    """Mark all messages from a user as read and send them a read receipt."""
     conv_id = get_conversation_id(current_user["user_id"], user_id)
     
     read_at = datetime.now(timezone.utc).isoformat()
@@ -122,6 +143,8 @@ async def mark_messages_read(user_id: str, request: Request):
         {"conversation_id": conv_id, "recipient_id": current_user["user_id"], "read": False},
         {"$set": {"read": True, "read_at": read_at}}
     )
+    await unread_counters.add_chat(current_user["user_id"], conv_id, -result.modified_count)
+    await notification_service.mark_conversation_read(current_user["user_id"], conv_id)
     
     if user_id in manager.active_connections:
         await manager.send_personal_message({
@@ -134,27 +157,28 @@ async def mark_messages_read(user_id: str, request: Request):
     return {"marked_read": result.modified_count}
 
 
+@router.post("/chat/{user_id}/read")
+async def mark_messages_read(user_id: str, request: Request):
+    """Mark all messages from a user as read and notify them."""
+    current_user = await get_current_user(request)
+    return await mark_conversation_read(current_user, user_id)
+
+
+async def relay_typing(current_user: dict, user_id: str, is_typing: bool = True) -> dict:
+    """Update typing state for the other user; only start/stop transitions are forwarded."""
+    forwarded = await typing_tracker.update(current_user["user_id"], user_id, is_typing)
+    return {"sent": True, "forwarded": forwarded}
+
+
 @router.post("/chat/{user_id}/typing")
 async def send_typing_indicator(user_id: str, request: Request, is_typing: bool = True):
     """Send typing indicator to other user."""
     current_user = await get_current_user(request)
-    
-    if user_id in manager.active_connections:
-        await manager.send_personal_message({
-            "type": "typing",
-            "user_id": current_user["user_id"],
-            "is_typing": is_typing
-        }, user_id)
-    
-    return {"sent": True}
+    return await relay_typing(current_user, user_id, is_typing)
 
 
-@router.post("/chat/{user_id}/media")
-async def send_media_message(user_id: str, request: Request):
-    """Send a message with media (photo/video/GIF)."""
-    current_user = await get_current_user(request)
-    data = await request.json()
-    
+async def deliver_media_message(current_user: dict, user_id: str, data: dict) -> dict:
+    """Store a media (photo/video/GIF) message and push it to the recipient."""
     conv_id = get_conversation_id(current_user["user_id"], user_id)
     
     message = {
@@ -173,34 +197,31 @@ async def send_media_message(user_id: str, request: Request):
     
     await db.messages.insert_one(message)
     message.pop("_id", None)
+    await unread_counters.add_chat(user_id, conv_id, 1)
+    await typing_tracker.clear(current_user["user_id"], user_id)
     
     await manager.send_personal_message({"type": "new_message", "message": message}, user_id)
     
-    notification = {
-        "notification_id": f"notif_{uuid.uuid4().hex[:12]}",
-        "user_id": user_id,
-        "type": "new_message",
-        "content": f"{current_user['name']} sent you a {'photo' if message['message_type'] == 'image' else 'video' if message['message_type'] == 'video' else 'GIF' if message['message_type'] == 'gif' else 'message'}",
-        "from_user_id": current_user["user_id"],
-        "from_user_name": current_user["name"],
-        "from_user_photo": current_user.get("profile_photo"),
-        "read": False,
-        "created_at": datetime.now(timezone.utc).isoformat()
-    }
-    await db.notifications.insert_one(notification)
-    notification.pop("_id", None)
-    await manager.send_personal_message({"type": "notification", "notification": notification}, user_id)
+    await create_message_notification(
+        user_id=user_id,
+        sender=current_user,
+        conversation_id=conv_id,
+        first_text=f"{current_user['name']} sent you a {'photo' if message['message_type'] == 'image' else 'video' if message['message_type'] == 'video' else 'GIF' if message['message_type'] == 'gif' else 'message'}"
+    )
     
     return message
 
 
-@router.post("/messages/{message_id}/reaction")
-async def add_message_reaction(message_id: str, request: Request):
-    """Add emoji reaction to a message."""
+@router.post("/chat/{user_id}/media")
+async def send_media_message(user_id: str, request: Request):
+    """Send a message with media (photo/video/GIF)."""
     current_user = await get_current_user(request)
     data = await request.json()
-    emoji = data.get("emoji")
-    
+    return await deliver_media_message(current_user, user_id, data)
+
+
+async def apply_reaction(current_user: dict, message_id: str, emoji: str) -> dict:
+    """Add an emoji reaction to a message and notify its sender."""
     if not emoji:
         raise HTTPException(status_code=400, detail="Emoji required")
     
@@ -228,14 +249,26 @@ async def add_message_reaction(message_id: str, request: Request):
     return {"message": "Reaction added", "emoji": emoji}
 
 
-@router.delete("/messages/{message_id}/reaction")
-async def remove_message_reaction(message_id: str, request: Request):
-    """Remove emoji reaction from a message."""
+@router.post("/messages/{message_id}/reaction")
+async def add_message_reaction(message_id: str, request: Request):
+    """Add emoji reaction to a message."""
     current_user = await get_current_user(request)
-    
+    data = await request.json()
+    return await apply_reaction(current_user, message_id, data.get("emoji"))
+
+
+async def clear_reaction(current_user: dict, message_id: str) -> dict:
+    """Remove the user's reaction from a message."""
     await db.messages.update_one(
         {"message_id": message_id},
         {"$pull": {"reactions": {"user_id": current_user["user_id"]}}}
     )
     
     return {"message": "Reaction removed"}
+
+
+@router.delete("/messages/{message_id}/reaction")
+async def remove_message_reaction(message_id: str, request: Request):
+    """Remove emoji reaction from a message."""
+    current_user = await get_current_user(request)
+    return await clear_reaction(current_user, message_id)
@@ -1,26 +1,41 @@
 """Discovery and matching routes."""
-from fastapi import APIRouter, HTTPException, Request, Query
+from fastapi import APIRouter, HTTPException, Request, Query, Response
+from fastapi.responses import JSONResponse
 from typing import Optional, List, Dict
 from datetime import datetime, timezone, timedelta
+from math import cos, radians
 import uuid
 
 from services.database import db
 from services.websocket import manager
+from services.overlap_index import overlap_index
+from services.loaders import get_profile_loader, card_photos, PROFILE_CARD_PROJECTION
+from services.recurrence import occurrences, active_schedules_filter
+from services.cache import passing_through_cache, nearby_users_cache, geo_key, geo_search_area
+from services.map_clusters import map_cluster_index, MARKER_ZOOM
+from services.heatmap import (
+    horizon_for, tile_id, decode_tile, HORIZONS, MAX_HEATMAP_ZOOM, BINS_PER_TILE, META_TILE_ID
+)
 from models.schemas import Match
-from utils.helpers import get_current_user, calculate_distance, create_notification
+from utils.helpers import get_current_user, calculate_distance, create_notification, etag_matches
 
 router = APIRouter(tags=["discovery"])
 
+NEARBY_CANDIDATE_LIMIT = 500
+MAX_MAP_MARKERS = 300
+
 
 async def check_hot_traveler(user_id: str, target_lat: float = None, target_lon: float = None) -> dict:
     """Check if user is a hot traveler (has active travel schedule in the area)."""
     today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
     
-    active_schedule = await db.schedules.find_one({
-        "user_id": user_id,
-        "start_date": {"$lte": today},
-        "end_date": {"$gte": today}
-    }, {"_id": 0})
+    candidates = await db.schedules.find(
+        {"user_id": user_id, **active_schedules_filter(today)}, {"_id": 0}
+    ).to_list(None)
+    # Recurring rules only match if one of their occurrences covers today
+    active_schedule = next(
+        (occurrence for schedule in candidates for occurrence in occurrences(schedule, today, today)), None
+    )
     
     if active_schedule:
         return {
@@ -39,11 +54,10 @@ async def batch_check_hot_travelers(user_ids: List[str]) -> Dict[str, dict]:
     
     today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
     
-    active_schedules = await db.schedules.find({
-        "user_id": {"$in": user_ids},
-        "start_date": {"$lte": today},
-        "end_date": {"$gte": today}
-    }, {"_id": 0}).to_list(None)
+    candidates = await db.schedules.find(
+        {"user_id": {"$in": user_ids}, **active_schedules_filter(today)}, {"_id": 0}
+    ).to_list(None)
+    active_schedules = [o for schedule in candidates for o in occurrences(schedule, today, today)]
     
     hot_traveler_map = {}
     for schedule in active_schedules:
@@ -108,6 +122,7 @@ async def discover_users(
     users = await db.users.aggregate(pipeline).to_list(limit)
     
     for user in users:
+        card_photos(user)
         if current_user.get("latitude") and user.get("latitude"):
             user["distance"] = calculate_distance(
                 current_user["latitude"], current_user["longitude"],
@@ -131,6 +146,36 @@ async def discover_users(
     return {"users": users, "count": len(users), "hot_travelers_count": hot_count}
 
 
+async def load_nearby_candidates(lat: float, lon: float, radius: float) -> List[dict]:
+    """Onboarded users within ``radius`` miles of the point, flagged with hot-traveler status."""
+    lat_span = radius / 69.0
+    lon_span = radius / (69.0 * max(cos(radians(lat)), 0.01))
+    query = {
+        "onboarding_complete": True,
+        "latitude": {"$gte": lat - lat_span, "$lte": lat + lat_span}
+    }
+    if lon_span < 180:
+        lo, hi = lon - lon_span, lon + lon_span
+        if lo < -180:
+            query["$or"] = [{"longitude": {"$gte": lo + 360}}, {"longitude": {"$lte": hi}}]
+        elif hi > 180:
+            query["$or"] = [{"longitude": {"$gte": lo}}, {"longitude": {"$lte": hi - 360}}]
+        else:
+            query["longitude"] = {"$gte": lo, "$lte": hi}
+    
+    projection = {**PROFILE_CARD_PROJECTION, "latitude": 1, "longitude": 1}
+    users = [
+        card_photos(user) async for user in db.users.find(query, projection).limit(NEARBY_CANDIDATE_LIMIT)
+        if user.get("longitude") is not None
+        and calculate_distance(lat, lon, user["latitude"], user["longitude"]) <= radius
+    ]
+    
+    hot_traveler_map = await batch_check_hot_travelers([u["user_id"] for u in users])
+    for user in users:
+        user.update(hot_traveler_map.get(user["user_id"], {"is_hot_traveler": False}))
+    return users
+
+
 @router.get("/discover/nearby")
 async def get_nearby_users(request: Request, radius: int = 50):
     """Get users within a radius (miles) for map view."""
@@ -139,29 +184,20 @@ async def get_nearby_users(request: Request, radius: int = 50):
     if not current_user.get("latitude"):
         return {"users": [], "message": "Location not set"}
     
-    query = {
-        "user_id": {"$ne": current_user["user_id"]},
-        "onboarding_complete": True,
-        "latitude": {"$exists": True, "$ne": None}
-    }
-    
-    users = await db.users.find(query, {"_id": 0, "password_hash": 0}).to_list(100)
+    # Candidates around this cell (with hot-traveler flags) are shared by everyone here
+    key = geo_key(current_user["latitude"], current_user["longitude"], radius)
+    candidates = await nearby_users_cache.get(key, lambda: load_nearby_candidates(*geo_search_area(key)))
     
     nearby = []
-    for user in users:
-        if user.get("latitude"):
-            distance = calculate_distance(
-                current_user["latitude"], current_user["longitude"],
-                user["latitude"], user["longitude"]
-            )
-            if distance <= radius:
-                user["distance"] = distance
-                nearby.append(user)
-    
-    nearby_user_ids = [u["user_id"] for u in nearby]
-    hot_traveler_map = await batch_check_hot_travelers(nearby_user_ids)
-    for user in nearby:
-        user.update(hot_traveler_map.get(user["user_id"], {"is_hot_traveler": False}))
+    for user in candidates:
+        if user["user_id"] == current_user["user_id"]:
+            continue
+        distance = calculate_distance(
+            current_user["latitude"], current_user["longitude"],
+            user["latitude"], user["longitude"]
+        )
+        if distance <= radius:
+            nearby.append({**user, "distance": distance})
     
     nearby.sort(key=lambda x: (not x.get("is_hot_traveler", False), x.get("distance", 999)))
     
@@ -169,21 +205,116 @@ async def get_nearby_users(request: Request, radius: int = 50):
     return {"users": nearby, "count": len(nearby), "hot_travelers_count": hot_count}
 
 
-@router.post("/discover/action")
-async def match_action(request: Request, target_user_id: str, action: str):
-    """Like, super like, or pass on a user."""
+@router.get("/discover/nearby/clusters")
+async def get_nearby_clusters(
+    request: Request,
+    south: float = Query(..., ge=-90, le=90),
+    west: float = Query(..., ge=-180, le=180),
+    north: float = Query(..., ge=-90, le=90),
+    east: float = Query(..., ge=-180, le=180),
+    zoom: int = Query(..., ge=0, le=22)
+):
+    """
+    Users in a map viewport, clustered for the zoom level.
+    
+    Below zoom 13 returns grid clusters (count, centroid, hot traveler count);
+    closer in returns individual user markers, unless the viewport still holds
+    more than ``MAX_MAP_MARKERS`` people. ``west > east`` crosses the antimeridian.
+    """
     current_user = await get_current_user(request)
+    if south > north:
+        raise HTTPException(status_code=400, detail="south must not be greater than north")
+    await map_cluster_index.ensure_loaded()
+    
+    if zoom >= MARKER_ZOOM:
+        members = map_cluster_index.members(south, west, north, east, exclude_user_id=current_user["user_id"])
+        if len(members) <= MAX_MAP_MARKERS:
+            user_ids = [m[0] for m in members]
+            profiles = await get_profile_loader(request).load_many(user_ids)
+            hot_traveler_map = await batch_check_hot_travelers(user_ids)
+            markers = []
+            for (user_id, lat, lon, _), profile in zip(members, profiles):
+                if profile is None:
+                    continue
+                marker = {**profile, "latitude": lat, "longitude": lon}
+                marker.update(hot_traveler_map.get(user_id, {"is_hot_traveler": False}))
+                if current_user.get("latitude") and current_user.get("longitude"):
+                    marker["distance"] = calculate_distance(current_user["latitude"], current_user["longitude"], lat, lon)
+                markers.append(marker)
+            markers.sort(key=lambda x: (not x.get("is_hot_traveler", False), x.get("distance", 999)))
+            hot_count = sum(1 for m in markers if m.get("is_hot_traveler"))
+            return {"zoom": zoom, "clusters": [], "markers": markers, "count": len(markers), "hot_travelers_count": hot_count}
+    
+    clusters = map_cluster_index.clusters(south, west, north, east, zoom, exclude_user_id=current_user["user_id"])
+    return {
+        "zoom": zoom,
+        "clusters": clusters,
+        "markers": [],
+        "count": sum(c["count"] for c in clusters),
+        "hot_travelers_count": sum(c["hot_travelers_count"] for c in clusters)
+    }
+
+
+@router.get("/discover/heatmap")
+async def get_heatmap_info(request: Request, days: int = Query(14, ge=1, le=60)):
+    """
+    Describe the traveler density heatmap for the next ``days`` days.
     
+    Tiles are precomputed for a few horizons; ``days`` is rounded up to the
+    nearest one. ``max`` gives the largest bin value per zoom for color scaling.
+    """
+    await get_current_user(request)
+    horizon = horizon_for(days)
+    meta = await db.heatmap_tiles.find_one({"tile_id": META_TILE_ID}, {"_id": 0}) or {}
+    return {
+        "days": horizon,
+        "horizons": list(HORIZONS),
+        "max_zoom": MAX_HEATMAP_ZOOM,
+        "bins_per_tile": BINS_PER_TILE,
+        "tile_url": f"/api/discover/heatmap/{{z}}/{{x}}/{{y}}?days={horizon}",
+        "generated_at": meta.get("generated_at"),
+        "max": meta.get("max", {}).get(str(horizon), {})
+    }
+
+
+@router.get("/discover/heatmap/{z}/{x}/{y}")
+async def get_heatmap_tile(request: Request, z: int, x: int, y: int, days: int = Query(14, ge=1, le=60)):
+    """
+    One heatmap tile: ``bins`` lists ``[col, row, traveler_days]`` for the
+    non-empty cells of a ``bins_per_tile`` square grid over Web Mercator tile
+    z/x/y. Send the ETag back in If-None-Match to get a 304 when unchanged.
+    """
+    await get_current_user(request)
+    if not (0 <= z <= MAX_HEATMAP_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise HTTPException(status_code=404, detail="Tile not found")
+    horizon = horizon_for(days)
+    doc = await db.heatmap_tiles.find_one({"tile_id": tile_id(horizon, z, x, y)}, {"_id": 0, "etag": 1, "data": 1})
+    
+    etag = f'"{doc["etag"]}"' if doc else '"empty"'
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=60"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse({
+        "z": z, "x": x, "y": y,
+        "days": horizon,
+        "size": BINS_PER_TILE,
+        "bins": decode_tile(doc["data"]) if doc else []
+    }, headers=headers)
+
+
+async def perform_match_action(current_user: dict, target_user_id: str, action: str) -> dict:
+    """Record a like, super like, or pass and create match notifications."""
     if action not in ["like", "super_like", "pass"]:
         raise HTTPException(status_code=400, detail="Action must be 'like', 'super_like', or 'pass'")
     
     if action == "super_like":
-        if current_user.get("super_likes_remaining", 0) <= 0:
-            raise HTTPException(status_code=400, detail="No super likes remaining")
-        await db.users.update_one(
-            {"user_id": current_user["user_id"]},
+        # Guarded decrement: the principal may be cached on a WebSocket connection
+        result = await db.users.update_one(
+            {"user_id": current_user["user_id"], "super_likes_remaining": {"$gt": 0}},
             {"$inc": {"super_likes_remaining": -1}}
         )
+        if result.modified_count == 0:
+            raise HTTPException(status_code=400, detail="No super likes remaining")
     
     existing = await db.matches.find_one({
         "user_id": current_user["user_id"], "target_user_id": target_user_id
@@ -206,7 +337,9 @@ async def match_action(request: Request, target_user_id: str, action: str):
                 notif_type="super_like",
                 title="Someone Super Liked You!",
                 message=f"{current_user.get('name', 'Someone')} super liked your profile!",
-                data={"from_user_id": current_user["user_id"]}
+                data={"from_user_id": current_user["user_id"]},
+                from_user=current_user,
+                collapse_key=current_user["user_id"]
             )
         
         mutual = await db.matches.find_one({
@@ -234,7 +367,8 @@ async def match_action(request: Request, target_user_id: str, action: str):
                     "matched_user_id": target_user_id,
                     "matched_user_name": target_user.get("name"),
                     "matched_user_photo": target_user.get("profile_photo")
-                }
+                },
+                from_user=target_user
             )
             
             await create_notification(
@@ -246,12 +380,20 @@ async def match_action(request: Request, target_user_id: str, action: str):
                     "matched_user_id": current_user["user_id"],
                     "matched_user_name": current_user.get("name"),
                     "matched_user_photo": current_user.get("profile_photo")
-                }
+                },
+                from_user=current_user
             )
     
     return {"action": action, "is_match": is_match}
 
 
+@router.post("/discover/action")
+async def match_action(request: Request, target_user_id: str, action: str):
+    """Like, super like, or pass on a user."""
+    current_user = await get_current_user(request)
+    return await perform_match_action(current_user, target_user_id, action)
+
+
 @router.post("/boost")
 async def activate_boost(request: Request):
     """Activate profile boost for 30 minutes."""
@@ -283,21 +425,21 @@ async def get_matches(request: Request):
         "action": {"$in": ["like", "super_like"]}
     }, {"_id": 0}).to_list(1000)
     
-    matched_user_ids = [m["user_id"] for m in mutual_matches]
-    matched_users = await db.users.find(
-        {"user_id": {"$in": matched_user_ids}},
-        {"_id": 0, "password_hash": 0}
-    ).to_list(100)
+    matched_user_ids = [m["user_id"] for m in mutual_matches][:100]
+    matched_users = [u for u in await get_profile_loader(request).load_many(matched_user_ids) if u]
     
     from utils.helpers import get_conversation_id
-    for user in matched_users:
-        conv_id = get_conversation_id(current_user["user_id"], user["user_id"])
-        last_msg = await db.messages.find_one(
-            {"conversation_id": conv_id},
-            {"_id": 0},
-            sort=[("created_at", -1)]
-        )
-        user["last_message"] = last_msg
+    conv_ids = [get_conversation_id(current_user["user_id"], u["user_id"]) for u in matched_users]
+    last_messages = {}
+    async for row in db.messages.aggregate([
+        {"$match": {"conversation_id": {"$in": conv_ids}}},
+        {"$sort": {"created_at": -1}},
+        {"$group": {"_id": "$conversation_id", "message": {"$first": "$$ROOT"}}}
+    ]):
+        row["message"].pop("_id", None)
+        last_messages[row["_id"]] = row["message"]
+    for user, conv_id in zip(matched_users, conv_ids):
+        user["last_message"] = last_messages.get(conv_id)
     
     return {"matches": matched_users}
 
@@ -318,12 +460,9 @@ async def get_likes_received(request: Request):
     ).to_list(1000)
     my_liked_ids = set(m["target_user_id"] for m in my_likes)
     
-    pending_ids = [l["user_id"] for l in likes if l["user_id"] not in my_liked_ids]
+    pending_ids = list(dict.fromkeys(l["user_id"] for l in likes if l["user_id"] not in my_liked_ids))
     
-    users = await db.users.find(
-        {"user_id": {"$in": pending_ids}},
-        {"_id": 0, "password_hash": 0}
-    ).to_list(100)
+    users = [u for u in await get_profile_loader(request).load_many(pending_ids) if u]
     
     super_like_ids = set(l["user_id"] for l in likes if l["action"] == "super_like")
     for user in users:
@@ -350,10 +489,11 @@ async def get_online_users(request: Request):
     
     users = await db.users.find(
         {"user_id": {"$in": list(matched_user_ids)}},
-        {"_id": 0, "user_id": 1, "name": 1, "profile_photo": 1, "online": 1, "last_active": 1}
+        {"_id": 0, "user_id": 1, "name": 1, "profile_photo": 1, "photo_variants": 1, "online": 1, "last_active": 1}
     ).to_list(100)
     
     for user in users:
+        card_photos(user)
         user["online"] = manager.is_online(user["user_id"])
     
     return {"users": users}
@@ -363,7 +503,8 @@ async def get_online_users(request: Request):
 async def get_travelers_passing_through(
     request: Request,
     days_ahead: int = Query(14, ge=1, le=60),
-    radius_miles: int = Query(50, ge=10, le=200)
+    radius_miles: int = Query(50, ge=10, le=200),
+    include_routes: bool = True
 ):
     """
     Find travelers whose upcoming schedules pass through your area.
@@ -374,6 +515,8 @@ async def get_travelers_passing_through(
     Args:
         days_ahead: How many days into the future to look (default 14, max 60)
         radius_miles: How close their destination should be to you (default 50 miles)
+        include_routes: Also include road trips whose route passes within the radius
+            on a day in the window (default True)
     """
     current_user = await get_current_user(request)
     
@@ -391,72 +534,83 @@ async def get_travelers_passing_through(
     today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
     future_date = (datetime.now(timezone.utc) + timedelta(days=days_ahead)).strftime("%Y-%m-%d")
     
-    # Find all schedules in the date range that have coordinates
-    schedules = await db.schedules.find({
-        "user_id": {"$ne": current_user["user_id"]},
-        "start_date": {"$lte": future_date},
-        "end_date": {"$gte": today},
-        "latitude": {"$exists": True, "$ne": None},
-        "longitude": {"$exists": True, "$ne": None}
-    }, {"_id": 0}).to_list(500)
-    
-    # Filter by distance and group by user
+    # Schedules in the date range whose destination is near this cell, shared by
+    # everyone around here; trimmed to this user's exact position and radius
+    key = geo_key(user_lat, user_lon, radius_miles, today, days_ahead)
+    candidates = await passing_through_cache.get(
+        key, lambda: overlap_index.query(*geo_search_area(key), today, future_date)
+    )
+    schedules = []
+    for schedule, _ in candidates:
+        if schedule["user_id"] == current_user["user_id"]:
+            continue
+        distance = calculate_distance(user_lat, user_lon, schedule["latitude"], schedule["longitude"])
+        if distance <= radius_miles:
+            schedules.append((schedule, distance))
+    schedules.sort(key=lambda pair: (pair[1], pair[0]["start_date"]))
+    
+    # Road trips whose route passes nearby; for those, the trip's dates here are the passing day
+    if include_routes:
+        seen = {(s["schedule_id"], s["start_date"]) for s, _ in schedules}
+        for schedule, distance in await overlap_index.query_routes(
+            user_lat, user_lon, radius_miles, today, future_date,
+            exclude_user_id=current_user["user_id"]
+        ):
+            if (schedule["schedule_id"], schedule["start_date"]) not in seen:
+                schedule["start_date"] = schedule["end_date"] = schedule["passing_date"]
+                schedules.append((schedule, distance))
+    
+    # Group by user
     travelers_map = {}
     
-    for schedule in schedules:
-        if not schedule.get("latitude") or not schedule.get("longitude"):
-            continue
+    for schedule, distance in schedules:
+        user_id = schedule["user_id"]
+        passing = "passing_date" in schedule
         
-        # Calculate distance from user to schedule destination
-        distance = calculate_distance(
-            user_lat, user_lon,
-            schedule["latitude"], schedule["longitude"]
-        )
+        # Determine if they're currently there or arriving soon
+        start_date = schedule["start_date"]
+        end_date = schedule["end_date"]
         
-        if distance <= radius_miles:
-            user_id = schedule["user_id"]
-            
-            # Determine if they're currently there or arriving soon
-            start_date = schedule["start_date"]
-            end_date = schedule["end_date"]
-            
-            if start_date <= today <= end_date:
-                status = "here_now"
-                status_text = "Currently here"
-            elif start_date > today:
-                days_until = (datetime.strptime(start_date, "%Y-%m-%d") - datetime.strptime(today, "%Y-%m-%d")).days
-                status = "arriving_soon"
-                status_text = f"Arriving in {days_until} day{'s' if days_until != 1 else ''}"
-            else:
-                continue  # Skip past schedules
-            
-            trip_info = {
-                "schedule_id": schedule.get("schedule_id"),
-                "destination": schedule.get("destination"),
-                "title": schedule.get("title"),
-                "start_date": start_date,
-                "end_date": end_date,
-                "distance_miles": distance,
-                "status": status,
-                "status_text": status_text,
-                "looking_to_meet": schedule.get("looking_to_meet", True)
+        if start_date <= today <= end_date:
+            status = "here_now"
+            status_text = "Passing through today" if passing else "Currently here"
+        elif start_date > today:
+            days_until = (datetime.strptime(start_date, "%Y-%m-%d") - datetime.strptime(today, "%Y-%m-%d")).days
+            status = "arriving_soon"
+            verb = "Passing through" if passing else "Arriving"
+            status_text = f"{verb} in {days_until} day{'s' if days_until != 1 else ''}"
+        else:
+            continue  # Skip past schedules
+        
+        trip_info = {
+            "schedule_id": schedule.get("schedule_id"),
+            "destination": schedule.get("destination"),
+            "title": schedule.get("title"),
+            "start_date": start_date,
+            "end_date": end_date,
+            "distance_miles": distance,
+            "status": status,
+            "status_text": status_text,
+            "looking_to_meet": schedule.get("looking_to_meet", True)
+        }
+        if passing:
+            trip_info["passing_point"] = schedule["passing_point"]
+        
+        if user_id not in travelers_map:
+            travelers_map[user_id] = {
+                "user_id": user_id,
+                "trips": [],
+                "closest_distance": distance,
+                "soonest_arrival": start_date
             }
-            
-            if user_id not in travelers_map:
-                travelers_map[user_id] = {
-                    "user_id": user_id,
-                    "trips": [],
-                    "closest_distance": distance,
-                    "soonest_arrival": start_date
-                }
-            
-            travelers_map[user_id]["trips"].append(trip_info)
-            
-            # Track closest distance and soonest arrival for sorting
-            if distance < travelers_map[user_id]["closest_distance"]:
-                travelers_map[user_id]["closest_distance"] = distance
-            if start_date < travelers_map[user_id]["soonest_arrival"]:
-                travelers_map[user_id]["soonest_arrival"] = start_date
+        
+        travelers_map[user_id]["trips"].append(trip_info)
+        
+        # Track closest distance and soonest arrival for sorting
+        if distance < travelers_map[user_id]["closest_distance"]:
+            travelers_map[user_id]["closest_distance"] = distance
+        if start_date < travelers_map[user_id]["soonest_arrival"]:
+            travelers_map[user_id]["soonest_arrival"] = start_date
     
     if not travelers_map:
         return {
@@ -468,10 +622,7 @@ async def get_travelers_passing_through(
     
     # Get user profiles
     user_ids = list(travelers_map.keys())
-    users = await db.users.find(
-        {"user_id": {"$in": user_ids}},
-        {"_id": 0, "password_hash": 0}
-    ).to_list(100)
+    users = [u for u in await get_profile_loader(request).load_many(user_ids[:100]) if u]
     
     # Check which users we've already acted on
     acted_users = await db.matches.find(
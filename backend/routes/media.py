@@ -1,190 +1,305 @@
 """Media and GIF routes with AWS S3 support."""
 from fastapi import APIRouter, HTTPException, Request, Query, UploadFile, File, Form, Response
-from datetime import datetime, timezone
-from pathlib import Path
+from fastapi.responses import JSONResponse
+from typing import Optional
 import uuid
-import httpx
 import logging
-import os
-import boto3
-from botocore.exceptions import ClientError
 
-from services.database import db, GIPHY_API_KEY
+from services.database import db
+from services.giphy import giphy
+from services.storage import (
+    UPLOAD_DIR, S3_BUCKET_NAME, AWS_REGION, s3_client, s3_call, store_upload, UploadTooLarge
+)
+from services.uploads import resumable_uploads, ChunkRejected
+from services.file_responses import file_response, resolve_upload
+from services.direct_uploads import upload_intents, IntentRejected, verify_upload_signature
+from services.images import build_variants
+from services.jobs import job_handler
+from services.media import record_media, queue_variants, PHOTO_TYPES
+from models.schemas import ResumableUploadCreate, UploadIntentCreate
 from utils.helpers import get_current_user
 
 router = APIRouter(tags=["media"])
 logger = logging.getLogger(__name__)
 
-# Local fallback directory
-UPLOAD_DIR = Path(__file__).parent.parent / "uploads"
-UPLOAD_DIR.mkdir(exist_ok=True)
+# Suggested chunk size for resumable uploads: a drop loses at most this much
+RESUMABLE_CHUNK_SIZE = 5 * 1024 * 1024
 
-# AWS S3 Configuration
-AWS_ACCESS_KEY_ID = os.environ.get('AWS_ACCESS_KEY_ID')
-AWS_SECRET_ACCESS_KEY = os.environ.get('AWS_SECRET_ACCESS_KEY')
-S3_BUCKET_NAME = os.environ.get('S3_BUCKET_NAME')
-AWS_REGION = os.environ.get('AWS_REGION', 'us-east-1')
-
-# Initialize S3 client if credentials are available
-s3_client = None
-if AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY and S3_BUCKET_NAME:
-    try:
-        s3_client = boto3.client(
-            's3',
-            aws_access_key_id=AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
-            region_name=AWS_REGION
-        )
-        logger.info(f"S3 client initialized for bucket: {S3_BUCKET_NAME}")
-    except Exception as e:
-        logger.error(f"Failed to initialize S3 client: {e}")
-        s3_client = None
 
-
-def get_s3_url(filename: str) -> str:
-    """Get the public URL for an S3 object."""
-    return f"https://{S3_BUCKET_NAME}.s3.{AWS_REGION}.amazonaws.com/{filename}"
-
-
-async def upload_to_s3(content: bytes, filename: str, content_type: str) -> str:
-    """Upload file to S3 and return the URL."""
-    if not s3_client:
-        raise ValueError("S3 client not configured")
-    
-    try:
-        s3_client.put_object(
-            Bucket=S3_BUCKET_NAME,
-            Key=filename,
-            Body=content,
-            ContentType=content_type
-        )
-        return get_s3_url(filename)
-    except ClientError as e:
-        logger.error(f"S3 upload error: {e}")
-        raise
+# GIF results are the same for everyone, so browsers may reuse them briefly too
+GIF_CACHE_CONTROL = "public, max-age=300"
 
 
 @router.get("/gifs/search")
-async def search_gifs(q: str = Query(..., min_length=1), limit: int = Query(20, ge=1, le=50)):
-    """Search for GIFs using GIPHY API."""
+async def search_gifs(response: Response, q: str = Query(..., min_length=1), limit: int = Query(20, ge=1, le=50)):
+    """Search for GIFs using GIPHY API (cached by normalized query)."""
     try:
-        async with httpx.AsyncClient() as http_client:
-            response = await http_client.get(
-                "https://api.giphy.com/v1/gifs/search",
-                params={"api_key": GIPHY_API_KEY, "q": q, "limit": limit, "rating": "pg-13"},
-                timeout=10.0
-            )
-            response.raise_for_status()
-            data = response.json()
-            
-            gifs = []
-            for item in data.get("data", []):
-                gifs.append({
-                    "id": item["id"],
-                    "title": item.get("title", "GIF"),
-                    "url": item["url"],
-                    "preview_url": item["images"]["fixed_width_small"]["url"],
-                    "original_url": item["images"]["original"]["url"],
-                    "width": item["images"]["fixed_width"]["width"],
-                    "height": item["images"]["fixed_width"]["height"]
-                })
-            return {"gifs": gifs}
+        gifs = await giphy.search(q, limit)
     except Exception as e:
         logger.error(f"GIPHY API error: {e}")
         raise HTTPException(status_code=500, detail="Failed to search GIFs")
+    response.headers["Cache-Control"] = GIF_CACHE_CONTROL
+    return {"gifs": gifs}
 
 
 @router.get("/gifs/trending")
-async def get_trending_gifs(limit: int = Query(20, ge=1, le=50)):
-    """Get trending GIFs."""
+async def get_trending_gifs(response: Response, limit: int = Query(20, ge=1, le=50)):
+    """Get trending GIFs (cached for a few minutes)."""
     try:
-        async with httpx.AsyncClient() as http_client:
-            response = await http_client.get(
-                "https://api.giphy.com/v1/gifs/trending",
-                params={"api_key": GIPHY_API_KEY, "limit": limit, "rating": "pg-13"},
-                timeout=10.0
-            )
-            response.raise_for_status()
-            data = response.json()
-            
-            gifs = []
-            for item in data.get("data", []):
-                gifs.append({
-                    "id": item["id"],
-                    "title": item.get("title", "GIF"),
-                    "url": item["url"],
-                    "preview_url": item["images"]["fixed_width_small"]["url"],
-                    "original_url": item["images"]["original"]["url"]
-                })
-            return {"gifs": gifs}
+        gifs = await giphy.trending(limit)
     except Exception as e:
         logger.error(f"GIPHY trending error: {e}")
         raise HTTPException(status_code=500, detail="Failed to get trending GIFs")
+    response.headers["Cache-Control"] = GIF_CACHE_CONTROL
+    return {"gifs": gifs}
 
 
-@router.post("/media/upload")
-async def upload_media(request: Request, file: UploadFile = File(...), media_type: str = Form("image")):
-    """Upload photo or video for profile or chat. Uses S3 if configured, local storage otherwise."""
-    current_user = await get_current_user(request)
-    
+def check_media_upload(media_type: str, content_type: Optional[str]) -> int:
+    """Validate a chat/profile media upload's type and return its size limit in bytes."""
     allowed_image = ["image/jpeg", "image/png", "image/gif", "image/webp"]
     allowed_video = ["video/mp4", "video/quicktime", "video/webm"]
     
-    if media_type == "image" and file.content_type not in allowed_image:
+    if media_type == "image" and content_type not in allowed_image:
         raise HTTPException(status_code=400, detail="Invalid image format. Allowed: JPEG, PNG, GIF, WebP")
-    if media_type == "video" and file.content_type not in allowed_video:
+    if media_type == "video" and content_type not in allowed_video:
         raise HTTPException(status_code=400, detail="Invalid video format. Allowed: MP4, MOV, WebM")
     
     # Size limits: 10MB for images, 50MB for videos
-    max_size = 50 * 1024 * 1024 if media_type == "video" else 10 * 1024 * 1024
-    content = await file.read()
-    if len(content) > max_size:
+    return 50 * 1024 * 1024 if media_type == "video" else 10 * 1024 * 1024
+
+
+def media_key(user_id: str, filename: Optional[str], media_type: str) -> str:
+    """Unique storage key in the user's folder, keeping the upload's extension."""
+    filename = filename or ""
+    ext = filename.split(".")[-1] if "." in filename else ("jpg" if media_type == "image" else "mp4")
+    return f"{user_id}/{uuid.uuid4()}.{ext}"
+
+
+@job_handler("image_variants")
+async def build_image_variants(job: dict):
+    """Render thumbnails and WebP/JPEG variants off the request path."""
+    media = await db.media.find_one({"media_id": job["payload"]["media_id"]}, {"_id": 0})
+    if not media:
+        return
+    await build_variants(media)
+
+
+@router.post("/media/upload")
+async def upload_media(request: Request, file: UploadFile = File(...), media_type: str = Form("image")):
+    """Upload photo or video for profile or chat. Uses S3 if configured, local storage otherwise."""
+    current_user = await get_current_user(request)
+    max_size = check_media_upload(media_type, file.content_type)
+    filename = media_key(current_user["user_id"], file.filename, media_type)
+    
+    # Streamed to S3 if configured, local storage otherwise (or if S3 fails)
+    try:
+        stored = await store_upload(file, filename, max_size, fallback_to_local=True)
+    except UploadTooLarge:
         raise HTTPException(status_code=400, detail=f"File too large. Max size: {max_size // (1024*1024)}MB")
     
-    # Generate unique filename with user folder
-    ext = file.filename.split(".")[-1] if "." in file.filename else ("jpg" if media_type == "image" else "mp4")
-    filename = f"{current_user['user_id']}/{uuid.uuid4()}.{ext}"
+    media = await record_media(current_user["user_id"], filename, media_type, file.content_type, stored)
+    await queue_variants(media)
+    return media
+
+
+def upload_session_view(session: dict) -> dict:
+    return {
+        "upload_id": session["upload_id"],
+        "offset": session["offset"],
+        "size": session["size"],
+        "status": session["status"],
+        "chunk_size": RESUMABLE_CHUNK_SIZE,
+        "expires_at": session["expires_at"].isoformat(),
+        "media_id": session.get("media_id")
+    }
+
+
+async def get_upload_session(request: Request, upload_id: str) -> dict:
+    current_user = await get_current_user(request)
+    session = await resumable_uploads.get(upload_id, current_user["user_id"])
+    if not session:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return session
+
+
+@router.post("/media/uploads")
+async def create_resumable_upload(request: Request, body: ResumableUploadCreate):
+    """
+    Start a resumable upload of a photo or video.
     
-    # Try S3 upload, fallback to local storage
-    if s3_client:
-        try:
-            url = await upload_to_s3(content, filename, file.content_type)
-            storage_type = "s3"
-            logger.info(f"Uploaded to S3: {filename}")
-        except Exception as e:
-            logger.error(f"S3 upload failed, falling back to local: {e}")
-            # Fallback to local storage
-            local_filename = filename.replace("/", "_")
-            filepath = UPLOAD_DIR / local_filename
-            with open(filepath, "wb") as f:
-                f.write(content)
-            url = f"/api/media/{local_filename}"
-            storage_type = "local"
+    Send the bytes with ``PUT /media/uploads/{upload_id}?offset=N`` in one or
+    more chunks, each starting at the current ``offset``. After a dropped
+    connection, ``GET`` the session for the offset the server has and resend
+    from there. ``POST .../complete`` once ``offset`` equals ``size``.
+    """
+    current_user = await get_current_user(request)
+    max_size = check_media_upload(body.media_type, body.content_type)
+    if body.size > max_size:
+        raise HTTPException(status_code=400, detail=f"File too large. Max size: {max_size // (1024*1024)}MB")
+    
+    session = await resumable_uploads.create(
+        current_user["user_id"], media_key(current_user["user_id"], body.filename, body.media_type),
+        body.content_type, body.media_type, body.size
+    )
+    return upload_session_view(session)
+
+
+@router.get("/media/uploads/{upload_id}")
+async def get_resumable_upload(upload_id: str, request: Request, response: Response):
+    """Current offset of a resumable upload (also in the ``Upload-Offset`` header)."""
+    session = await get_upload_session(request, upload_id)
+    response.headers["Upload-Offset"] = str(session["offset"])
+    return upload_session_view(session)
+
+
+@router.put("/media/uploads/{upload_id}")
+async def put_upload_chunk(upload_id: str, request: Request, response: Response, offset: int = Query(..., ge=0)):
+    """Append the raw request body at ``offset``; 409 with the expected offset if it does not match."""
+    session = await get_upload_session(request, upload_id)
+    try:
+        new_offset = await resumable_uploads.append(session, offset, request.stream())
+    except ChunkRejected as e:
+        return JSONResponse(
+            status_code=409, content={"detail": str(e), "offset": e.offset},
+            headers={"Upload-Offset": str(e.offset)}
+        )
+    response.headers["Upload-Offset"] = str(new_offset)
+    return {"upload_id": upload_id, "offset": new_offset, "size": session["size"]}
+
+
+@router.post("/media/uploads/{upload_id}/complete")
+async def complete_resumable_upload(upload_id: str, request: Request):
+    """Assemble the uploaded chunks and return the media record (same shape as ``/media/upload``)."""
+    session = await get_upload_session(request, upload_id)
+    if session["status"] == "complete":
+        media = await db.media.find_one({"media_id": session["media_id"]}, {"_id": 0})
+        if media:
+            return media
+    
+    async def record(stored: dict) -> dict:
+        return await record_media(session["user_id"], session["key"], session["media_type"], session["content_type"], stored)
+    
+    try:
+        media = await resumable_uploads.complete(session, record)
+    except ChunkRejected as e:
+        return JSONResponse(status_code=409, content={"detail": str(e), "offset": e.offset})
+    await queue_variants(media)
+    return media
+
+
+@router.delete("/media/uploads/{upload_id}")
+async def abort_resumable_upload(upload_id: str, request: Request):
+    """Abandon a resumable upload and discard its chunks."""
+    session = await get_upload_session(request, upload_id)
+    await resumable_uploads.abort(session)
+    return {"message": "Upload cancelled"}
+
+
+MAX_GALLERY_PHOTOS = 6
+
+
+async def gallery_full(user_id: str) -> bool:
+    user = await db.users.find_one(
+        {"user_id": user_id, f"photos.{MAX_GALLERY_PHOTOS - 1}": {"$exists": True}}, {"_id": 1}
+    )
+    return user is not None
+
+
+async def attach_photo(user_id: str, purpose: str, url: str):
+    """Set a stored photo as the profile photo or add it to the gallery."""
+    if purpose == "profile_photo":
+        await db.users.update_one({"user_id": user_id}, {"$set": {"profile_photo": url}})
+    elif purpose == "gallery":
+        result = await db.users.update_one(
+            {"user_id": user_id, f"photos.{MAX_GALLERY_PHOTOS - 1}": {"$exists": False}},
+            {"$push": {"photos": url}}
+        )
+        if result.matched_count == 0:
+            raise HTTPException(status_code=400, detail="Maximum 6 photos allowed. Delete one first.")
+
+
+@router.post("/media/intents")
+async def create_upload_intent(request: Request, body: UploadIntentCreate):
+    """
+    Get a URL to upload a file directly to storage, bypassing the API.
+    
+    ``upload`` is a presigned S3 POST (send ``fields`` plus the file as
+    multipart form data) or a signed local ``PUT`` of the raw bytes. Then call
+    ``POST /media/intents/{intent_id}/complete`` to record the media and, for
+    ``profile_photo``/``gallery`` intents, update the profile.
+    """
+    current_user = await get_current_user(request)
+    user_id = current_user["user_id"]
+    ext = body.filename.split(".")[-1] if "." in body.filename else "jpg"
+    if body.purpose == "media":
+        max_size = check_media_upload(body.media_type, body.content_type)
+        key = media_key(user_id, body.filename, body.media_type)
     else:
-        # Local storage
-        local_filename = filename.replace("/", "_")
-        filepath = UPLOAD_DIR / local_filename
-        with open(filepath, "wb") as f:
-            f.write(content)
-        url = f"/api/media/{local_filename}"
-        storage_type = "local"
+        if body.media_type != "image" or body.content_type not in PHOTO_TYPES:
+            raise HTTPException(status_code=400, detail="Invalid format. Use JPEG, PNG, or WebP")
+        if body.purpose == "gallery":
+            if len(current_user.get("photos", [])) >= MAX_GALLERY_PHOTOS:
+                raise HTTPException(status_code=400, detail="Maximum 6 photos allowed. Delete one first.")
+            max_size, key = 10 * 1024 * 1024, f"gallery/{user_id}/{uuid.uuid4()}.{ext}"
+        else:
+            max_size, key = 5 * 1024 * 1024, f"profiles/{user_id}/avatar_{uuid.uuid4().hex[:8]}.{ext}"
+    if body.size > max_size:
+        raise HTTPException(status_code=400, detail=f"File too large. Max size: {max_size // (1024*1024)}MB")
     
-    # Save media record to database
-    media_doc = {
-        "media_id": f"media_{uuid.uuid4().hex[:12]}",
-        "user_id": current_user["user_id"],
-        "filename": filename,
-        "media_type": media_type,
-        "content_type": file.content_type,
-        "size": len(content),
-        "url": url,
-        "storage_type": storage_type,
-        "created_at": datetime.now(timezone.utc).isoformat()
+    intent = await upload_intents.create(user_id, key, body.content_type, body.media_type, body.purpose, body.size)
+    return {
+        "intent_id": intent["intent_id"],
+        "upload": intent["upload"],
+        "expires_at": intent["expires_at"].isoformat()
     }
-    await db.media.insert_one(media_doc)
-    media_doc.pop("_id", None)
+
+
+@router.put("/media/direct/{intent_id}")
+async def put_direct_upload(intent_id: str, request: Request, expires: int = Query(...), signature: str = Query(...)):
+    """Receive the raw bytes for a local upload intent; authorized by the URL signature."""
+    if not verify_upload_signature(intent_id, expires, signature):
+        raise HTTPException(status_code=403, detail="Invalid or expired upload URL")
+    intent = await upload_intents.get(intent_id)
+    if not intent:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    try:
+        size = await upload_intents.receive_local(intent, request.stream())
+    except IntentRejected as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"intent_id": intent_id, "size": size}
+
+
+@router.post("/media/intents/{intent_id}/complete")
+async def complete_upload_intent(intent_id: str, request: Request):
+    """Record a direct upload once it has reached storage (idempotent)."""
+    current_user = await get_current_user(request)
+    intent = await upload_intents.get(intent_id, current_user["user_id"])
+    if not intent:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    if intent["status"] == "complete":
+        media = await db.media.find_one({"media_id": intent["media_id"]}, {"_id": 0})
+        if media:
+            return media
+    
+    async def record(stored: dict) -> dict:
+        # Checked before recording so a full gallery leaves no media record behind
+        if intent["purpose"] == "gallery" and await gallery_full(intent["user_id"]):
+            raise HTTPException(status_code=400, detail="Maximum 6 photos allowed. Delete one first.")
+        media = await record_media(intent["user_id"], intent["key"], intent["media_type"], intent["content_type"], stored)
+        try:
+            await attach_photo(intent["user_id"], intent["purpose"], media["url"])
+        except HTTPException:
+            # Filled up since the check
+            await db.media.delete_one({"media_id": media["media_id"]})
+            raise
+        return media
     
-    return media_doc
+    try:
+        media = await upload_intents.complete(intent, record)
+    except IntentRejected as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    await queue_variants(media)
+    return media
 
 
 @router.post("/media/profile-photo")
@@ -196,33 +311,27 @@ async def upload_profile_photo(request: Request, file: UploadFile = File(...)):
     if file.content_type not in allowed_types:
         raise HTTPException(status_code=400, detail="Invalid format. Use JPEG, PNG, or WebP")
     
-    content = await file.read()
-    if len(content) > 5 * 1024 * 1024:  # 5MB limit for profile photos
-        raise HTTPException(status_code=400, detail="Profile photo must be under 5MB")
-    
     ext = file.filename.split(".")[-1] if "." in file.filename else "jpg"
     filename = f"profiles/{current_user['user_id']}/avatar_{uuid.uuid4().hex[:8]}.{ext}"
     
-    if s3_client:
-        try:
-            url = await upload_to_s3(content, filename, file.content_type)
-        except Exception as e:
-            logger.error(f"S3 profile upload failed: {e}")
-            raise HTTPException(status_code=500, detail="Failed to upload profile photo")
-    else:
-        local_filename = filename.replace("/", "_")
-        filepath = UPLOAD_DIR / local_filename
-        with open(filepath, "wb") as f:
-            f.write(content)
-        url = f"/api/media/{local_filename}"
+    try:
+        stored = await store_upload(file, filename, 5 * 1024 * 1024)  # 5MB limit for profile photos
+    except UploadTooLarge:
+        raise HTTPException(status_code=400, detail="Profile photo must be under 5MB")
+    except Exception as e:
+        logger.error(f"Profile photo upload failed: {e}")
+        raise HTTPException(status_code=500, detail="Failed to upload profile photo")
+    media = await record_media(current_user["user_id"], filename, "image", file.content_type, stored)
+    url = media["url"]
     
     # Update user profile with new photo
     await db.users.update_one(
         {"user_id": current_user["user_id"]},
         {"$set": {"profile_photo": url}}
     )
+    await queue_variants(media)
     
-    return {"url": url, "message": "Profile photo updated"}
+    return {"url": url, "media_id": media["media_id"], "message": "Profile photo updated"}
 
 
 @router.post("/media/gallery")
@@ -239,33 +348,30 @@ async def add_gallery_photo(request: Request, file: UploadFile = File(...)):
     if file.content_type not in allowed_types:
         raise HTTPException(status_code=400, detail="Invalid format. Use JPEG, PNG, or WebP")
     
-    content = await file.read()
-    if len(content) > 10 * 1024 * 1024:  # 10MB limit
-        raise HTTPException(status_code=400, detail="Photo must be under 10MB")
-    
     ext = file.filename.split(".")[-1] if "." in file.filename else "jpg"
     filename = f"gallery/{current_user['user_id']}/{uuid.uuid4()}.{ext}"
     
-    if s3_client:
-        try:
-            url = await upload_to_s3(content, filename, file.content_type)
-        except Exception as e:
-            logger.error(f"S3 gallery upload failed: {e}")
-            raise HTTPException(status_code=500, detail="Failed to upload photo")
-    else:
-        local_filename = filename.replace("/", "_")
-        filepath = UPLOAD_DIR / local_filename
-        with open(filepath, "wb") as f:
-            f.write(content)
-        url = f"/api/media/{local_filename}"
+    try:
+        stored = await store_upload(file, filename, 10 * 1024 * 1024)  # 10MB limit
+    except UploadTooLarge:
+        raise HTTPException(status_code=400, detail="Photo must be under 10MB")
+    except Exception as e:
+        logger.error(f"Gallery photo upload failed: {e}")
+        raise HTTPException(status_code=500, detail="Failed to upload photo")
+    media = await record_media(current_user["user_id"], filename, "image", file.content_type, stored)
+    url = media["url"]
     
     # Add to user's photos array
     await db.users.update_one(
         {"user_id": current_user["user_id"]},
         {"$push": {"photos": url}}
     )
+    await queue_variants(media)
     
-    return {"url": url, "message": "Photo added to gallery", "total_photos": len(current_photos) + 1}
+    return {
+        "url": url, "media_id": media["media_id"], "message": "Photo added to gallery",
+        "total_photos": len(current_photos) + 1
+    }
 
 
 @router.delete("/media/gallery")
@@ -281,11 +387,12 @@ async def remove_gallery_photo(request: Request, photo_url: str = Query(...)):
     
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Photo not found in gallery")
+    await db.users.update_one(
+        {"user_id": current_user["user_id"], "profile_photo": {"$ne": photo_url}},
+        {"$pull": {"photo_variants": {"url": photo_url}}}
+    )
     
-    # Optionally delete from S3 (commented out to keep backups)
-    # if s3_client and photo_url.startswith(f"https://{S3_BUCKET_NAME}"):
-    #     key = photo_url.split(f"{S3_BUCKET_NAME}.s3.{AWS_REGION}.amazonaws.com/")[-1]
-    #     s3_client.delete_object(Bucket=S3_BUCKET_NAME, Key=key)
+    # The stored object is deleted by the media collector once nothing references it
     
     return {"message": "Photo removed from gallery"}
 
@@ -295,7 +402,7 @@ async def get_media_status():
     """Check if S3 is configured and working."""
     if s3_client:
         try:
-            s3_client.head_bucket(Bucket=S3_BUCKET_NAME)
+            await s3_call("head_bucket", Bucket=S3_BUCKET_NAME)
             return {
                 "s3_configured": True,
                 "bucket": S3_BUCKET_NAME,
@@ -316,15 +423,17 @@ async def get_media_status():
         }
 
 
-@router.get("/media/{filename}")
-async def get_media(filename: str):
-    """Serve locally uploaded media files."""
-    filepath = UPLOAD_DIR / filename
-    if not filepath.exists():
-        raise HTTPException(status_code=404, detail="Media not found")
+@router.api_route("/media/{filename}", methods=["GET", "HEAD"])
+async def get_media(filename: str, request: Request):
+    """
+    Serve locally uploaded media files.
     
-    with open(filepath, "rb") as f:
-        content = f.read()
+    Supports Range requests (video seeking) and ETag/Last-Modified
+    revalidation; names are unique per upload so responses are cached as immutable.
+    """
+    filepath = resolve_upload(UPLOAD_DIR, filename)
+    if filepath is None:
+        raise HTTPException(status_code=404, detail="Media not found")
     
     ext = filename.split(".")[-1].lower()
     content_types = {
@@ -334,4 +443,4 @@ async def get_media(filename: str):
     }
     content_type = content_types.get(ext, "application/octet-stream")
     
-    return Response(content=content, media_type=content_type)
+    return await file_response(request, filepath, content_type)
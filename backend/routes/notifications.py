@@ -2,15 +2,15 @@
 from fastapi import APIRouter, HTTPException, Request
 
 from services.database import db
+from services.notifications import notification_service, NOTIFICATION_DEFAULTS
+from services.counters import unread_counters
 from utils.helpers import get_current_user
 
 router = APIRouter(tags=["notifications"])
 
 
-@router.get("/notifications")
-async def get_notifications(request: Request, unread_only: bool = False):
-    """Get user's notifications."""
-    current_user = await get_current_user(request)
+async def list_notifications(current_user: dict, unread_only: bool = False) -> dict:
+    """Load the user's latest notifications."""
     query = {"user_id": current_user["user_id"]}
     if unread_only:
         query["read"] = False
@@ -18,38 +18,60 @@ async def get_notifications(request: Request, unread_only: bool = False):
     return {"notifications": notifications}
 
 
-@router.post("/notifications/{notification_id}/read")
-async def mark_notification_read(notification_id: str, request: Request):
-    """Mark a notification as read."""
+@router.get("/notifications")
+async def get_notifications(request: Request, unread_only: bool = False):
+    """Get user's notifications."""
     current_user = await get_current_user(request)
+    return await list_notifications(current_user, unread_only)
+
+
+async def mark_read(current_user: dict, notification_id: str) -> dict:
+    """Mark one of the user's notifications as read."""
     result = await db.notifications.update_one(
         {"notification_id": notification_id, "user_id": current_user["user_id"]},
         {"$set": {"read": True}}
     )
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Notification not found")
+    await unread_counters.add_notifications({current_user["user_id"]: -1})
     return {"message": "Marked as read"}
 
 
-@router.post("/notifications/read-all")
-async def mark_all_notifications_read(request: Request):
-    """Mark all notifications as read."""
+@router.post("/notifications/{notification_id}/read")
+async def mark_notification_read(notification_id: str, request: Request):
+    """Mark a notification as read."""
     current_user = await get_current_user(request)
-    await db.notifications.update_many(
+    return await mark_read(current_user, notification_id)
+
+
+async def mark_all_read(current_user: dict) -> dict:
+    """Mark all of the user's notifications as read."""
+    result = await db.notifications.update_many(
         {"user_id": current_user["user_id"], "read": False},
         {"$set": {"read": True}}
     )
+    await unread_counters.add_notifications({current_user["user_id"]: -result.modified_count})
     return {"message": "All notifications marked as read"}
 
 
+@router.post("/notifications/read-all")
+async def mark_all_notifications_read(request: Request):
+    """Mark all notifications as read."""
+    current_user = await get_current_user(request)
+    return await mark_all_read(current_user)
+
+
+async def count_unread(current_user: dict) -> dict:
+    """Read the user's unread badge counts from their maintained counters."""
+    counters = await unread_counters.get(current_user["user_id"])
+    return {"count": max(counters.get("notifications", 0), 0), "chat_unread": max(counters.get("chat_total", 0), 0)}
+
+
 @router.get("/notifications/unread-count")
 async def get_unread_count(request: Request):
     """Get count of unread notifications."""
     current_user = await get_current_user(request)
-    count = await db.notifications.count_documents({
-        "user_id": current_user["user_id"], "read": False
-    })
-    return {"count": count}
+    return await count_unread(current_user)
 
 
 @router.get("/settings/notifications")
@@ -61,18 +83,7 @@ async def get_notification_settings(request: Request):
         {"user_id": current_user["user_id"]}, {"_id": 0, "notification_settings": 1}
     )
     
-    defaults = {
-        "new_matches": True,
-        "new_messages": True,
-        "super_likes": True,
-        "likes_received": True,
-        "profile_views": False,
-        "marketing": False,
-        "sound": True,
-        "vibration": True
-    }
-    
-    return {"settings": user.get("notification_settings", defaults)}
+    return {"settings": user.get("notification_settings", NOTIFICATION_DEFAULTS)}
 
 
 @router.put("/settings/notifications")
@@ -85,5 +96,6 @@ async def update_notification_settings(request: Request):
         {"user_id": current_user["user_id"]},
         {"$set": {"notification_settings": data}}
     )
+    notification_service.invalidate_preferences(current_user["user_id"])
     
     return {"message": "Notification settings updated", "settings": data}
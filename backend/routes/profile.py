@@ -1,16 +1,29 @@
 """Profile management routes."""
 from fastapi import APIRouter, HTTPException, Request
+from typing import Optional
 from datetime import datetime, timezone, timedelta
 import uuid
 
 from services.database import db
-from services.websocket import manager
+from services.cache import nearby_users_cache, invalidate_near
+from services.map_clusters import map_cluster_index
+from services.change_feed import change_feed
+from services.media import store_inline_photo, queue_variants
 from models.schemas import ProfileUpdate, PhotoUpload
-from utils.helpers import get_current_user, calculate_distance, ICEBREAKER_PROMPTS
+from utils.helpers import get_current_user, calculate_distance, create_notification, ICEBREAKER_PROMPTS
 
 router = APIRouter(tags=["profile"])
 
 
+async def sync_map_views(before: dict, after: Optional[dict]):
+    """Refresh nearby-map caches and the cluster grid after a profile write."""
+    invalidate_near(nearby_users_cache, before.get("latitude"), before.get("longitude"))
+    if after:
+        invalidate_near(nearby_users_cache, after.get("latitude"), after.get("longitude"))
+        map_cluster_index.update_user(after)
+        await change_feed.publish("user", [after["user_id"]])
+
+
 @router.get("/profile")
 async def get_profile(request: Request):
     """Get current user profile."""
@@ -26,6 +39,8 @@ async def update_profile(request: Request, profile_data: ProfileUpdate):
     if update_data:
         await db.users.update_one({"user_id": user["user_id"]}, {"$set": update_data})
     updated_user = await db.users.find_one({"user_id": user["user_id"]}, {"_id": 0})
+    if update_data:
+        await sync_map_views(user, updated_user)
     return updated_user
 
 
@@ -37,22 +52,30 @@ async def complete_onboarding(request: Request, profile_data: ProfileUpdate):
     update_data["onboarding_complete"] = True
     await db.users.update_one({"user_id": user["user_id"]}, {"$set": update_data})
     updated_user = await db.users.find_one({"user_id": user["user_id"]}, {"_id": 0})
+    await sync_map_views(user, updated_user)
     return updated_user
 
 
 @router.post("/profile/photo")
 async def upload_photo(request: Request, photo: PhotoUpload):
-    """Upload a profile photo."""
+    """
+    Upload a profile photo sent as a base64 data URI.
+    
+    The image goes to media storage; only its URL is kept on the user.
+    """
     user = await get_current_user(request)
-    photos = user.get("photos", [])
-    photos.append(photo.photo_data)
+    try:
+        media = await store_inline_photo(user["user_id"], photo.photo_data)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    url = media["url"]
     
-    update_data = {"photos": photos}
+    update = {"$push": {"photos": url}}
     if photo.is_primary or not user.get("profile_photo"):
-        update_data["profile_photo"] = photo.photo_data
-    
-    await db.users.update_one({"user_id": user["user_id"]}, {"$set": update_data})
-    return {"message": "Photo uploaded successfully", "photo_count": len(photos)}
+        update["$set"] = {"profile_photo": url}
+    await db.users.update_one({"user_id": user["user_id"]}, update)
+    await queue_variants(media)
+    return {"message": "Photo uploaded successfully", "url": url, "photo_count": len(user.get("photos", [])) + 1}
 
 
 @router.delete("/profile/photo/{photo_index}")
@@ -67,6 +90,8 @@ async def delete_photo(photo_index: int, request: Request):
     update_data = {"photos": photos}
     if user.get("profile_photo") == deleted_photo:
         update_data["profile_photo"] = photos[0] if photos else None
+    in_use = set(photos) | {update_data.get("profile_photo", user.get("profile_photo"))}
+    update_data["photo_variants"] = [v for v in user.get("photo_variants", []) if v["url"] in in_use]
     
     await db.users.update_one({"user_id": user["user_id"]}, {"$set": update_data})
     return {"message": "Photo deleted"}
@@ -159,22 +184,16 @@ async def record_profile_view(user_id: str, request: Request):
     
     await db.profile_views.insert_one(view)
     
-    viewed_user = await db.users.find_one({"user_id": user_id}, {"_id": 0, "notification_settings": 1})
-    if viewed_user and viewed_user.get("notification_settings", {}).get("profile_views", False):
-        notification = {
-            "notification_id": f"notif_{uuid.uuid4().hex[:12]}",
-            "user_id": user_id,
-            "type": "profile_view",
-            "content": f"{current_user['name']} viewed your profile",
-            "from_user_id": current_user["user_id"],
-            "from_user_name": current_user["name"],
-            "from_user_photo": current_user.get("profile_photo"),
-            "read": False,
-            "created_at": datetime.now(timezone.utc).isoformat()
-        }
-        await db.notifications.insert_one(notification)
-        notification.pop("_id", None)
-        await manager.send_personal_message({"type": "notification", "notification": notification}, user_id)
+    # Dropped by the notification service unless the viewed user opted into profile_views
+    await create_notification(
+        user_id=user_id,
+        notif_type="profile_view",
+        title="Profile View",
+        message=f"{current_user['name']} viewed your profile",
+        data={"viewer_id": current_user["user_id"]},
+        from_user=current_user,
+        collapse_key=current_user["user_id"]
+    )
     
     return {"message": "View recorded"}
 
@@ -0,0 +1,151 @@
+"""Request/response RPC over the /ws/{user_id} socket.
+
+A connected client sends ``{"type": "rpc", "id": "<client id>", "op": "chat.send", "payload": {...}}``
+and gets back ``{"type": "rpc_result", "id": "<client id>", "ok": true, "data": {...}}`` or
+``{"type": "rpc_result", "id": "<client id>", "ok": false, "error": {"status": 403, "detail": "..."}}``.
+
+Operations call the same handlers as the HTTP routes in ``routes/discovery.py``,
+``routes/chat.py`` and ``routes/notifications.py``, using the principal that was
+authenticated when the socket connected and is re-checked periodically (see
+``RpcConnection``).
+"""
+from fastapi import HTTPException, WebSocket
+from pydantic import ValidationError
+from typing import Awaitable, Callable, Dict
+import logging
+
+from models.schemas import ChatMessageCreate
+from services.websocket import RpcConnection
+from routes.chat import (
+    list_conversations, fetch_chat_messages, deliver_message, mark_conversation_read,
+    relay_typing, deliver_media_message, apply_reaction, clear_reaction
+)
+from routes.discovery import perform_match_action
+from routes.notifications import list_notifications, mark_read, mark_all_read, count_unread
+
+logger = logging.getLogger(__name__)
+
+RpcHandler = Callable[[dict, dict], Awaitable[dict]]
+
+
+def _require(payload: dict, *keys: str) -> list:
+    """Return the requested payload fields, raising 400 if any are missing."""
+    missing = [k for k in keys if payload.get(k) in (None, "")]
+    if missing:
+        raise HTTPException(status_code=400, detail=f"Missing payload fields: {', '.join(missing)}")
+    return [payload[k] for k in keys]
+
+
+async def _discover_action(user: dict, payload: dict) -> dict:
+    target_user_id, action = _require(payload, "target_user_id", "action")
+    return await perform_match_action(user, target_user_id, action)
+
+
+async def _chat_conversations(user: dict, payload: dict) -> dict:
+    return await list_conversations(user)
+
+
+async def _chat_messages(user: dict, payload: dict) -> dict:
+    (other_id,) = _require(payload, "user_id")
+    return await fetch_chat_messages(user, other_id)
+
+
+async def _chat_send(user: dict, payload: dict) -> dict:
+    (other_id,) = _require(payload, "user_id")
+    message = ChatMessageCreate(recipient_id=other_id, **{k: v for k, v in payload.items() if k not in ("user_id", "recipient_id")})
+    return await deliver_message(user, other_id, message)
+
+
+async def _chat_send_media(user: dict, payload: dict) -> dict:
+    (other_id,) = _require(payload, "user_id")
+    return await deliver_media_message(user, other_id, payload)
+
+
+async def _chat_read(user: dict, payload: dict) -> dict:
+    (other_id,) = _require(payload, "user_id")
+    return await mark_conversation_read(user, other_id)
+
+
+async def _chat_typing(user: dict, payload: dict) -> dict:
+    (other_id,) = _require(payload, "user_id")
+    return await relay_typing(user, other_id, bool(payload.get("is_typing", True)))
+
+
+async def _message_react(user: dict, payload: dict) -> dict:
+    (message_id,) = _require(payload, "message_id")
+    return await apply_reaction(user, message_id, payload.get("emoji"))
+
+
+async def _message_unreact(user: dict, payload: dict) -> dict:
+    (message_id,) = _require(payload, "message_id")
+    return await clear_reaction(user, message_id)
+
+
+async def _notifications_list(user: dict, payload: dict) -> dict:
+    return await list_notifications(user, bool(payload.get("unread_only", False)))
+
+
+async def _notifications_read(user: dict, payload: dict) -> dict:
+    (notification_id,) = _require(payload, "notification_id")
+    return await mark_read(user, notification_id)
+
+
+async def _notifications_read_all(user: dict, payload: dict) -> dict:
+    return await mark_all_read(user)
+
+
+async def _notifications_unread_count(user: dict, payload: dict) -> dict:
+    return await count_unread(user)
+
+
+RPC_OPERATIONS: Dict[str, RpcHandler] = {
+    "discover.action": _discover_action,
+    "chat.conversations": _chat_conversations,
+    "chat.messages": _chat_messages,
+    "chat.send": _chat_send,
+    "chat.send_media": _chat_send_media,
+    "chat.read": _chat_read,
+    "chat.typing": _chat_typing,
+    "messages.react": _message_react,
+    "messages.unreact": _message_unreact,
+    "notifications.list": _notifications_list,
+    "notifications.read": _notifications_read,
+    "notifications.read_all": _notifications_read_all,
+    "notifications.unread_count": _notifications_unread_count,
+}
+
+
+async def handle_rpc_frame(websocket: WebSocket, connection: RpcConnection, frame: dict):
+    """Run one RPC frame and send the correlated reply on the same socket."""
+    request_id = frame.get("id")
+    reply = {"type": "rpc_result", "id": request_id}
+    
+    handler = RPC_OPERATIONS.get(frame.get("op"))
+    payload = frame.get("payload") or {}
+    try:
+        principal = await connection.current_principal()
+    except Exception as e:
+        logger.error(f"RPC session check failed: {e}")
+        principal = None
+    
+    if principal is None:
+        reply.update(ok=False, error={"status": 401, "detail": "Not authenticated"})
+    elif handler is None:
+        reply.update(ok=False, error={"status": 404, "detail": f"Unknown operation: {frame.get('op')}"})
+    elif not isinstance(payload, dict):
+        reply.update(ok=False, error={"status": 400, "detail": "Payload must be an object"})
+    else:
+        try:
+            reply.update(ok=True, data=await handler(principal, payload))
+        except HTTPException as e:
+            reply.update(ok=False, error={"status": e.status_code, "detail": e.detail})
+        except ValidationError as e:
+            reply.update(ok=False, error={"status": 422, "detail": e.errors(include_url=False, include_context=False)})
+        except Exception as e:
+            logger.exception(f"RPC {frame.get('op')} failed: {e}")
+            reply.update(ok=False, error={"status": 500, "detail": "Internal error"})
+    
+    try:
+        await websocket.send_json(reply)
+    except Exception:
+        pass
@@ -1,15 +1,44 @@
 """Travel schedule routes."""
 from fastapi import APIRouter, HTTPException, Request, Query
 from datetime import datetime, timezone, timedelta
-from typing import Optional
+from typing import Optional, Dict, List
+import hashlib
+import json
 import uuid
+import logging
 
 from services.database import db
-from services.websocket import manager
+from services.overlap_index import overlap_index, overlap_pairs
+from services.loaders import ProfileLoader, get_profile_loader, card_photos, PROFILE_CARD_PROJECTION
+from services.jobs import job_queue, job_handler
+from services.trip_matches import trip_match_cache
+from services.notifications import notification_service
+from services.geocoding import geocoder
+from services.recurrence import series_end_date, validate_recurrence
+from services.corridors import build_route
+from services.cache import passing_through_cache, nearby_users_cache, invalidate_near
+from services.map_clusters import map_cluster_index
+from services.change_feed import change_feed
+from services.rosters import parse_ics, parse_json_roster, validate_entry, MAX_ROSTER_ENTRIES
 from models.schemas import TravelSchedule, TravelScheduleCreate
 from utils.helpers import get_current_user, calculate_distance
 
 router = APIRouter(prefix="/schedules", tags=["schedules"])
+logger = logging.getLogger(__name__)
+
+MAX_ROSTER_BYTES = 1024 * 1024
+# Distinct destinations each roster_geocode job looks up, so a job stays well inside its lease
+ROSTER_GEOCODE_BATCH = 20
+
+
+def invalidate_discovery_candidates(schedules: List[dict], owner: dict):
+    """Drop shared discovery candidate sets that a schedule write could change."""
+    for schedule in schedules:
+        invalidate_near(passing_through_cache, schedule.get("latitude"), schedule.get("longitude"))
+        # Maps around the trip, where the owner may already be checked in while traveling
+        invalidate_near(nearby_users_cache, schedule.get("latitude"), schedule.get("longitude"))
+    # The owner's hot-traveler flag on the nearby map at home
+    invalidate_near(nearby_users_cache, owner.get("latitude"), owner.get("longitude"))
 
 
 @router.get("")
@@ -26,84 +55,319 @@ async def get_my_schedules(request: Request):
 async def create_schedule(request: Request, schedule_data: TravelScheduleCreate):
     """Create a new travel schedule."""
     current_user = await get_current_user(request)
-    schedule = TravelSchedule(user_id=current_user["user_id"], **schedule_data.model_dump())
+    data = schedule_data.model_dump()
+    waypoints, polyline = data.pop("waypoints"), data.pop("polyline")
+    route_fields = {}
+    if waypoints or polyline:
+        if data["recurrence"]:
+            raise HTTPException(status_code=400, detail="A routed trip can't also recur")
+        try:
+            route, eta_anchors = build_route(waypoints, polyline)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        route_fields = {
+            "route": route,
+            "route_eta_anchors": {str(i): eta for i, eta in eta_anchors.items()} or None
+        }
+        data["has_route"] = True
+        # The route's end is the destination unless one was given
+        if data["latitude"] is None or data["longitude"] is None:
+            data["latitude"], data["longitude"] = route[-1]
+    schedule = TravelSchedule(user_id=current_user["user_id"], **data)
     doc = schedule.model_dump()
     doc["created_at"] = doc["created_at"].isoformat()
+    if doc["recurrence"]:
+        # Stored once as a rule; the series end lets date-range queries find it without expanding
+        try:
+            validate_recurrence(doc)
+            doc["series_end_date"] = series_end_date(doc)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    if route_fields:
+        # Written first so a worker reloading the schedule always finds its route
+        await db.schedule_routes.insert_one({"schedule_id": doc["schedule_id"], **route_fields})
     await db.schedules.insert_one(doc)
     doc.pop("_id", None)
+    overlap_index.add({**doc, **route_fields})
+    await change_feed.publish("schedule", [doc["schedule_id"]], {"user_id": current_user["user_id"]})
+    await trip_match_cache.invalidate_for(doc)
+    invalidate_discovery_candidates([doc], current_user)
+    await map_cluster_index.refresh_hot(current_user["user_id"])
     
-    # Find overlapping travelers and send notifications
+    # Overlapping travelers are notified by the background job queue
     if doc.get("latitude") and doc.get("longitude"):
-        await notify_overlapping_travelers(current_user, doc)
+        await job_queue.enqueue(
+            "trip_overlap", {"schedule_id": doc["schedule_id"]}, job_id=f"trip_overlap_{doc['schedule_id']}"
+        )
     
     return doc
 
 
-async def notify_overlapping_travelers(current_user: dict, new_schedule: dict):
+def job_notification_id(job_id: str, user_id: str) -> str:
+    """Deterministic notification id for one recipient of one job."""
+    return f"notif_{hashlib.sha1(f'{job_id}:{user_id}'.encode()).hexdigest()[:12]}"
+
+
+@job_handler("trip_overlap")
+async def notify_overlapping_travelers(job: dict):
     """Notify users who have overlapping schedules at the same destination."""
-    # Find schedules that overlap in time and location
-    overlapping = await db.schedules.find({
-        "user_id": {"$ne": current_user["user_id"]},
-        "latitude": {"$exists": True, "$ne": None},
-        "start_date": {"$lte": new_schedule["end_date"]},
-        "end_date": {"$gte": new_schedule["start_date"]}
-    }, {"_id": 0}).to_list(100)
+    new_schedule = await db.schedules.find_one({"schedule_id": job["payload"]["schedule_id"]}, {"_id": 0})
+    if not new_schedule or new_schedule.get("latitude") is None:
+        return  # Deleted before the job ran
+    traveler = await ProfileLoader().load(new_schedule["user_id"])
+    if not traveler:
+        return
+    await change_feed.catch_up()
+    
+    # Schedules within 50 miles that overlap in time (any occurrence, for a recurring trip)
+    overlapping = await overlap_index.query_schedule(new_schedule, 50, exclude_user_id=traveler["user_id"])
+    recipients = dict.fromkeys(sched["user_id"] for sched, _ in overlapping)
+    
+    # Ids derived from the job make a retried run skip notifications it already wrote
+    docs = [
+        notification_service.build(
+            user_id=user_id,
+            notif_type="trip_overlap",
+            title="Trip Match! 🎉",
+            message=f"{traveler['name']} is planning to visit {new_schedule['destination']} while you're there!",
+            data={
+                "schedule_id": new_schedule["schedule_id"],
+                "destination": new_schedule["destination"],
+                "start_date": new_schedule["start_date"],
+                "end_date": new_schedule["end_date"]
+            },
+            from_user=traveler,
+            notification_id=job_notification_id(job["job_id"], user_id)
+        )
+        for user_id in recipients
+    ]
+    written = await notification_service.deliver(docs)
+    await notification_service.push(written)
+
+
+async def read_roster(request: Request) -> List[dict]:
+    """Read roster entries from an ICS/JSON upload (multipart ``file``) or a raw request body."""
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("file")
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(status_code=400, detail="Upload the roster as 'file'")
+        raw = await upload.read(MAX_ROSTER_BYTES + 1)
+    else:
+        # Counted as it streams in, so an oversized body is never buffered whole
+        raw = bytearray()
+        async for chunk in request.stream():
+            raw.extend(chunk)
+            if len(raw) > MAX_ROSTER_BYTES:
+                break
+        raw = bytes(raw)
+    if len(raw) > MAX_ROSTER_BYTES:
+        raise HTTPException(status_code=413, detail="Roster file too large")
+    
+    text = raw.decode("utf-8-sig", errors="replace")
+    try:
+        if "BEGIN:VCALENDAR" in text[:1024].upper():
+            entries = parse_ics(text)
+        else:
+            entries = parse_json_roster(json.loads(text))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Could not read roster: {e}")
     
-    notified_users = set()
+    if not entries:
+        raise HTTPException(status_code=400, detail="Roster contains no schedules")
+    if len(entries) > MAX_ROSTER_ENTRIES:
+        raise HTTPException(status_code=400, detail=f"Roster has more than {MAX_ROSTER_ENTRIES} schedules")
+    return entries
+
+
+@router.post("/import")
+async def import_schedules(request: Request):
+    """
+    Bulk-import a crew roster or calendar as travel schedules.
+    
+    Accepts an ICS calendar or a JSON roster (``{"schedules": [...]}``), either as
+    the request body or a multipart ``file``. Invalid entries are reported and
+    skipped. Destinations without coordinates are geocoded in the background
+    (``locating`` counts them); their schedules are saved now and gain
+    coordinates once located. Travelers whose trips overlap the imported ones
+    then get a single digest notification each.
+    """
+    current_user = await get_current_user(request)
+    entries = await read_roster(request)
+    today = datetime.now(timezone.utc).date()
+    
+    valid, errors = [], []
+    for i, entry in enumerate(entries):
+        try:
+            valid.append((i, validate_entry(entry, today)))
+        except ValueError as e:
+            errors.append({"index": i, "destination": entry.get("destination"), "detail": str(e)})
+    
+    import_id = f"import_{uuid.uuid4().hex[:12]}"
+    docs = []
+    for i, entry in valid:
+        doc = TravelSchedule(user_id=current_user["user_id"], **entry).model_dump()
+        doc["created_at"] = doc["created_at"].isoformat()
+        doc["import_id"] = import_id
+        docs.append(doc)
+    locating = sum(1 for doc in docs if doc["latitude"] is None)
+    
+    if docs:
+        await db.schedules.insert_many(docs)
+        for doc in docs:
+            doc.pop("_id", None)
+        await index_imported(docs, current_user)
+        payload = {"import_id": import_id, "user_id": current_user["user_id"]}
+        if locating:
+            # Nominatim allows one lookup a second, so the digest waits until every destination has been tried
+            await job_queue.enqueue("roster_geocode", {**payload, "batch": 0, "unlocated": []},
+                                    job_id=f"roster_geocode_{import_id}_0")
+        else:
+            await job_queue.enqueue("roster_overlap_digest", payload, job_id=f"roster_overlap_digest_{import_id}")
+    
+    return {
+        "import_id": import_id,
+        "imported": len(docs),
+        "locating": locating,
+        "schedules": docs,
+        "errors": sorted(errors, key=lambda e: e["index"])
+    }
+
+
+async def index_imported(docs: List[dict], owner: dict):
+    """Make imported schedules visible to matching, here and on the other workers."""
+    for doc in docs:
+        overlap_index.add(doc)
+    await change_feed.publish("schedule", [doc["schedule_id"] for doc in docs], {"user_id": owner["user_id"]})
+    await trip_match_cache.invalidate_many(docs)
+    invalidate_discovery_candidates(docs, owner)
+    await map_cluster_index.refresh_hot(owner["user_id"])
+
+
+@job_handler("roster_geocode")
+async def locate_roster_destinations(job: dict):
+    """Geocode the next batch of an import's unlocated destinations, then queue the rest or the digest."""
+    payload = job["payload"]
+    import_id = payload["import_id"]
+    unlocated = set(payload["unlocated"])
+    pending = await db.schedules.distinct("destination", {"import_id": import_id, "latitude": None})
+    destinations = sorted(set(pending) - unlocated)
     
-    for sched in overlapping:
-        if not sched.get("latitude"):
+    batch, remaining = destinations[:ROSTER_GEOCODE_BATCH], destinations[ROSTER_GEOCODE_BATCH:]
+    for destination in batch:
+        try:
+            place = await geocoder.geocode(destination)
+        except Exception as e:
+            logger.error(f"Geocoding {destination!r} failed: {e}")
+            place = None
+        if not place:
+            unlocated.add(destination)
             continue
-        
-        # Check if destinations are within 50 miles
-        distance = calculate_distance(
-            new_schedule["latitude"], new_schedule["longitude"],
-            sched["latitude"], sched["longitude"]
+        await db.schedules.update_many(
+            {"import_id": import_id, "destination": destination, "latitude": None},
+            {"$set": {"latitude": place["latitude"], "longitude": place["longitude"]}}
         )
-        
-        if distance <= 50 and sched["user_id"] not in notified_users:
-            notified_users.add(sched["user_id"])
-            
-            # Create notification
-            notification = {
-                "notification_id": f"notif_{uuid.uuid4().hex[:12]}",
-                "user_id": sched["user_id"],
-                "type": "trip_overlap",
-                "title": "Trip Match! 🎉",
-                "content": f"{current_user['name']} is planning to visit {new_schedule['destination']} while you're there!",
-                "from_user_id": current_user["user_id"],
-                "from_user_name": current_user["name"],
-                "from_user_photo": current_user.get("profile_photo"),
-                "trip_data": {
-                    "destination": new_schedule["destination"],
-                    "start_date": new_schedule["start_date"],
-                    "end_date": new_schedule["end_date"]
-                },
-                "read": False,
-                "created_at": datetime.now(timezone.utc).isoformat()
-            }
-            await db.notifications.insert_one(notification)
-            notification.pop("_id", None)
-            
-            # Send real-time notification
-            await manager.send_personal_message({
-                "type": "notification",
-                "notification": notification
-            }, sched["user_id"])
+    
+    located = await db.schedules.find(
+        {"import_id": import_id, "destination": {"$in": batch}, "latitude": {"$ne": None}}, {"_id": 0}
+    ).to_list(None)
+    if located:
+        owner = await db.users.find_one(
+            {"user_id": payload["user_id"]}, {"_id": 0, "user_id": 1, "latitude": 1, "longitude": 1}
+        )
+        await index_imported(located, owner or {"user_id": payload["user_id"]})
+    if unlocated:
+        logger.info(f"Import {import_id}: could not locate {len(unlocated)} destinations")
+    
+    base = {"import_id": import_id, "user_id": payload["user_id"]}
+    if remaining:
+        batch_number = payload["batch"] + 1
+        await job_queue.enqueue("roster_geocode", {**base, "batch": batch_number, "unlocated": sorted(unlocated)},
+                                job_id=f"roster_geocode_{import_id}_{batch_number}")
+    else:
+        await job_queue.enqueue("roster_overlap_digest", base, job_id=f"roster_overlap_digest_{import_id}")
+
+
+@job_handler("roster_overlap_digest")
+async def notify_roster_overlaps(job: dict):
+    """Send each traveler overlapping an imported roster one digest notification."""
+    payload = job["payload"]
+    imported = await db.schedules.find(
+        {"import_id": payload["import_id"], "latitude": {"$ne": None}}, {"_id": 0}
+    ).to_list(None)
+    traveler = await ProfileLoader().load(payload["user_id"])
+    if not imported or not traveler:
+        return
+    
+    # One vectorized pass of every imported trip against every schedule in the roster's date span
+    await overlap_index.ensure_loaded()
+    await change_feed.catch_up()
+    candidates = [
+        s for s in overlap_index.schedules_between(
+            min(s["start_date"] for s in imported), max(s["end_date"] for s in imported)
+        )
+        if s["user_id"] != traveler["user_id"]
+    ]
+    overlaps: Dict[str, Dict[str, dict]] = {}
+    for i, j, _ in overlap_pairs(imported, candidates, 50):
+        overlaps.setdefault(candidates[j]["user_id"], {})[imported[i]["schedule_id"]] = imported[i]
+    
+    docs = []
+    for user_id, trips_by_id in overlaps.items():
+        trips = sorted(trips_by_id.values(), key=lambda s: s["start_date"])
+        destinations = list(dict.fromkeys(s["destination"] for s in trips))
+        listed = ", ".join(destinations[:3]) + (" and more" if len(destinations) > 3 else "")
+        docs.append(notification_service.build(
+            user_id=user_id,
+            notif_type="trip_overlap",
+            title="Trip Matches! 🎉",
+            message=f"{traveler['name']} will be near you on {len(trips)} upcoming trip{'s' if len(trips) != 1 else ''}: {listed}",
+            data={
+                "schedule_id": trips[0]["schedule_id"],
+                "schedule_ids": [s["schedule_id"] for s in trips],
+                "destination": trips[0]["destination"],
+                "destinations": destinations,
+                "start_date": trips[0]["start_date"],
+                "end_date": trips[-1]["end_date"],
+                "count": len(trips)
+            },
+            from_user=traveler,
+            notification_id=job_notification_id(job["job_id"], user_id)
+        ))
+    written = await notification_service.deliver(docs)
+    await notification_service.push(written)
 
 
 @router.delete("/{schedule_id}")
 async def delete_schedule(schedule_id: str, request: Request):
     """Delete a travel schedule."""
     current_user = await get_current_user(request)
-    result = await db.schedules.delete_one({
+    deleted = await db.schedules.find_one_and_delete({
         "schedule_id": schedule_id, "user_id": current_user["user_id"]
-    })
-    if result.deleted_count == 0:
+    }, projection={"_id": 0})
+    if deleted is None:
         raise HTTPException(status_code=404, detail="Schedule not found")
+    if deleted.get("has_route"):
+        await db.schedule_routes.delete_one({"schedule_id": schedule_id})
+    overlap_index.remove(schedule_id)
+    await change_feed.publish("schedule", [schedule_id], {"user_id": current_user["user_id"]})
+    await trip_match_cache.invalidate_for(deleted)
+    invalidate_discovery_candidates([deleted], current_user)
+    await map_cluster_index.refresh_hot(current_user["user_id"])
     return {"message": "Schedule deleted"}
 
 
+@router.get("/{schedule_id}/route")
+async def get_schedule_route(schedule_id: str, request: Request):
+    """Get a routed schedule's vertices, which schedule listings leave out."""
+    await get_current_user(request)
+    route = await db.schedule_routes.find_one({"schedule_id": schedule_id}, {"_id": 0})
+    if route is None:
+        raise HTTPException(status_code=404, detail="Route not found")
+    return route
+
+
 @router.get("/user/{user_id}")
 async def get_user_schedules(user_id: str, request: Request):
     """Get another user's public schedules."""
@@ -125,26 +389,24 @@ async def get_nearby_schedules(request: Request, days_ahead: int = 30):
     today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
     future = (datetime.now(timezone.utc) + timedelta(days=days_ahead)).strftime("%Y-%m-%d")
     
-    schedules = await db.schedules.find({
-        "user_id": {"$ne": current_user["user_id"]},
-        "start_date": {"$gte": today, "$lte": future},
-        "latitude": {"$exists": True}
-    }, {"_id": 0}).to_list(100)
-    
-    nearby = []
-    for sched in schedules:
-        if sched.get("latitude"):
-            distance = calculate_distance(
-                current_user["latitude"], current_user["longitude"],
-                sched["latitude"], sched["longitude"]
-            )
-            if distance <= 100:
+    schedules = await overlap_index.query(
+        current_user["latitude"], current_user["longitude"], 100, today, future,
+        exclude_user_id=current_user["user_id"]
+    )
+    
+    nearby = {}
+    # Only trips that start in the window, not ones already underway; a series shows its next occurrence
+    for sched, distance in schedules:
+        if today <= sched["start_date"] <= future:
+            seen = nearby.get(sched["schedule_id"])
+            if seen is None or sched["start_date"] < seen["start_date"]:
                 sched["distance"] = distance
-                user = await db.users.find_one(
-                    {"user_id": sched["user_id"]}, {"_id": 0, "password_hash": 0}
-                )
-                sched["user"] = user
-                nearby.append(sched)
+                nearby[sched["schedule_id"]] = sched
+    nearby = list(nearby.values())
+    
+    users = await get_profile_loader(request).load_many(s["user_id"] for s in nearby)
+    for sched, user in zip(nearby, users):
+        sched["user"] = user
     
     return {"schedules": nearby}
 
@@ -175,11 +437,11 @@ async def plan_trip_preview(request: Request):
         "user_id": {"$ne": current_user["user_id"]},
         "latitude": {"$exists": True, "$ne": None},
         "onboarding_complete": True
-    }, {"_id": 0, "password_hash": 0}).to_list(200)
+    }, {**PROFILE_CARD_PROJECTION, "latitude": 1, "longitude": 1}).to_list(200)
     
     # Filter by distance
     locals_nearby = []
-    for user in locals_at_destination:
+    for user in map(card_photos, locals_at_destination):
         if user.get("latitude"):
             distance = calculate_distance(latitude, longitude, user["latitude"], user["longitude"])
             if distance <= radius_miles:
@@ -189,51 +451,42 @@ async def plan_trip_preview(request: Request):
                 locals_nearby.append(user)
     
     # Find travelers with overlapping schedules at that destination
-    overlapping_schedules = await db.schedules.find({
-        "user_id": {"$ne": current_user["user_id"]},
-        "latitude": {"$exists": True, "$ne": None},
-        "start_date": {"$lte": end_date},
-        "end_date": {"$gte": start_date}
-    }, {"_id": 0}).to_list(200)
+    overlapping_schedules = await overlap_index.query(
+        latitude, longitude, radius_miles, start_date, end_date,
+        exclude_user_id=current_user["user_id"]
+    )
     
-    travelers_there = []
-    traveler_ids = set()
+    nearest_by_traveler = {}
+    for sched, distance in overlapping_schedules:
+        nearest_by_traveler.setdefault(sched["user_id"], (sched, distance))
+    
+    loader = get_profile_loader(request)
+    users = await loader.load_many(nearest_by_traveler)
     
-    for sched in overlapping_schedules:
-        if not sched.get("latitude"):
+    travelers_there = []
+    for user, (sched, distance) in zip(users, nearest_by_traveler.values()):
+        if not user:
             continue
         
-        distance = calculate_distance(latitude, longitude, sched["latitude"], sched["longitude"])
+        # Determine overlap type
+        sched_start = sched["start_date"]
+        sched_end = sched["end_date"]
         
-        if distance <= radius_miles and sched["user_id"] not in traveler_ids:
-            traveler_ids.add(sched["user_id"])
-            
-            # Determine overlap type
-            sched_start = sched["start_date"]
-            sched_end = sched["end_date"]
-            
-            if sched_start <= start_date and sched_end >= end_date:
-                overlap_text = "There your entire trip"
-            elif sched_start <= start_date:
-                overlap_text = f"There until {sched_end}"
-            elif sched_end >= end_date:
-                overlap_text = f"Arriving {sched_start}"
-            else:
-                overlap_text = f"{sched_start} to {sched_end}"
-            
-            # Get user profile
-            user = await db.users.find_one(
-                {"user_id": sched["user_id"]},
-                {"_id": 0, "password_hash": 0}
-            )
-            
-            if user:
-                user["match_type"] = "traveler"
-                user["match_reason"] = f"Also visiting: {overlap_text}"
-                user["trip_destination"] = sched.get("destination")
-                user["trip_dates"] = f"{sched_start} - {sched_end}"
-                user["distance_miles"] = round(distance, 1)
-                travelers_there.append(user)
+        if sched_start <= start_date and sched_end >= end_date:
+            overlap_text = "There your entire trip"
+        elif sched_start <= start_date:
+            overlap_text = f"There until {sched_end}"
+        elif sched_end >= end_date:
+            overlap_text = f"Arriving {sched_start}"
+        else:
+            overlap_text = f"{sched_start} to {sched_end}"
+        
+        user["match_type"] = "traveler"
+        user["match_reason"] = f"Also visiting: {overlap_text}"
+        user["trip_destination"] = sched.get("destination")
+        user["trip_dates"] = f"{sched_start} - {sched_end}"
+        user["distance_miles"] = round(distance, 1)
+        travelers_there.append(user)
     
     # Remove duplicates (users who are both local and traveling)
     local_ids = set(u["user_id"] for u in locals_nearby)
@@ -267,7 +520,7 @@ async def get_trip_matches(request: Request):
     # Get user's upcoming schedules
     my_schedules = await db.schedules.find({
         "user_id": current_user["user_id"],
-        "end_date": {"$gte": today},
+        "$or": [{"end_date": {"$gte": today}}, {"series_end_date": {"$gte": today}}],
         "latitude": {"$exists": True, "$ne": None}
     }, {"_id": 0}).sort("start_date", 1).to_list(20)
     
@@ -278,45 +531,28 @@ async def get_trip_matches(request: Request):
             "message": "Add a trip with location to see potential meetups"
         }
     
+    # Materialized match lists, computed only for trips whose list was invalidated
+    match_rows = await trip_match_cache.get_many(my_schedules)
+    
+    # One batched profile lookup covering every trip
+    loader = get_profile_loader(request)
+    all_ids = {row["user_id"] for rows in match_rows.values() for row in rows}
+    profiles = dict(zip(all_ids, await loader.load_many(all_ids)))
+    
     trips_with_matches = []
     total_matches = 0
     
     for schedule in my_schedules:
-        # Find overlapping schedules
-        overlapping = await db.schedules.find({
-            "user_id": {"$ne": current_user["user_id"]},
-            "latitude": {"$exists": True, "$ne": None},
-            "start_date": {"$lte": schedule["end_date"]},
-            "end_date": {"$gte": schedule["start_date"]}
-        }, {"_id": 0}).to_list(100)
-        
         matches = []
-        matched_ids = set()
-        
-        for other_sched in overlapping:
-            if not other_sched.get("latitude"):
-                continue
-            
-            distance = calculate_distance(
-                schedule["latitude"], schedule["longitude"],
-                other_sched["latitude"], other_sched["longitude"]
-            )
-            
-            if distance <= 50 and other_sched["user_id"] not in matched_ids:
-                matched_ids.add(other_sched["user_id"])
-                
-                user = await db.users.find_one(
-                    {"user_id": other_sched["user_id"]},
-                    {"_id": 0, "password_hash": 0}
-                )
-                
-                if user:
-                    matches.append({
-                        "user": user,
-                        "their_destination": other_sched.get("destination"),
-                        "their_dates": f"{other_sched['start_date']} - {other_sched['end_date']}",
-                        "distance_miles": round(distance, 1)
-                    })
+        for row in match_rows.get(schedule["schedule_id"], []):
+            user = profiles.get(row["user_id"])
+            if user:
+                matches.append({
+                    "user": dict(user),
+                    "their_destination": row["their_destination"],
+                    "their_dates": row["their_dates"],
+                    "distance_miles": row["distance_miles"]
+                })
         
         trips_with_matches.append({
             "schedule": schedule,
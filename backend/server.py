@@ -9,8 +9,18 @@ import uuid
 import logging
 
 # Import services
-from services.database import db, client, CORS_ORIGINS
-from services.websocket import manager
+from services.database import db, client, CORS_ORIGINS, ensure_indexes
+from services.websocket import manager, RpcConnection
+from services.typing_indicators import typing_tracker
+from services.notifications import notification_service
+from services.counters import unread_counters
+from services.background import start_periodic_jobs, stop_periodic_jobs
+from services.overlap_index import overlap_index
+from services.map_clusters import map_cluster_index
+from services.jobs import job_queue
+from services.change_feed import change_feed
+from services.images import shutdown_image_pool
+from services.http_client import close_http_client
 
 # Import route modules
 from routes.auth import router as auth_router
@@ -22,9 +32,10 @@ from routes.notifications import router as notifications_router
 from routes.media import router as media_router
 from routes.ai import router as ai_router
 from routes.location import router as location_router
+from routes.realtime import handle_rpc_frame
 
 # Import helpers for WebSocket
-from utils.helpers import get_conversation_id
+from utils.helpers import get_conversation_id, authenticate_websocket
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -61,15 +72,26 @@ app.include_router(api_router)
 # WebSocket endpoint for real-time chat
 @app.websocket("/ws/{user_id}")
 async def websocket_endpoint(websocket: WebSocket, user_id: str):
-    """WebSocket endpoint for real-time messaging."""
-    await manager.connect(websocket, user_id)
+    """WebSocket endpoint for real-time messaging and multiplexed RPC."""
+    principal = await authenticate_websocket(websocket)
+    if principal and principal["user_id"] != user_id:
+        await websocket.close(code=4403)
+        return
+    
+    await manager.connect(websocket, user_id, principal)
     await db.users.update_one({"user_id": user_id}, {"$set": {"online": True}})
     
+    # In-flight RPC frames; replies are correlated by id so they may finish out of order
+    rpc = RpcConnection(principal, lambda: authenticate_websocket(websocket))
+    
     try:
         while True:
             data = await websocket.receive_json()
             
-            if data.get("type") == "message":
+            if data.get("type") == "rpc":
+                await rpc.submit(lambda frame=data: handle_rpc_frame(websocket, rpc, frame))
+            
+            elif data.get("type") == "message":
                 recipient_id = data.get("recipient_id")
                 content = data.get("content")
                 message_type = data.get("message_type", "text")
@@ -94,14 +116,27 @@ async def websocket_endpoint(websocket: WebSocket, user_id: str):
                 
                 await db.messages.insert_one(message)
                 message.pop("_id", None)
+                await unread_counters.add_chat(recipient_id, conv_id, 1)
+                await typing_tracker.clear(user_id, recipient_id)
                 
                 await manager.send_personal_message({"type": "new_message", "message": message}, recipient_id)
                 await websocket.send_json({"type": "message_sent", "message": message})
             
+            elif data.get("type") == "focus":
+                # Accept either the conversation id or the other participant's id
+                conv_id = data.get("conversation_id")
+                if not conv_id and data.get("user_id"):
+                    conv_id = get_conversation_id(user_id, data["user_id"])
+                if conv_id and user_id in conv_id:
+                    manager.set_focus(user_id, conv_id)
+            
+            elif data.get("type") == "blur":
+                manager.set_focus(user_id, None)
+            
             elif data.get("type") == "typing":
                 recipient_id = data.get("recipient_id")
                 is_typing = data.get("is_typing", True)
-                await manager.send_typing_indicator(user_id, recipient_id, is_typing)
+                await typing_tracker.update(user_id, recipient_id, is_typing)
             
             elif data.get("type") == "reaction":
                 message_id = data.get("message_id")
@@ -130,10 +165,12 @@ async def websocket_endpoint(websocket: WebSocket, user_id: str):
                 sender_id = data.get("sender_id")
                 read_at = datetime.now(timezone.utc).isoformat()
                 
-                await db.messages.update_many(
+                result = await db.messages.update_many(
                     {"conversation_id": conv_id, "sender_id": sender_id, "read": False},
                     {"$set": {"read": True, "read_at": read_at}}
                 )
+                await unread_counters.add_chat(user_id, conv_id, -result.modified_count)
+                await notification_service.mark_conversation_read(user_id, conv_id)
                 
                 await manager.send_personal_message({
                     "type": "read_receipt",
@@ -143,7 +180,9 @@ async def websocket_endpoint(websocket: WebSocket, user_id: str):
                 }, sender_id)
                 
     except WebSocketDisconnect:
+        rpc.cancel()
         manager.disconnect(user_id)
+        await typing_tracker.forget(user_id)
         await db.users.update_one(
             {"user_id": user_id},
             {"$set": {"online": False, "last_active": datetime.now(timezone.utc).isoformat()}}
@@ -161,7 +200,25 @@ app.add_middleware(
 )
 
 
+@app.on_event("startup")
+async def start_background_workers():
+    """Start background workers that run for the app's lifetime."""
+    await ensure_indexes()
+    notification_service.start()
+    await overlap_index.ensure_loaded()
+    await map_cluster_index.ensure_loaded()
+    change_feed.start()
+    job_queue.start()
+    start_periodic_jobs()
+
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    """Close database connection on shutdown."""
+    """Flush queued work and close database connection on shutdown."""
+    await stop_periodic_jobs()
+    await job_queue.stop()
+    await change_feed.stop()
+    await notification_service.stop()
+    shutdown_image_pool()
+    await close_http_client()
     client.close()
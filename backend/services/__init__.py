@@ -1,6 +1,13 @@
 """Services module index."""
 from .database import db, client, AUTH_SERVICE_URL, GIPHY_API_KEY, CORS_ORIGINS
 from .websocket import manager, ConnectionManager
+from .typing_indicators import typing_tracker, TypingTracker
+from .notifications import notification_service, NotificationService
+from .overlap_index import overlap_index, OverlapIndex
+from .loaders import ProfileLoader, get_profile_loader
+from .jobs import job_queue, JobQueue, job_handler
+from .map_clusters import map_cluster_index, MapClusterIndex
+from .change_feed import change_feed, ChangeFeed
 
 __all__ = [
     "db",
@@ -9,5 +16,20 @@ __all__ = [
     "GIPHY_API_KEY",
     "CORS_ORIGINS",
     "manager",
-    "ConnectionManager"
+    "ConnectionManager",
+    "typing_tracker",
+    "TypingTracker",
+    "notification_service",
+    "NotificationService",
+    "overlap_index",
+    "OverlapIndex",
+    "ProfileLoader",
+    "get_profile_loader",
+    "job_queue",
+    "JobQueue",
+    "job_handler",
+    "map_cluster_index",
+    "MapClusterIndex",
+    "change_feed",
+    "ChangeFeed"
 ]
@@ -0,0 +1,76 @@
+"""Periodic background jobs that run for the app's lifetime."""
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, List, Tuple
+
+from pymongo.errors import DuplicateKeyError
+
+from services.database import db
+
+logger = logging.getLogger(__name__)
+
+_registered: List[Tuple[str, float, Callable[[], Awaitable], bool, bool]] = []
+_tasks: List[asyncio.Task] = []
+_worker_id = uuid.uuid4().hex
+
+
+def periodic(name: str, interval_seconds: float, run_at_start: bool = False, exclusive: bool = False):
+    """
+    Register a coroutine function to run every ``interval_seconds`` once the app starts.
+    
+    With ``run_at_start`` the first run happens immediately instead of after one interval.
+    With ``exclusive`` only one API worker runs it per interval: each run first
+    takes a lease in ``periodic_leases`` that lasts the interval.
+    """
+    def decorator(func: Callable[[], Awaitable]):
+        _registered.append((name, interval_seconds, func, run_at_start, exclusive))
+        return func
+    return decorator
+
+
+async def take_lease(name: str, seconds: float) -> bool:
+    """Claim ``name`` for ``seconds`` unless another worker holds an unexpired claim."""
+    now = datetime.now(timezone.utc)
+    try:
+        await db.periodic_leases.update_one(
+            {"name": name, "$or": [{"lease_until": {"$lte": now}}, {"worker_id": _worker_id}]},
+            {"$set": {"lease_until": now + timedelta(seconds=seconds), "worker_id": _worker_id}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        return False
+    return True
+
+
+async def _loop(name: str, interval_seconds: float, func: Callable[[], Awaitable], run_at_start: bool,
+                exclusive: bool):
+    delay = 0 if run_at_start else interval_seconds
+    while True:
+        await asyncio.sleep(delay)
+        delay = interval_seconds
+        try:
+            if exclusive and not await take_lease(name, interval_seconds):
+                continue
+            await func()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.exception(f"Periodic job {name} failed: {e}")
+
+
+def start_periodic_jobs():
+    """Start every registered periodic job (idempotent)."""
+    if _tasks:
+        return
+    for name, interval_seconds, func, run_at_start, exclusive in _registered:
+        _tasks.append(asyncio.create_task(_loop(name, interval_seconds, func, run_at_start, exclusive)))
+        logger.info(f"Periodic job {name} scheduled every {interval_seconds}s")
+
+
+async def stop_periodic_jobs():
+    for task in _tasks:
+        task.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
+    _tasks.clear()
@@ -0,0 +1,152 @@
+"""In-process TTL caches with single-flight loading.
+
+``CoalescingCache.get(key, loader)`` returns a cached value or runs ``loader``
+once per key no matter how many requests miss at the same moment; the others
+await the same result. ``invalidate`` drops matching entries and bumps a
+generation so a load that started before the write is never stored.
+
+The geo helpers key candidate sets by a small lat/lon cell and a radius
+bucket: everyone in the same cell asking for a similar radius shares one
+superset, searched from the cell center with the radius padded by the cell's
+half-diagonal, and each request then trims it to its exact position.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from math import ceil, floor
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from utils.helpers import calculate_distance
+
+GEO_CELL_DEGREES = 0.25
+# Half-diagonal of a 0.25 degree cell is at most ~12.2 miles
+GEO_CELL_PAD_MILES = 13
+RADIUS_BUCKETS = (25, 50, 100, 200)
+CANDIDATE_TTL_SECONDS = 60
+
+
+class TTLCache:
+    """Bounded LRU mapping whose entries expire ``ttl`` seconds after being set."""
+    
+    def __init__(self, ttl: float, maxsize: int = 1024):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        """``(True, value)`` for a live entry, else ``(False, None)``."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        if entry[0] <= time.monotonic():
+            del self._entries[key]
+            return False, None
+        self._entries.move_to_end(key)
+        return True, entry[1]
+    
+    def set(self, key: Hashable, value: Any):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+    
+    def invalidate(self, predicate: Optional[Callable[[Hashable], bool]] = None):
+        """Drop entries whose key matches ``predicate``, or everything."""
+        if predicate is None:
+            self._entries.clear()
+            return
+        for key in [k for k in self._entries if predicate(k)]:
+            del self._entries[key]
+
+
+class SingleFlight:
+    """Run at most one ``loader`` per key at a time; concurrent callers share its result."""
+    
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+    
+    async def do(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(loader())
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # One caller disconnecting must not cancel the load for the others
+        return await asyncio.shield(future)
+
+
+class CoalescingCache:
+    """``TTLCache`` filled through ``SingleFlight``."""
+    
+    def __init__(self, ttl: float, maxsize: int = 1024):
+        self._cache = TTLCache(ttl, maxsize)
+        self._flight = SingleFlight()
+        self._generation = 0
+    
+    def __len__(self) -> int:
+        return len(self._cache)
+    
+    async def get(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        hit, value = self._cache.get(key)
+        if hit:
+            return value
+        generation = self._generation
+    
+        async def load():
+            value = await loader()
+            if generation == self._generation:
+                self._cache.set(key, value)
+            return value
+    
+        return await self._flight.do((generation, key), load)
+    
+    def invalidate(self, predicate: Optional[Callable[[Hashable], bool]] = None):
+        self._generation += 1
+        self._cache.invalidate(predicate)
+
+
+def geo_cell(lat: float, lon: float) -> Tuple[int, int]:
+    return floor(lat / GEO_CELL_DEGREES), floor(lon / GEO_CELL_DEGREES)
+
+
+def geo_cell_center(cell: Tuple[int, int]) -> Tuple[float, float]:
+    return (cell[0] + 0.5) * GEO_CELL_DEGREES, (cell[1] + 0.5) * GEO_CELL_DEGREES
+
+
+def radius_bucket(radius_miles: float) -> int:
+    """Smallest bucket covering the radius; beyond the last, round up to 100 miles."""
+    for bucket in RADIUS_BUCKETS:
+        if radius_miles <= bucket:
+            return bucket
+    return int(ceil(radius_miles / 100) * 100)
+
+
+def geo_key(lat: float, lon: float, radius_miles: float, *extra: Hashable) -> tuple:
+    """Cache key ``(cell, radius bucket, *extra)`` for a query around the point."""
+    return (geo_cell(lat, lon), radius_bucket(radius_miles), *extra)
+
+
+def geo_search_area(key: tuple) -> Tuple[float, float, float]:
+    """``(lat, lon, radius)`` that covers every query sharing ``key``."""
+    lat, lon = geo_cell_center(key[0])
+    return lat, lon, key[1] + GEO_CELL_PAD_MILES
+
+
+def invalidate_near(cache: CoalescingCache, lat: Optional[float], lon: Optional[float]):
+    """Drop geo-keyed entries whose search area contains the point."""
+    if lat is None or lon is None:
+        return
+    
+    def covers(key: tuple) -> bool:
+        center_lat, center_lon, radius = geo_search_area(key)
+        return calculate_distance(center_lat, center_lon, lat, lon) <= radius
+    
+    cache.invalidate(covers)
+
+
+# Candidate sets shared by the discovery endpoints
+passing_through_cache = CoalescingCache(CANDIDATE_TTL_SECONDS)
+nearby_users_cache = CoalescingCache(CANDIDATE_TTL_SECONDS)
@@ -0,0 +1,114 @@
+"""Cross-worker change feed for the in-memory indexes.
+
+Each API worker keeps its own overlap index and map cluster grid. A write
+updates the local copy straight away and is published to ``index_changes``
+as ``{"kind", "id", "data", "origin", "at"}``; every worker polls that
+collection and hands other workers' changes to the handlers subscribed to
+their kind, which reload the affected documents from MongoDB. Workers
+therefore converge within ``POLL_INTERVAL_SECONDS`` instead of at the next
+full rebuild, which stays as a backstop.
+
+Writers stamp ``at`` with their own clock and their inserts can land out of
+order, so each poll re-reads ``POLL_OVERLAP_SECONDS`` behind the newest entry
+it has seen and skips entries it already applied. Handlers reload current
+state rather than replaying a delta, so applying an entry twice is harmless.
+Entries expire after an hour (TTL index).
+"""
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from services.database import db
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL_SECONDS = 1.0
+POLL_OVERLAP_SECONDS = 5.0
+
+ChangeHandler = Callable[[List[dict]], Awaitable]
+
+
+class ChangeFeed:
+    """Publishes local writes and applies other workers' writes to subscribed handlers."""
+    
+    def __init__(self, poll_interval: float = POLL_INTERVAL_SECONDS):
+        self.poll_interval = poll_interval
+        self.origin = uuid.uuid4().hex
+        self._handlers: Dict[str, List[ChangeHandler]] = {}
+        # Starts before the indexes load, so nothing published during the load is missed
+        self._since = datetime.now(timezone.utc)
+        # _id -> at for entries inside the overlap window that were already applied
+        self._applied: Dict[object, datetime] = {}
+        self._lock = asyncio.Lock()
+        self._worker: Optional[asyncio.Task] = None
+    
+    @property
+    def collection(self):
+        return db.index_changes
+    
+    def subscribe(self, kind: str, handler: ChangeHandler):
+        """Call ``handler(entries)`` with every batch of other workers' changes of ``kind``."""
+        self._handlers.setdefault(kind, []).append(handler)
+    
+    async def publish(self, kind: str, ids: List[str], data: Optional[dict] = None):
+        """Record that documents of ``kind`` changed; the caller has already applied them locally."""
+        if not ids:
+            return
+        now = datetime.now(timezone.utc)
+        try:
+            await self.collection.insert_many([
+                {"kind": kind, "id": id_, "data": data or {}, "origin": self.origin, "at": now} for id_ in ids
+            ], ordered=False)
+        except Exception as e:
+            # Other workers still pick the change up at their next rebuild
+            logger.error(f"Publishing {kind} changes failed: {e}")
+    
+    async def catch_up(self):
+        """Apply every change published so far; jobs call this before reading an index."""
+        async with self._lock:
+            cutoff = self._since - timedelta(seconds=POLL_OVERLAP_SECONDS)
+            batches: Dict[str, List[dict]] = {}
+            async for entry in self.collection.find({"at": {"$gte": cutoff}}).sort("at", 1):
+                if entry["_id"] in self._applied:
+                    continue
+                at = entry["at"].replace(tzinfo=timezone.utc)
+                self._applied[entry["_id"]] = at
+                self._since = max(self._since, at)
+                if entry["origin"] != self.origin:
+                    batches.setdefault(entry["kind"], []).append(entry)
+            for kind, entries in batches.items():
+                for handler in self._handlers.get(kind, []):
+                    try:
+                        await handler(entries)
+                    except Exception as e:
+                        logger.exception(f"Applying {len(entries)} {kind} changes failed: {e}")
+            cutoff = self._since - timedelta(seconds=POLL_OVERLAP_SECONDS)
+            self._applied = {k: at for k, at in self._applied.items() if at >= cutoff}
+    
+    def start(self):
+        """Start polling on the running loop (idempotent)."""
+        if self._worker and not self._worker.done():
+            return
+        self._worker = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        if self._worker:
+            self._worker.cancel()
+            await asyncio.gather(self._worker, return_exceptions=True)
+            self._worker = None
+    
+    async def _run(self):
+        while True:
+            try:
+                await self.catch_up()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception(f"Change feed poll failed: {e}")
+            await asyncio.sleep(self.poll_interval)
+
+
+# Global feed instance
+change_feed = ChangeFeed()
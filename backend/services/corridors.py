@@ -0,0 +1,236 @@
+"""Route corridors for multi-day road trips.
+
+A schedule may describe its route as ordered waypoints or an encoded polyline.
+``RouteIndex`` keeps each route as numpy vertex arrays plus an estimated date
+at every vertex (interpolated by distance between the trip's start, any
+waypoint ETAs, and its end). A grid of lat/lon cells maps to the segments
+that cross each cell, so a "who drives past P" query only measures
+point-to-segment distance, vectorized, for segments near P.
+
+Routes are stored apart from their schedules, in ``schedule_routes``, so
+schedule reads don't carry thousands of vertices; ``ROUTE_FIELDS`` are merged
+back in only to index the route.
+"""
+from datetime import date
+from math import cos, floor, radians
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+MILES_PER_DEGREE = 69.0
+EARTH_RADIUS_MILES = 3956
+MAX_ROUTE_VERTICES = 20000
+
+ROUTE_FIELDS = ("route", "route_eta_anchors")
+
+Cell = Tuple[int, int]
+
+
+def decode_polyline(encoded: str, precision: int = 5) -> List[List[float]]:
+    """Decode a Google encoded polyline into ``[[lat, lon], ...]``."""
+    factor = 10 ** precision
+    points, index, lat, lon = [], 0, 0, 0
+    length = len(encoded)
+    while index < length:
+        deltas = []
+        for _ in range(2):
+            result, shift = 0, 0
+            while True:
+                if index >= length:
+                    raise ValueError("Truncated polyline")
+                byte = ord(encoded[index]) - 63
+                index += 1
+                result |= (byte & 0x1F) << shift
+                shift += 5
+                if byte < 0x20:
+                    break
+            deltas.append(~(result >> 1) if result & 1 else result >> 1)
+        lat += deltas[0]
+        lon += deltas[1]
+        points.append([lat / factor, lon / factor])
+    return points
+
+
+def build_route(waypoints: Optional[List[dict]] = None, polyline: Optional[str] = None) -> Tuple[List[List[float]], Dict[int, str]]:
+    """
+    Normalize waypoints or a polyline into route vertices.
+    
+    Returns ``(route, eta_anchors)`` where ``eta_anchors`` maps vertex index to
+    any ETA date given on a waypoint. Raises ValueError on bad input.
+    """
+    if polyline:
+        route, anchors = decode_polyline(polyline), {}
+    else:
+        route, anchors = [], {}
+        for i, waypoint in enumerate(waypoints or []):
+            route.append([float(waypoint["latitude"]), float(waypoint["longitude"])])
+            if waypoint.get("eta"):
+                anchors[i] = date.fromisoformat(str(waypoint["eta"])[:10]).isoformat()
+    if len(route) < 2:
+        raise ValueError("A route needs at least two points")
+    if len(route) > MAX_ROUTE_VERTICES:
+        raise ValueError(f"A route may have at most {MAX_ROUTE_VERTICES} points")
+    if any(not (-90 <= lat <= 90 and -180 <= lon <= 180) for lat, lon in route):
+        raise ValueError("Route point out of range")
+    return route, anchors
+
+
+def without_route(schedule: dict) -> dict:
+    """The schedule without its route fields (itself if it has none)."""
+    if not any(field in schedule for field in ROUTE_FIELDS):
+        return schedule
+    return {k: v for k, v in schedule.items() if k not in ROUTE_FIELDS}
+
+
+def cells_around(lat: float, lon: float, radius_miles: float, cell_degrees: float):
+    """Yield every grid cell a circle of ``radius_miles`` around the point can touch."""
+    columns = int(round(360 / cell_degrees))
+    lat_span = radius_miles / MILES_PER_DEGREE
+    lon_span = radius_miles / (MILES_PER_DEGREE * max(cos(radians(lat)), 0.01))
+    row_lo = floor((lat - lat_span) / cell_degrees)
+    row_hi = floor((lat + lat_span) / cell_degrees)
+    if lon_span >= 180:
+        cols = range(columns)
+    else:
+        col_lo = floor((lon - lon_span + 180) / cell_degrees)
+        col_hi = floor((lon + lon_span + 180) / cell_degrees)
+        cols = [c % columns for c in range(col_lo, col_hi + 1)]
+    for row in range(row_lo, row_hi + 1):
+        for col in cols:
+            yield (row, col)
+
+
+def _ordinal(value: str) -> int:
+    return date.fromisoformat(value[:10]).toordinal()
+
+
+class IndexedRoute:
+    """One schedule's route as arrays: vertices (degrees) and ETA (fractional ordinal day)."""
+    
+    __slots__ = ("schedule", "lat", "lon", "eta", "cells")
+    
+    def __init__(self, schedule: dict, cell_degrees: float):
+        self.schedule = without_route(schedule)
+        vertices = np.asarray(schedule["route"], dtype=float)
+        self.lat, self.lon = vertices[:, 0], vertices[:, 1]
+    
+        # Cumulative haversine distance along the route
+        lat_r, lon_r = np.radians(self.lat), np.radians(self.lon)
+        a = (np.sin(np.diff(lat_r) / 2) ** 2
+             + np.cos(lat_r[:-1]) * np.cos(lat_r[1:]) * np.sin(np.diff(lon_r) / 2) ** 2)
+        miles = np.concatenate([[0.0], np.cumsum(2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(np.clip(a, 0, 1))))])
+    
+        # The trip covers start_date through the whole of end_date
+        anchors = {0: float(_ordinal(schedule["start_date"])), len(miles) - 1: _ordinal(schedule["end_date"]) + 0.999}
+        for index, eta in (schedule.get("route_eta_anchors") or {}).items():
+            anchors[int(index)] = float(_ordinal(eta))
+        order = sorted(anchors)
+        self.eta = np.interp(miles, miles[order], [anchors[i] for i in order])
+    
+        rows = np.floor(self.lat / cell_degrees).astype(int)
+        columns = int(round(360 / cell_degrees))
+        cols = np.floor((self.lon + 180) / cell_degrees).astype(int) % columns
+        buckets: Dict[Cell, List[int]] = {}
+        for i in range(len(rows) - 1):
+            r0, r1 = sorted((rows[i], rows[i + 1]))
+            c0, c1 = sorted((cols[i], cols[i + 1]))
+            if c1 - c0 > columns // 2:
+                # Crosses the antimeridian: only the cells at either end
+                spans = [(r, c) for r in range(r0, r1 + 1) for c in (c0, c1)]
+            else:
+                spans = [(r, c) for r in range(r0, r1 + 1) for c in range(c0, c1 + 1)]
+            for cell in spans:
+                buckets.setdefault(cell, []).append(i)
+        self.cells = {cell: np.asarray(segments) for cell, segments in buckets.items()}
+    
+    def closest(self, segments: np.ndarray, lat: float, lon: float, radius_miles: float,
+                start_day: int, end_day: int) -> Optional[Tuple[float, float, float, int]]:
+        """
+        Nearest point on the given segments within the radius whose ETA falls in
+        [start_day, end_day]: ``(distance, lat, lon, day)`` or None.
+        """
+        # Local equirectangular projection around the query point, in miles
+        scale = MILES_PER_DEGREE * cos(radians(lat))
+        ax = ((self.lon[segments] - lon + 180) % 360 - 180) * scale
+        ay = (self.lat[segments] - lat) * MILES_PER_DEGREE
+        bx = ((self.lon[segments + 1] - lon + 180) % 360 - 180) * scale
+        by = (self.lat[segments + 1] - lat) * MILES_PER_DEGREE
+        dx, dy = bx - ax, by - ay
+        length_sq = dx * dx + dy * dy
+        t = np.clip(-(ax * dx + ay * dy) / np.where(length_sq > 0, length_sq, 1), 0, 1)
+        distance = np.hypot(ax + t * dx, ay + t * dy)
+    
+        day = np.floor(self.eta[segments] + t * (self.eta[segments + 1] - self.eta[segments]))
+        ok = (distance <= radius_miles) & (day >= start_day) & (day <= end_day)
+        if not ok.any():
+            return None
+        best = np.flatnonzero(ok)[np.argmin(distance[ok])]
+        seg = segments[best]
+        point_lat = self.lat[seg] + t[best] * (self.lat[seg + 1] - self.lat[seg])
+        point_lon = self.lon[seg] + t[best] * (self.lon[seg + 1] - self.lon[seg])
+        return float(distance[best]), float(point_lat), float(point_lon), int(day[best])
+
+
+class RouteIndex:
+    """Grid of cells -> routed schedules with segments in that cell."""
+    
+    def __init__(self, cell_degrees: float = 1.0):
+        self.cell_degrees = cell_degrees
+        self._routes: Dict[str, IndexedRoute] = {}
+        self._cells: Dict[Cell, Dict[str, np.ndarray]] = {}
+    
+    def __len__(self) -> int:
+        return len(self._routes)
+    
+    def add(self, schedule: dict):
+        schedule_id = schedule["schedule_id"]
+        self.remove(schedule_id)
+        if len(schedule.get("route") or []) < 2:
+            return
+        try:
+            route = IndexedRoute(schedule, self.cell_degrees)
+        except (KeyError, TypeError, ValueError):
+            return
+        self._routes[schedule_id] = route
+        for cell, segments in route.cells.items():
+            self._cells.setdefault(cell, {})[schedule_id] = segments
+    
+    def remove(self, schedule_id: str):
+        route = self._routes.pop(schedule_id, None)
+        if route is None:
+            return
+        for cell in route.cells:
+            bucket = self._cells.get(cell, {})
+            bucket.pop(schedule_id, None)
+            if not bucket:
+                self._cells.pop(cell, None)
+    
+    def search(self, lat: float, lon: float, radius_miles: float, start_date: str, end_date: str,
+               exclude_user_id: Optional[str] = None) -> List[Tuple[dict, float]]:
+        """
+        Routed schedules passing within ``radius_miles`` of the point on a date in
+        [start_date, end_date], nearest first. Each result is a schedule copy with
+        ``passing_date`` and ``passing_point`` describing the closest approach.
+        """
+        candidates: Dict[str, List[np.ndarray]] = {}
+        for cell in cells_around(lat, lon, radius_miles, self.cell_degrees):
+            for schedule_id, segments in self._cells.get(cell, {}).items():
+                candidates.setdefault(schedule_id, []).append(segments)
+    
+        start_day, end_day = _ordinal(start_date), _ordinal(end_date)
+        results = []
+        for schedule_id, parts in candidates.items():
+            route = self._routes[schedule_id]
+            if exclude_user_id and route.schedule.get("user_id") == exclude_user_id:
+                continue
+            segments = np.unique(np.concatenate(parts))
+            hit = route.closest(segments, lat, lon, radius_miles, start_day, end_day)
+            if hit is None:
+                continue
+            distance, point_lat, point_lon, day = hit
+            schedule = dict(route.schedule)
+            schedule["passing_date"] = date.fromordinal(day).isoformat()
+            schedule["passing_point"] = {"latitude": round(point_lat, 5), "longitude": round(point_lon, 5)}
+            results.append((schedule, round(distance, 1)))
+        results.sort(key=lambda r: r[1])
+        return results
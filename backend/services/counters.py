@@ -0,0 +1,156 @@
+"""Maintained unread counters for notification and chat badges.
+
+Each user has one small ``unread_counters`` document::
+
+    {"user_id": ..., "notifications": 3, "chat_total": 5, "chats": {"conv_a_b": 2, "conv_a_c": 3}}
+
+Writers keep it current with atomic ``$inc`` on create/read/read-all, so badge
+polling is a single indexed read. ``reconcile`` rebuilds counters from the
+``notifications`` and ``messages`` collections to repair any drift, leaving
+alone any counter that an ``$inc`` touched while it was counting.
+"""
+import logging
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Optional
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from services.database import db
+from services.background import periodic
+
+logger = logging.getLogger(__name__)
+
+RECONCILE_INTERVAL_SECONDS = 15 * 60
+RECONCILE_BATCH_SIZE = 1000
+
+
+def _empty(user_id: str) -> dict:
+    return {"user_id": user_id, "notifications": 0, "chat_total": 0, "chats": {}}
+
+
+def _before(field: str, timestamp: str) -> dict:
+    """Filter for documents whose ``field`` is unset or earlier than ``timestamp``."""
+    return {"$or": [{field: {"$lt": timestamp}}, {field: {"$exists": False}}]}
+
+
+class UnreadCounters:
+    """Per-user unread counters backed by the ``unread_counters`` collection."""
+    
+    @property
+    def collection(self):
+        return db.unread_counters
+    
+    async def get(self, user_id: str) -> dict:
+        """Return the user's counters, building them from source on first access."""
+        doc = await self.collection.find_one({"user_id": user_id}, {"_id": 0})
+        # Documents first created by an $inc upsert haven't counted pre-existing unread items yet
+        if doc is None or "reconciled_at" not in doc:
+            doc = await self.reconcile_user(user_id)
+        return doc
+    
+    async def add_notifications(self, counts: Dict[str, int]):
+        """Apply notification count deltas for several users in one round trip."""
+        changed_at = datetime.now(timezone.utc).isoformat()
+        ops = [
+            UpdateOne(
+                {"user_id": user_id},
+                {"$inc": {"notifications": delta}, "$set": {"changed_at": changed_at}},
+                upsert=True
+            )
+            for user_id, delta in counts.items() if delta
+        ]
+        if ops:
+            await self.collection.bulk_write(ops, ordered=False)
+    
+    async def add_chat(self, user_id: str, conversation_id: str, delta: int):
+        """Apply a delta to one conversation's unread count and the chat total."""
+        if not delta:
+            return
+        await self.collection.update_one(
+            {"user_id": user_id},
+            {
+                "$inc": {f"chats.{conversation_id}": delta, "chat_total": delta},
+                "$set": {"changed_at": datetime.now(timezone.utc).isoformat()}
+            },
+            upsert=True
+        )
+    
+    async def reconcile_user(self, user_id: str) -> dict:
+        """Rebuild one user's counters from the source collections."""
+        rebuilt = await self._rebuild([user_id])
+        if user_id in rebuilt:
+            return rebuilt[user_id]
+        # Counted while rebuilding: the live document is as current as the rebuild would have been
+        return await self.collection.find_one({"user_id": user_id}, {"_id": 0}) or _empty(user_id)
+    
+    async def reconcile(self, user_ids: Optional[Iterable[str]] = None) -> int:
+        """Rebuild counters (all users by default). Returns the number of documents written."""
+        started = datetime.now(timezone.utc).isoformat()
+        rebuilt = await self._rebuild(list(user_ids) if user_ids is not None else None, started)
+        if user_ids is None:
+            # Users with nothing unread left anywhere still need their stale counters zeroed
+            await self.collection.update_many(
+                {"$and": [_before("reconciled_at", started), _before("changed_at", started)]},
+                {"$set": {"notifications": 0, "chat_total": 0, "chats": {}, "reconciled_at": started}}
+            )
+        return len(rebuilt)
+    
+    async def _rebuild(self, user_ids: Optional[list], started: Optional[str] = None) -> Dict[str, dict]:
+        """
+        Count unread items from source and write them, returning the documents
+        written. Counters changed since ``started`` are skipped: an ``$inc``
+        racing the count may or may not be in it, so they are left to the
+        next run rather than overwritten.
+        """
+        started = started or datetime.now(timezone.utc).isoformat()
+        notif_match = {"read": False}
+        msg_match = {"read": False}
+        if user_ids is not None:
+            notif_match["user_id"] = {"$in": user_ids}
+            msg_match["recipient_id"] = {"$in": user_ids}
+    
+        counters: Dict[str, dict] = {uid: _empty(uid) for uid in (user_ids or [])}
+    
+        async for row in db.notifications.aggregate([
+            {"$match": notif_match},
+            {"$group": {"_id": "$user_id", "count": {"$sum": 1}}}
+        ]):
+            counters.setdefault(row["_id"], _empty(row["_id"]))["notifications"] = row["count"]
+    
+        async for row in db.messages.aggregate([
+            {"$match": msg_match},
+            {"$group": {"_id": {"user_id": "$recipient_id", "conversation_id": "$conversation_id"}, "count": {"$sum": 1}}}
+        ]):
+            doc = counters.setdefault(row["_id"]["user_id"], _empty(row["_id"]["user_id"]))
+            doc["chats"][row["_id"]["conversation_id"]] = row["count"]
+            doc["chat_total"] += row["count"]
+    
+        for doc in counters.values():
+            doc["reconciled_at"] = started
+        uids = list(counters)
+        for i in range(0, len(uids), RECONCILE_BATCH_SIZE):
+            batch = uids[i:i + RECONCILE_BATCH_SIZE]
+            try:
+                await self.collection.bulk_write([
+                    UpdateOne({"user_id": uid, **_before("changed_at", started)}, {"$set": counters[uid]}, upsert=True)
+                    for uid in batch
+                ], ordered=False)
+            except BulkWriteError as e:
+                # The filter missed a counter changed meanwhile, so the upsert collided with it
+                errors = e.details.get("writeErrors", [])
+                if any(error.get("code") != 11000 for error in errors):
+                    raise
+                for error in errors:
+                    counters.pop(batch[error["index"]], None)
+        return counters
+
+
+# Global counters instance
+unread_counters = UnreadCounters()
+
+
+@periodic("reconcile_unread_counters", RECONCILE_INTERVAL_SECONDS)
+async def reconcile_unread_counters():
+    written = await unread_counters.reconcile()
+    logger.info(f"Reconciled unread counters for {written} users")
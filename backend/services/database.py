@@ -20,6 +20,39 @@ CORS_ORIGINS = os.environ.get('CORS_ORIGINS', '').split(',') if os.environ.get('
     "https://localhost:3000"
 ]
 
+async def ensure_indexes():
+    """Create the indexes background services rely on (idempotent)."""
+    await db.unread_counters.create_index("user_id", unique=True)
+    await db.notifications.create_index("notification_id", unique=True)
+    await db.jobs.create_index("job_id", unique=True)
+    await db.jobs.create_index([("status", 1), ("run_at", 1)])
+    await db.jobs.create_index("finished_at", expireAfterSeconds=7 * 24 * 60 * 60)
+    await db.trip_matches.create_index("schedule_id", unique=True)
+    await db.schedules.create_index("import_id", sparse=True)
+    # The overlap index rebuild loads only trips and series that haven't ended
+    await db.schedules.create_index("end_date")
+    await db.schedules.create_index("series_end_date", sparse=True)
+    await db.schedule_routes.create_index("schedule_id", unique=True)
+    await db.trip_matches.create_index("computed_at", expireAfterSeconds=15 * 60)
+    await db.heatmap_tiles.create_index("tile_id", unique=True)
+    await db.upload_sessions.create_index("upload_id", unique=True)
+    await db.upload_sessions.create_index("expires_at")
+    await db.upload_intents.create_index("intent_id", unique=True)
+    await db.upload_intents.create_index("expires_at")
+    # Media dedup and the unreferenced-object collector
+    await db.media.create_index([("user_id", 1), ("sha256", 1)])
+    await db.media.create_index("filename")
+    await db.users.create_index("photos")
+    await db.users.create_index("profile_photo")
+    await db.messages.create_index("media_url", sparse=True)
+    await db.notifications.create_index("from_user_photo", sparse=True)
+    await db.notifications.create_index("data.matched_user_photo", sparse=True)
+    await db.periodic_leases.create_index("name", unique=True)
+    await db.index_changes.create_index("at", expireAfterSeconds=60 * 60)
+    await db.geocode_cache.create_index("key", unique=True)
+    await db.geocode_cache.create_index("expires_at", expireAfterSeconds=0)
+
+
 def get_db():
     return db
 
@@ -0,0 +1,240 @@
+"""Direct-to-storage uploads.
+
+An upload intent in ``upload_intents`` reserves a storage key for one file::
+
+    {"intent_id", "user_id", "key", "content_type", "media_type", "purpose",
+     "size", "storage_type", "status", "expires_at", "media_id"}
+
+With S3 configured the client gets a presigned POST that only accepts exactly
+``size`` bytes of the declared content type, and sends the file straight to
+the bucket. Without S3 it gets a local upload URL signed with HMAC, so the
+bytes are streamed to disk without a session cookie. Either way the client
+then completes the intent, which checks that the object arrived at the
+declared size before the media record is written. A periodic job deletes
+intents a day after they expire, along with any object never recorded.
+"""
+import hashlib
+import hmac
+import logging
+import os
+import secrets
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Awaitable, Callable, Optional
+
+import anyio
+
+from services.database import db
+from services.background import periodic
+from services import storage
+from services.storage import S3_BUCKET_NAME, delete_stored, local_name, get_s3_url, s3_call, save_local
+
+logger = logging.getLogger(__name__)
+
+INTENT_TTL = timedelta(minutes=15)
+# Expired intents are kept this long so a late completion still finds them
+INTENT_RETENTION = timedelta(hours=24)
+EXPIRY_INTERVAL_SECONDS = 30 * 60
+
+UPLOAD_SIGNING_SECRET = os.environ.get("UPLOAD_SIGNING_SECRET")
+if not UPLOAD_SIGNING_SECRET:
+    # Signed URLs then only verify on this process
+    UPLOAD_SIGNING_SECRET = secrets.token_hex(32)
+    logger.warning("UPLOAD_SIGNING_SECRET not set; using a per-process secret for local upload URLs")
+
+
+class IntentRejected(Exception):
+    """The intent cannot accept this upload or be completed."""
+
+
+def sign_upload(intent_id: str, expires: int) -> str:
+    message = f"{intent_id}:{expires}".encode()
+    return hmac.new(UPLOAD_SIGNING_SECRET.encode(), message, hashlib.sha256).hexdigest()
+
+
+def verify_upload_signature(intent_id: str, expires: int, signature: str) -> bool:
+    return expires > time.time() and hmac.compare_digest(sign_upload(intent_id, expires), signature)
+
+
+async def exact_size(chunks: AsyncIterator[bytes], size: int, digest) -> AsyncIterator[bytes]:
+    """Hash chunks as they pass through, rejecting the upload as soon as it runs past ``size``."""
+    received = 0
+    async for chunk in chunks:
+        received += len(chunk)
+        if received > size:
+            raise IntentRejected("Upload is larger than declared")
+        digest.update(chunk)
+        yield chunk
+
+
+class UploadIntents:
+    """Create, receive, and complete direct uploads."""
+    
+    @property
+    def collection(self):
+        return db.upload_intents
+    
+    async def create(self, user_id: str, key: str, content_type: str, media_type: str,
+                     purpose: str, size: int) -> dict:
+        """Reserve ``key`` and return the intent with an ``upload`` target for the client."""
+        now = datetime.now(timezone.utc)
+        intent = {
+            "intent_id": f"intent_{uuid.uuid4().hex}",
+            "user_id": user_id,
+            "key": key,
+            "content_type": content_type,
+            "media_type": media_type,
+            "purpose": purpose,
+            "size": size,
+            "storage_type": "s3" if storage.s3_client else "local",
+            "status": "pending",
+            "created_at": now,
+            "expires_at": now + INTENT_TTL
+        }
+        await self.collection.insert_one(intent)
+        intent.pop("_id", None)
+        intent["upload"] = await self.upload_target(intent)
+        return intent
+    
+    async def upload_target(self, intent: dict) -> dict:
+        """Where and how the client sends the bytes."""
+        expires_in = int((intent["expires_at"] - datetime.now(timezone.utc)).total_seconds())
+        if intent["storage_type"] == "s3":
+            post = await s3_call(
+                "generate_presigned_post", Bucket=S3_BUCKET_NAME, Key=intent["key"],
+                Fields={"Content-Type": intent["content_type"]},
+                Conditions=[
+                    {"Content-Type": intent["content_type"]},
+                    ["content-length-range", intent["size"], intent["size"]]
+                ],
+                ExpiresIn=expires_in
+            )
+            return {"method": "POST", "url": post["url"], "fields": post["fields"]}
+    
+        expires = int(intent["expires_at"].timestamp())
+        signature = sign_upload(intent["intent_id"], expires)
+        return {
+            "method": "PUT",
+            "url": f"/api/media/direct/{intent['intent_id']}?expires={expires}&signature={signature}",
+            "headers": {"Content-Type": intent["content_type"]}
+        }
+    
+    async def get(self, intent_id: str, user_id: Optional[str] = None) -> Optional[dict]:
+        query = {"intent_id": intent_id}
+        if user_id:
+            query["user_id"] = user_id
+        return await self.collection.find_one(query, {"_id": 0})
+    
+    async def receive_local(self, intent: dict, chunks: AsyncIterator[bytes]) -> int:
+        """Stream a signed local upload to disk; only one upload per intent is accepted."""
+        if intent["storage_type"] != "local":
+            raise IntentRejected("This upload goes to object storage")
+        claimed = await self.collection.find_one_and_update(
+            {"intent_id": intent["intent_id"], "status": "pending"},
+            {"$set": {"status": "receiving"}}
+        )
+        if claimed is None:
+            raise IntentRejected("Upload already received")
+        digest = hashlib.sha256()
+        try:
+            size = await save_local(exact_size(chunks, intent["size"], digest), intent["key"])
+            if size != intent["size"]:
+                (storage.UPLOAD_DIR / local_name(intent["key"])).unlink(missing_ok=True)
+                raise IntentRejected("Upload is smaller than declared")
+        except BaseException:
+            with anyio.CancelScope(shield=True):
+                await self.collection.update_one({"intent_id": intent["intent_id"]}, {"$set": {"status": "pending"}})
+            raise
+        await self.collection.update_one(
+            {"intent_id": intent["intent_id"]}, {"$set": {"status": "uploaded", "sha256": digest.hexdigest()}}
+        )
+        return size
+    
+    async def _stored(self, intent: dict, claimed: dict) -> dict:
+        """
+        Confirm the object arrived intact; returns ``{"url", "storage_type",
+        "size", "sha256"}``. Objects sent straight to S3 are not read back, so
+        their hash is unknown and they are not deduplicated.
+        """
+        if intent["storage_type"] == "local":
+            if claimed["status"] != "uploaded":
+                raise IntentRejected("File has not been uploaded")
+            return {
+                "url": f"/api/media/{local_name(intent['key'])}", "storage_type": "local",
+                "size": intent["size"], "sha256": claimed.get("sha256")
+            }
+    
+        try:
+            head = await s3_call("head_object", Bucket=S3_BUCKET_NAME, Key=intent["key"])
+        except Exception:
+            raise IntentRejected("File has not been uploaded")
+        if head["ContentLength"] != intent["size"]:
+            await s3_call("delete_object", Bucket=S3_BUCKET_NAME, Key=intent["key"])
+            raise IntentRejected("Uploaded file does not match the declared size")
+        return {"url": get_s3_url(intent["key"]), "storage_type": "s3", "size": intent["size"], "sha256": None}
+    
+    async def complete(self, intent: dict, record: Callable[[dict], Awaitable[dict]]) -> dict:
+        """
+        Verify the upload and pass the stored object to ``record``, which
+        returns the media document to keep on the intent. Only one request
+        can complete an intent; if ``record`` raises, the object and the
+        intent are deleted.
+        """
+        claimed = await self.collection.find_one_and_update(
+            {"intent_id": intent["intent_id"], "status": {"$in": ["pending", "uploaded"]}},
+            {"$set": {"status": "completing"}}
+        )
+        if claimed is None:
+            raise IntentRejected("Upload is in progress or already completed")
+        try:
+            stored = await self._stored(intent, claimed)
+        except BaseException:
+            with anyio.CancelScope(shield=True):
+                await self._release(intent, claimed)
+            raise
+        try:
+            media = await record(stored)
+        except Exception:
+            with anyio.CancelScope(shield=True):
+                # Nothing references the object, and the intent cannot be completed without it
+                await delete_stored([intent["key"]], intent["storage_type"])
+                await self.collection.delete_one({"intent_id": intent["intent_id"]})
+            raise
+        except BaseException:
+            with anyio.CancelScope(shield=True):
+                await self._release(intent, claimed)
+            raise
+        await self.collection.update_one(
+            {"intent_id": intent["intent_id"]},
+            {"$set": {"status": "complete", "media_id": media["media_id"]}}
+        )
+        return media
+    
+    async def _release(self, intent: dict, claimed: dict):
+        await self.collection.update_one({"intent_id": intent["intent_id"]}, {"$set": {"status": claimed["status"]}})
+    
+    async def expire(self):
+        """Delete intents past their retention, and the objects of those never completed."""
+        cutoff = datetime.now(timezone.utc) - INTENT_RETENTION
+        expired = [
+            doc async for doc in self.collection.find(
+                {"expires_at": {"$lt": cutoff}}, {"_id": 0, "intent_id": 1, "key": 1, "storage_type": 1, "status": 1}
+            )
+        ]
+        for storage_type in ("local", "s3"):
+            keys = [i["key"] for i in expired if i["storage_type"] == storage_type and i["status"] != "complete"]
+            if keys:
+                await delete_stored(keys, storage_type)
+        if expired:
+            await self.collection.delete_many({"intent_id": {"$in": [i["intent_id"] for i in expired]}})
+            logger.info(f"Expired {len(expired)} upload intents")
+
+
+# Global instance
+upload_intents = UploadIntents()
+
+
+@periodic("expire_upload_intents", EXPIRY_INTERVAL_SECONDS, exclusive=True)
+async def expire_upload_intents():
+    await upload_intents.expire()
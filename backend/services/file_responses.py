@@ -0,0 +1,133 @@
+"""Serving stored files with HTTP caching and byte ranges.
+
+``file_response`` answers conditional requests (If-None-Match,
+If-Modified-Since) with 304, single ``Range: bytes=`` requests with 206 so
+videos can seek, and everything else with the whole file. Bodies are streamed
+in ``CHUNK_SIZE`` reads off the event loop, or handed to the server with the
+ASGI ``zerocopysend`` extension (sendfile) when it offers one, so memory per
+download stays constant.
+"""
+import re
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import Optional, Tuple
+
+import anyio
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+from utils.helpers import etag_matches
+
+CHUNK_SIZE = 256 * 1024
+# Stored media names are unique per upload, so a URL's content never changes
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Inclusive ``(start, end)`` for a single byte-range header, None to serve
+    the whole file. Raises ValueError when the range cannot be satisfied.
+    """
+    if not header:
+        return None
+    match = _RANGE.match(header.strip())
+    if not match or (not match.group(1) and not match.group(2)):
+        # Multiple or malformed ranges: the full response is always acceptable
+        return None
+    first, last = match.groups()
+    if size == 0:
+        raise ValueError("Empty file")
+    if not first:
+        length = int(last)
+        if length == 0:
+            raise ValueError("Empty suffix range")
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError("Range not satisfiable")
+    return start, end
+
+
+class FileRangeResponse(Response):
+    """Streams ``[start, end]`` of a file without loading it into memory."""
+    
+    def __init__(self, path: Path, start: int, end: int, status_code: int, headers: dict, media_type: str):
+        super().__init__(status_code=status_code, headers=headers, media_type=media_type)
+        self.path, self.start, self.end = path, start, end
+        self.headers["content-length"] = str(end - start + 1)
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if scope.get("method") == "HEAD":
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+    
+        count = self.end - self.start + 1
+        async with await anyio.open_file(self.path, "rb") as f:
+            if "http.response.zerocopysend" in scope.get("extensions", {}):
+                await send({
+                    "type": "http.response.zerocopysend", "file": f.wrapped.fileno(),
+                    "offset": self.start, "count": count, "more_body": False
+                })
+                return
+            await f.seek(self.start)
+            while count > 0:
+                chunk = await f.read(min(CHUNK_SIZE, count))
+                if not chunk:
+                    break
+                count -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": count > 0})
+        if count > 0 or self.end < self.start:
+            # Empty file, or it shrank while streaming: end the body rather than hang
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+async def file_response(request: Request, path: Path, media_type: str,
+                        cache_control: str = IMMUTABLE_CACHE_CONTROL) -> Response:
+    """Conditional, range-aware response for a local file."""
+    stat = await anyio.Path(path).stat()
+    etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    last_modified = formatdate(stat.st_mtime, usegmt=True)
+    headers = {
+        "etag": etag,
+        "last-modified": last_modified,
+        "cache-control": cache_control,
+        "accept-ranges": "bytes"
+    }
+    
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    since = request.headers.get("if-modified-since")
+    if since and "if-none-match" not in request.headers:
+        try:
+            if int(stat.st_mtime) <= parsedate_to_datetime(since).timestamp():
+                return Response(status_code=304, headers=headers)
+        except (TypeError, ValueError):
+            pass
+    
+    byte_range = None
+    if_range = request.headers.get("if-range")
+    if not if_range or if_range in (etag, last_modified):
+        try:
+            byte_range = parse_range(request.headers.get("range"), stat.st_size)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, "content-range": f"bytes */{stat.st_size}"})
+    
+    if byte_range is None:
+        return FileRangeResponse(path, 0, stat.st_size - 1, 200, headers, media_type)
+    start, end = byte_range
+    headers["content-range"] = f"bytes {start}-{end}/{stat.st_size}"
+    return FileRangeResponse(path, start, end, 206, headers, media_type)
+
+
+def resolve_upload(directory: Path, filename: str) -> Optional[Path]:
+    """Path of ``filename`` directly inside ``directory``, or None if missing or outside it."""
+    path = (directory / filename).resolve()
+    if path.parent != directory.resolve() or not path.is_file() or filename.startswith("."):
+        return None
+    return path
+
@@ -0,0 +1,278 @@
+"""Geocoding through Nominatim with a two-tier cache and an upstream rate limit.
+
+Used for city autocomplete, reverse geocoding, and server-side features that
+receive free-text destinations (e.g. roster imports). Answers, including
+misses, are cached by normalized query, or for reverse lookups by a
+``REVERSE_CELL_DEGREES`` lat/lon cell, first in an in-process LRU and then in
+the ``geocode_cache`` collection (expired by a TTL index) so other workers and
+restarts reuse them. Identical lookups in flight share one upstream call.
+
+Nominatim allows one request per second per application, so upstream calls
+reserve a slot in a schedule shared by every worker (``SharedRateLimit``, one
+document in ``rate_limits``), falling back to a per-process token bucket if
+MongoDB is unreachable. Autocomplete and reverse lookups give up with
+``GeocodingBusy`` rather than queue behind a long wait; other callers (the
+roster import job) wait their turn.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, List, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from services.cache import SingleFlight, TTLCache
+from services.database import db
+from services.http_client import get_http_client
+
+logger = logging.getLogger(__name__)
+
+NOMINATIM_SEARCH_URL = "https://nominatim.openstreetmap.org/search"
+NOMINATIM_REVERSE_URL = "https://nominatim.openstreetmap.org/reverse"
+USER_AGENT = "Journeyman-Dating-App/2.0"
+CACHE_SIZE = 4096
+CACHE_TTL_SECONDS = 7 * 24 * 60 * 60
+# Local copies of shared entries are re-read from Mongo at least this often
+LOCAL_TTL_SECONDS = 24 * 60 * 60
+# ~1 km: every point in a cell resolves to the same town
+REVERSE_CELL_DEGREES = 0.01
+UPSTREAM_REQUESTS_PER_SECOND = 1.0
+AUTOCOMPLETE_MAX_WAIT_SECONDS = 3.0
+CITY_TYPES = ["city", "town", "village", "municipality", "administrative"]
+
+
+class GeocodingBusy(Exception):
+    """The upstream rate limit would make this lookup wait too long."""
+
+
+class TokenBucket:
+    """Allows ``rate`` acquisitions per second, with bursts of up to ``capacity``."""
+    
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+    
+    async def acquire(self, max_wait: Optional[float] = None) -> bool:
+        """Wait for a token; False without taking one if that would take over ``max_wait`` seconds."""
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        wait = max(0.0, (1 - self._tokens) / self.rate)
+        if max_wait is not None and wait > max_wait:
+            return False
+        # Reserve the token now, so callers queue in order while sleeping
+        self._tokens -= 1
+        if wait:
+            await asyncio.sleep(wait)
+        return True
+
+
+class SharedRateLimit:
+    """
+    ``rate`` acquisitions per second across every worker.
+    
+    The ``rate_limits`` document for ``name`` holds ``next_at``, the earliest
+    time the next caller may go. Acquiring atomically moves it one interval
+    past ``max(next_at, now)`` and sleeps until the slot it reserved.
+    """
+    
+    def __init__(self, name: str, rate: float):
+        self.name = name
+        self.interval_ms = int(1000 / rate)
+        self._fallback = TokenBucket(rate)
+    
+    @property
+    def collection(self):
+        return db.rate_limits
+    
+    async def acquire(self, max_wait: Optional[float] = None) -> bool:
+        """Wait for a slot; False without taking one if that would take over ``max_wait`` seconds."""
+        now = datetime.now(timezone.utc)
+        query = {"_id": self.name}
+        if max_wait is not None:
+            latest = now + timedelta(seconds=max_wait)
+            query["$or"] = [{"next_at": {"$lte": latest}}, {"next_at": {"$exists": False}}]
+        try:
+            doc = await self.collection.find_one_and_update(
+                query,
+                [{"$set": {"next_at": {"$add": [{"$max": ["$next_at", now]}, self.interval_ms]}}}],
+                upsert=True, return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # The document exists but its next slot is past max_wait
+            return False
+        except Exception as e:
+            logger.error(f"Shared rate limit {self.name} unavailable, limiting this worker only: {e}")
+            return await self._fallback.acquire(max_wait)
+        slot = doc["next_at"].replace(tzinfo=timezone.utc) - timedelta(milliseconds=self.interval_ms)
+        wait = (slot - now).total_seconds()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return True
+
+
+def normalize_query(query: str) -> str:
+    """Case- and whitespace-insensitive cache key for a place name."""
+    return " ".join(query.lower().replace(",", " , ").split())
+
+
+def reverse_cell(lat: float, lon: float) -> tuple:
+    """Center of the ``REVERSE_CELL_DEGREES`` cell containing a point."""
+    return (
+        round(round(lat / REVERSE_CELL_DEGREES) * REVERSE_CELL_DEGREES, 4),
+        round(round(lon / REVERSE_CELL_DEGREES) * REVERSE_CELL_DEGREES, 4)
+    )
+
+
+def city_name(address: dict, fallback: str = "") -> str:
+    return (
+        address.get("city") or
+        address.get("town") or
+        address.get("village") or
+        address.get("municipality") or
+        fallback
+    )
+
+
+def parse_cities(data: List[dict]) -> List[dict]:
+    """City suggestions from a Nominatim search, deduplicated by display name."""
+    cities = []
+    seen = set()
+    for item in data:
+        address = item.get("address", {})
+        # Filter to only include cities, towns, villages
+        if item.get("class", "") not in ["place", "boundary"] and item.get("type", "") not in CITY_TYPES:
+            continue
+        city = city_name(address, item.get("name", ""))
+        if not city:
+            continue
+        state = address.get("state", "")
+        country = address.get("country", "")
+        display_name = ", ".join(p for p in [city, state, country] if p)
+        if display_name.lower() in seen:
+            continue
+        seen.add(display_name.lower())
+        cities.append({
+            "display_name": display_name,
+            "city": city,
+            "state": state,
+            "country": country,
+            "latitude": float(item.get("lat", 0)),
+            "longitude": float(item.get("lon", 0))
+        })
+    return cities
+
+
+class Geocoder:
+    """Cached, rate-limited Nominatim client."""
+    
+    def __init__(self, cache_size: int = CACHE_SIZE, ttl: float = CACHE_TTL_SECONDS,
+                 rate: float = UPSTREAM_REQUESTS_PER_SECOND):
+        self.ttl = ttl
+        self._local = TTLCache(min(ttl, LOCAL_TTL_SECONDS), cache_size)
+        self._flight = SingleFlight()
+        self._limit = SharedRateLimit("nominatim", rate)
+    
+    @property
+    def collection(self):
+        return db.geocode_cache
+    
+    async def _cached(self, key: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        hit, value = self._local.get(key)
+        if hit:
+            return value
+        return await self._flight.do(key, lambda: self._load(key, fetch))
+    
+    async def _load(self, key: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            doc = await self.collection.find_one({"key": key}, {"_id": 0, "value": 1, "expires_at": 1})
+        except Exception as e:
+            logger.error(f"Geocode cache read failed: {e}")
+            doc = None
+        # The TTL monitor only runs once a minute, so check expiry too
+        if doc and doc["expires_at"].replace(tzinfo=timezone.utc) > datetime.now(timezone.utc):
+            self._local.set(key, doc["value"])
+            return doc["value"]
+    
+        value = await fetch()
+        self._local.set(key, value)
+        try:
+            await self.collection.update_one(
+                {"key": key},
+                {"$set": {"value": value, "expires_at": datetime.now(timezone.utc) + timedelta(seconds=self.ttl)}},
+                upsert=True
+            )
+        except Exception as e:
+            logger.error(f"Geocode cache write failed: {e}")
+        return value
+    
+    async def _nominatim(self, url: str, params: dict, max_wait: Optional[float] = None) -> Any:
+        if not await self._limit.acquire(max_wait):
+            raise GeocodingBusy("Geocoding is busy, try again shortly")
+        response = await get_http_client().get(
+            url, params={"format": "json", **params}, headers={"User-Agent": USER_AGENT}
+        )
+        response.raise_for_status()
+        return response.json()
+    
+    async def geocode(self, query: str) -> Optional[dict]:
+        """Return ``{"latitude", "longitude", "display_name"}`` for a place, or None if not found."""
+        key = normalize_query(query)
+        if not key:
+            return None
+    
+        async def fetch():
+            data = await self._nominatim(NOMINATIM_SEARCH_URL, {"q": query, "limit": 1})
+            if not data:
+                return None
+            return {
+                "latitude": float(data[0]["lat"]),
+                "longitude": float(data[0]["lon"]),
+                "display_name": data[0].get("display_name")
+            }
+    
+        return await self._cached(f"place:{key}", fetch)
+    
+    async def search_cities(self, query: str) -> List[dict]:
+        """City suggestions for autocomplete; raises ``GeocodingBusy`` when throttled."""
+        key = normalize_query(query)
+    
+        async def fetch():
+            data = await self._nominatim(
+                NOMINATIM_SEARCH_URL,
+                {"q": query, "addressdetails": 1, "limit": 15, "type": "city", "dedupe": 1},
+                max_wait=AUTOCOMPLETE_MAX_WAIT_SECONDS
+            )
+            return parse_cities(data)
+    
+        return await self._cached(f"cities:{key}", fetch)
+    
+    async def reverse(self, lat: float, lon: float) -> dict:
+        """``{"city", "state", "country", "display_name"}`` for a point, by ~1 km cell."""
+        cell_lat, cell_lon = reverse_cell(lat, lon)
+    
+        async def fetch():
+            data = await self._nominatim(
+                NOMINATIM_REVERSE_URL, {"lat": cell_lat, "lon": cell_lon, "addressdetails": 1},
+                max_wait=AUTOCOMPLETE_MAX_WAIT_SECONDS
+            )
+            address = data.get("address", {})
+            city = city_name(address)
+            state = address.get("state", "")
+            country = address.get("country", "")
+            return {
+                "display_name": ", ".join(p for p in [city, state, country] if p),
+                "city": city,
+                "state": state,
+                "country": country
+            }
+    
+        return await self._cached(f"reverse:{cell_lat},{cell_lon}", fetch)
+
+
+# Global geocoder instance
+geocoder = Geocoder()
@@ -0,0 +1,82 @@
+"""GIPHY proxy with pooled connections and cached results.
+
+Trending GIFs are cached for ``TRENDING_TTL_SECONDS``. Searches are cached by
+normalized query in an LRU of ``SEARCH_CACHE_SIZE`` entries for
+``SEARCH_TTL_SECONDS``, and identical searches in flight share one upstream
+call. Each upstream call fetches a full page of ``GIPHY_PAGE_SIZE`` results,
+so one cache entry serves every ``limit``.
+"""
+from typing import List
+
+from services.cache import CoalescingCache
+from services.database import GIPHY_API_KEY
+from services.http_client import get_http_client
+
+GIPHY_SEARCH_URL = "https://api.giphy.com/v1/gifs/search"
+GIPHY_TRENDING_URL = "https://api.giphy.com/v1/gifs/trending"
+GIPHY_PAGE_SIZE = 50
+TRENDING_TTL_SECONDS = 5 * 60
+SEARCH_TTL_SECONDS = 30 * 60
+SEARCH_CACHE_SIZE = 2048
+
+
+def normalize_gif_query(query: str) -> str:
+    """Case- and whitespace-insensitive cache key for a search."""
+    return " ".join(query.lower().split())
+
+
+def search_gif(item: dict) -> dict:
+    return {
+        "id": item["id"],
+        "title": item.get("title", "GIF"),
+        "url": item["url"],
+        "preview_url": item["images"]["fixed_width_small"]["url"],
+        "original_url": item["images"]["original"]["url"],
+        "width": item["images"]["fixed_width"]["width"],
+        "height": item["images"]["fixed_width"]["height"]
+    }
+
+
+def trending_gif(item: dict) -> dict:
+    return {
+        "id": item["id"],
+        "title": item.get("title", "GIF"),
+        "url": item["url"],
+        "preview_url": item["images"]["fixed_width_small"]["url"],
+        "original_url": item["images"]["original"]["url"]
+    }
+
+
+class GiphyClient:
+    """Cached GIPHY search and trending lookups."""
+    
+    def __init__(self):
+        self._search = CoalescingCache(SEARCH_TTL_SECONDS, SEARCH_CACHE_SIZE)
+        self._trending = CoalescingCache(TRENDING_TTL_SECONDS, 1)
+    
+    async def _fetch(self, url: str, **params) -> List[dict]:
+        response = await get_http_client().get(
+            url, params={"api_key": GIPHY_API_KEY, "limit": GIPHY_PAGE_SIZE, "rating": "pg-13", **params}
+        )
+        response.raise_for_status()
+        return response.json().get("data", [])
+    
+    async def search(self, query: str, limit: int) -> List[dict]:
+        key = normalize_gif_query(query)
+        if not key:
+            return []
+    
+        async def load():
+            return [search_gif(item) for item in await self._fetch(GIPHY_SEARCH_URL, q=key)]
+    
+        return (await self._search.get(key, load))[:limit]
+    
+    async def trending(self, limit: int) -> List[dict]:
+        async def load():
+            return [trending_gif(item) for item in await self._fetch(GIPHY_TRENDING_URL)]
+    
+        return (await self._trending.get("trending", load))[:limit]
+
+
+# Global client instance
+giphy = GiphyClient()
@@ -0,0 +1,159 @@
+"""Precomputed traveler density tiles.
+
+A periodic job bins every schedule overlapping the next N days (for each of
+``HORIZONS``) into Web Mercator tiles at zooms 0..``MAX_HEATMAP_ZOOM``, each
+tile a ``BINS_PER_TILE`` square grid weighted by traveler-days in the window.
+Only non-empty tiles are stored, as zlib-compressed ``(col, row, value)``
+uint32 triplets with a content hash as the ETag, so an unchanged tile keeps
+its ETag across rebuilds and clients revalidate with a 304.
+
+Schedules come from the in-memory overlap index, so a rebuild never scans
+``schedules``. One worker at a time builds (an exclusive periodic job), so
+tiles and their ETags come from a single view of the index, and only tiles
+whose content changed are written.
+"""
+import hashlib
+import logging
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from pymongo import DeleteOne, ReplaceOne
+from bson import Binary
+
+from services.database import db
+from services.background import periodic
+from services.overlap_index import overlap_index
+from services.change_feed import change_feed
+
+logger = logging.getLogger(__name__)
+
+HORIZONS = (1, 7, 14, 30, 60)
+MAX_HEATMAP_ZOOM = 10
+BINS_PER_TILE = 32
+MAX_MERCATOR_LAT = 85.05112878
+REBUILD_INTERVAL_SECONDS = 10 * 60
+META_TILE_ID = "meta"
+
+
+def horizon_for(days: int) -> int:
+    """Smallest precomputed horizon covering ``days``."""
+    return next((h for h in HORIZONS if h >= days), HORIZONS[-1])
+
+
+def tile_id(horizon: int, z: int, x: int, y: int) -> str:
+    return f"{horizon}/{z}/{x}/{y}"
+
+
+def mercator(lat: np.ndarray, lon: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Project degrees to unit Web Mercator coordinates in [0, 1)."""
+    lat = np.radians(np.clip(lat, -MAX_MERCATOR_LAT, MAX_MERCATOR_LAT))
+    x = (lon + 180.0) / 360.0
+    y = (1.0 - np.log(np.tan(lat) + 1.0 / np.cos(lat)) / np.pi) / 2.0
+    return np.clip(x, 0, 1 - 1e-12), np.clip(y, 0, 1 - 1e-12)
+
+
+def encode_tile(cols: np.ndarray, rows: np.ndarray, values: np.ndarray) -> Tuple[bytes, str]:
+    """Compress a tile's non-empty bins; returns ``(data, etag)``."""
+    raw = np.stack([cols, rows, values]).astype("<u4").tobytes()
+    return zlib.compress(raw), hashlib.sha1(raw).hexdigest()[:16]
+
+
+def decode_tile(data: bytes) -> List[List[int]]:
+    """``[[col, row, value], ...]`` for a stored tile."""
+    return np.frombuffer(zlib.decompress(data), dtype="<u4").reshape(3, -1).T.tolist()
+
+
+def bin_tiles(lat: np.ndarray, lon: np.ndarray, weights: np.ndarray,
+              max_zoom: int = MAX_HEATMAP_ZOOM, bins: int = BINS_PER_TILE) -> Dict[Tuple[int, int, int], tuple]:
+    """
+    Sparse 2-D histograms of the points at every zoom level.
+    
+    Returns ``{(z, x, y): (cols, rows, values)}`` for non-empty tiles. A dense
+    grid at zoom 10 would be 32768 bins square, so each level is histogrammed
+    over occupied bins only (``np.unique`` + ``np.bincount``) and then split
+    into tiles.
+    """
+    tiles: Dict[Tuple[int, int, int], tuple] = {}
+    if len(lat) == 0:
+        return tiles
+    mx, my = mercator(np.asarray(lat, dtype=float), np.asarray(lon, dtype=float))
+    for z in range(max_zoom + 1):
+        size = bins << z
+        bx = (mx * size).astype(np.int64)
+        by = (my * size).astype(np.int64)
+        occupied, inverse = np.unique(by * size + bx, return_inverse=True)
+        values = np.rint(np.bincount(inverse, weights=weights)).astype(np.int64)
+        gx, gy = occupied % size, occupied // size
+        # Group bins by tile: sort by tile id, then split where it changes
+        tile_keys = (gy // bins) * (size // bins) + (gx // bins)
+        order = np.argsort(tile_keys, kind="stable")
+        tile_keys, gx, gy, values = tile_keys[order], gx[order], gy[order], values[order]
+        starts = np.flatnonzero(np.r_[True, np.diff(tile_keys) != 0])
+        for start, end in zip(starts, np.r_[starts[1:], len(tile_keys)]):
+            x, y = int(gx[start] // bins), int(gy[start] // bins)
+            tiles[(z, x, y)] = (gx[start:end] % bins, gy[start:end] % bins, values[start:end])
+    return tiles
+
+
+class HeatmapBuilder:
+    """Builds and stores the density tiles for every horizon."""
+    
+    @property
+    def collection(self):
+        return db.heatmap_tiles
+    
+    def points(self, horizon: int, today: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Destinations overlapping [today, today + horizon] weighted by days inside that window."""
+        start = today or datetime.now(timezone.utc).strftime("%Y-%m-%d")
+        end = (datetime.strptime(start, "%Y-%m-%d") + timedelta(days=horizon)).strftime("%Y-%m-%d")
+        schedules = overlap_index.schedules_between(start, end)
+        if not schedules:
+            return np.empty(0), np.empty(0), np.empty(0)
+        lat = np.array([s["latitude"] for s in schedules], dtype=float)
+        lon = np.array([s["longitude"] for s in schedules], dtype=float)
+        first = np.array([max(s["start_date"][:10], start) for s in schedules], dtype="datetime64[D]")
+        last = np.array([min(s["end_date"][:10], end) for s in schedules], dtype="datetime64[D]")
+        return lat, lon, (last - first).astype(np.int64) + 1
+    
+    async def rebuild(self):
+        """Recompute all tiles, writing only those that changed and dropping emptied ones."""
+        await overlap_index.ensure_loaded()
+        await change_feed.catch_up()
+        existing = {
+            doc["tile_id"]: doc["etag"]
+            async for doc in self.collection.find({"tile_id": {"$ne": META_TILE_ID}}, {"_id": 0, "tile_id": 1, "etag": 1})
+        }
+        now = datetime.now(timezone.utc)
+        writes, seen = [], set()
+        maxima: Dict[str, Dict[str, int]] = {}
+        for horizon in HORIZONS:
+            lat, lon, weights = self.points(horizon)
+            maxima[str(horizon)] = {}
+            for (z, x, y), (cols, rows, values) in bin_tiles(lat, lon, weights).items():
+                key = tile_id(horizon, z, x, y)
+                seen.add(key)
+                level_max = maxima[str(horizon)]
+                level_max[str(z)] = max(level_max.get(str(z), 0), int(values.max()))
+                data, etag = encode_tile(cols, rows, values)
+                if existing.get(key) != etag:
+                    writes.append(ReplaceOne({"tile_id": key}, {
+                        "tile_id": key, "horizon": horizon, "z": z, "x": x, "y": y,
+                        "etag": etag, "data": Binary(data), "computed_at": now
+                    }, upsert=True))
+        writes.extend(DeleteOne({"tile_id": key}) for key in existing.keys() - seen)
+        writes.append(ReplaceOne({"tile_id": META_TILE_ID}, {
+            "tile_id": META_TILE_ID, "generated_at": now.isoformat(), "max": maxima
+        }, upsert=True))
+        await self.collection.bulk_write(writes, ordered=False)
+        logger.info(f"Heatmap rebuilt: {len(seen)} tiles, {len(writes) - 1} written or removed")
+
+
+# Global builder instance
+heatmap_builder = HeatmapBuilder()
+
+
+@periodic("rebuild_heatmap_tiles", REBUILD_INTERVAL_SECONDS, run_at_start=True, exclusive=True)
+async def rebuild_heatmap_tiles():
+    await heatmap_builder.rebuild()
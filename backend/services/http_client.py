@@ -0,0 +1,29 @@
+"""Shared outbound HTTP client.
+
+Third-party APIs (GIPHY, Nominatim) are called through one ``httpx.AsyncClient``
+for the app's lifetime, so connections are kept alive and reused instead of
+paying a TCP and TLS handshake on every request.
+"""
+from typing import Optional
+
+import httpx
+
+HTTP_TIMEOUT = httpx.Timeout(10.0, connect=5.0)
+HTTP_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=60)
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """The shared client, created on first use."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(timeout=HTTP_TIMEOUT, limits=HTTP_LIMITS)
+    return _client
+
+
+async def close_http_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
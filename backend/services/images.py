@@ -0,0 +1,140 @@
+"""Resized photo variants.
+
+Each uploaded photo gets ``VARIANT_SIZES`` renditions (longest side, never
+upscaled) as WebP and JPEG, with EXIF orientation applied and all metadata
+stripped, plus a tiny blurred JPEG as a data URI placeholder to show while
+the real image loads. Decoding and encoding are CPU-bound, so they run in a
+process pool rather than on the event loop. The result is kept on the media
+document and, for profile and gallery photos, in the owner's
+``photo_variants``::
+
+    {"url": original, "width", "height", "placeholder": "data:image/jpeg;base64,...",
+     "sizes": {"64": {"webp": url, "jpeg": url}, "256": {...}, "1080": {...}}}
+"""
+import asyncio
+import base64
+import io
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from PIL import Image, ImageFilter, ImageOps, UnidentifiedImageError
+
+from services.database import db
+from services.storage import read_stored, store_bytes
+
+logger = logging.getLogger(__name__)
+
+VARIANT_SIZES = (64, 256, 1080)
+PLACEHOLDER_SIZE = 16
+# Photo formats that get variants; GIFs are left alone to keep their animation
+VARIANT_CONTENT_TYPES = ("image/jpeg", "image/png", "image/webp")
+IMAGE_WORKERS = int(os.environ.get("IMAGE_WORKERS", "2"))
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def render_variants(data: bytes) -> dict:
+    """Decode, orient and resize an image; returns encoded bytes for every size and format."""
+    image = Image.open(io.BytesIO(data))
+    # Full size as displayed: orientations 5-8 are rotated a quarter turn
+    width, height = image.size if image.getexif().get(0x0112, 1) < 5 else image.size[::-1]
+    # JPEGs can decode straight to a reduced scale, which is far cheaper for camera photos
+    image.draft("RGB", (max(VARIANT_SIZES), max(VARIANT_SIZES)))
+    image = ImageOps.exif_transpose(image)
+    has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+    image = image.convert("RGBA" if has_alpha else "RGB")
+    
+    def flatten(img: Image.Image) -> Image.Image:
+        if img.mode != "RGBA":
+            return img
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        background.paste(img, mask=img.getchannel("A"))
+        return background
+    
+    sizes = {}
+    for size in VARIANT_SIZES:
+        resized = image.copy()
+        resized.thumbnail((size, size), Image.LANCZOS)
+        webp, jpeg = io.BytesIO(), io.BytesIO()
+        # Saved without exif/icc arguments, so no metadata carries over
+        resized.save(webp, "WEBP", quality=80, method=4)
+        flatten(resized).save(jpeg, "JPEG", quality=82, optimize=True, progressive=True)
+        sizes[str(size)] = {"webp": webp.getvalue(), "jpeg": jpeg.getvalue()}
+    
+    tiny = flatten(image.copy())
+    tiny.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE))
+    placeholder = io.BytesIO()
+    tiny.filter(ImageFilter.GaussianBlur(1)).save(placeholder, "JPEG", quality=40)
+    return {
+        "width": width,
+        "height": height,
+        "sizes": sizes,
+        "placeholder": "data:image/jpeg;base64," + base64.b64encode(placeholder.getvalue()).decode()
+    }
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # Spawned rather than forked: the server process has threads (Mongo, S3) that fork would copy mid-state
+        _pool = ProcessPoolExecutor(max_workers=IMAGE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def shutdown_image_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+async def process_image(data: bytes) -> dict:
+    """``render_variants`` in the worker process pool."""
+    return await asyncio.get_running_loop().run_in_executor(_get_pool(), render_variants, data)
+
+
+def variant_key(key: str, size: str, fmt: str) -> str:
+    base = key.rsplit(".", 1)[0]
+    return f"{base}_{size}.{fmt}"
+
+
+async def build_variants(media: dict) -> Optional[dict]:
+    """
+    Render, store and record the variants for a media document; None if the
+    file is not a readable image.
+    
+    Idempotent: a rerun overwrites the same keys and replaces the recorded entry.
+    Media deduplicated onto an object that already has variants reuses them.
+    """
+    variants = media.get("variants")
+    if not variants:
+        data = await read_stored(media["filename"], media["storage_type"])
+        try:
+            rendered = await process_image(data)
+        except (UnidentifiedImageError, Image.DecompressionBombError) as e:
+            logger.warning(f"Skipping variants for {media['media_id']}: {e}")
+            return None
+        sizes = {}
+        for size, formats in rendered["sizes"].items():
+            sizes[size] = {}
+            for fmt, content in formats.items():
+                stored = await store_bytes(content, variant_key(media["filename"], size, fmt), f"image/{fmt}")
+                sizes[size][fmt] = stored["url"]
+        variants = {
+            "url": media["url"],
+            "width": rendered["width"],
+            "height": rendered["height"],
+            "placeholder": rendered["placeholder"],
+            "sizes": sizes
+        }
+        # Every record sharing the object gets them, so later duplicates skip rendering
+        await db.media.update_many({"filename": media["filename"]}, {"$set": {"variants": variants}})
+        logger.info(f"Built {len(sizes)} variants for {media['media_id']}")
+    # Only kept on the profile while the photo is still in use there
+    in_use = {"user_id": media["user_id"], "$or": [{"photos": media["url"]}, {"profile_photo": media["url"]}]}
+    await db.users.update_one(in_use, {"$pull": {"photo_variants": {"url": media["url"]}}})
+    await db.users.update_one(in_use, {"$push": {"photo_variants": variants}})
+    return variants
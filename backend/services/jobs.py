@@ -0,0 +1,170 @@
+"""Durable background jobs backed by the ``jobs`` collection.
+
+Request handlers call ``job_queue.enqueue(kind, payload)`` and return. Every API
+worker runs a poller that claims due jobs with an atomic ``find_one_and_update``
+and holds them under a lease; a job whose worker dies is picked up again once
+its lease expires. Failures are retried with exponential backoff up to
+``MAX_ATTEMPTS``, and a job whose worker died during its last attempt is
+marked failed. Handlers may therefore run more than once and must be
+idempotent.
+"""
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timezone, timedelta
+from typing import Awaitable, Callable, Dict, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from services.database import db
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 5
+LEASE_SECONDS = 60
+POLL_INTERVAL_SECONDS = 5
+RETRY_BASE_SECONDS = 10
+
+_handlers: Dict[str, Callable[[dict], Awaitable]] = {}
+
+
+def job_handler(kind: str):
+    """Register a coroutine function as the handler for jobs of ``kind``."""
+    def decorator(func: Callable[[dict], Awaitable]):
+        _handlers[kind] = func
+        return func
+    return decorator
+
+
+class JobQueue:
+    """MongoDB-backed job queue with leases and retries."""
+    
+    def __init__(self, poll_interval: float = POLL_INTERVAL_SECONDS, lease_seconds: float = LEASE_SECONDS,
+                 max_attempts: int = MAX_ATTEMPTS):
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._worker: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+    
+    @property
+    def collection(self):
+        return db.jobs
+    
+    async def enqueue(self, kind: str, payload: dict, job_id: Optional[str] = None) -> str:
+        """
+        Persist a job and wake the local worker.
+    
+        Passing a deterministic ``job_id`` makes enqueueing idempotent: a job
+        that already exists is left as it is.
+        """
+        job_id = job_id or f"job_{uuid.uuid4().hex[:12]}"
+        now = datetime.now(timezone.utc)
+        try:
+            await self.collection.insert_one({
+                "job_id": job_id,
+                "kind": kind,
+                "payload": payload,
+                "status": "pending",
+                "attempts": 0,
+                "run_at": now,
+                "created_at": now
+            })
+        except DuplicateKeyError:
+            pass
+        if self._wakeup:
+            self._wakeup.set()
+        return job_id
+    
+    def start(self):
+        """Start the polling worker on the running loop (idempotent)."""
+        if self._worker and not self._worker.done():
+            return
+        self._wakeup = asyncio.Event()
+        self._worker = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        if self._worker:
+            self._worker.cancel()
+            await asyncio.gather(self._worker, return_exceptions=True)
+            self._worker = None
+    
+    async def _claim(self) -> Optional[dict]:
+        now = datetime.now(timezone.utc)
+        return await self.collection.find_one_and_update(
+            {"$or": [
+                {"status": "pending", "run_at": {"$lte": now}},
+                {"status": "running", "lease_until": {"$lt": now}, "attempts": {"$lt": self.max_attempts}}
+            ]},
+            {"$set": {"status": "running", "lease_until": now + timedelta(seconds=self.lease_seconds)},
+             "$inc": {"attempts": 1}},
+            projection={"_id": 0},
+            sort=[("run_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+    
+    async def fail_abandoned(self) -> int:
+        """Mark failed the jobs whose lease expired on their last attempt; returns how many."""
+        result = await self.collection.update_many(
+            {"status": "running", "lease_until": {"$lt": datetime.now(timezone.utc)},
+             "attempts": {"$gte": self.max_attempts}},
+            {"$set": {"status": "failed", "last_error": "Worker stopped during the last attempt"},
+             "$unset": {"lease_until": ""}}
+        )
+        if result.modified_count:
+            logger.error(f"Marked {result.modified_count} abandoned jobs failed")
+        return result.modified_count
+    
+    async def run_pending(self) -> int:
+        """Claim and run due jobs until none are left. Returns how many ran."""
+        await self.fail_abandoned()
+        ran = 0
+        while True:
+            job = await self._claim()
+            if job is None:
+                return ran
+            await self._execute(job)
+            ran += 1
+    
+    async def _execute(self, job: dict):
+        handler = _handlers.get(job["kind"])
+        try:
+            if handler is None:
+                raise LookupError(f"No handler registered for job kind {job['kind']}")
+            await handler(job)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            gave_up = job["attempts"] >= self.max_attempts
+            retry_at = datetime.now(timezone.utc) + timedelta(seconds=RETRY_BASE_SECONDS * 2 ** (job["attempts"] - 1))
+            await self.collection.update_one(
+                {"job_id": job["job_id"]},
+                {"$set": {"status": "failed" if gave_up else "pending", "run_at": retry_at, "last_error": str(e)},
+                 "$unset": {"lease_until": ""}}
+            )
+            logger.exception(f"Job {job['job_id']} ({job['kind']}) failed on attempt {job['attempts']}: {e}")
+            return
+    
+        await self.collection.update_one(
+            {"job_id": job["job_id"]},
+            {"$set": {"status": "done", "finished_at": datetime.now(timezone.utc)}, "$unset": {"lease_until": ""}}
+        )
+    
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                await self.run_pending()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception(f"Job poller failed: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+
+# Global queue instance
+job_queue = JobQueue()
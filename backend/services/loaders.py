@@ -0,0 +1,117 @@
+"""Request-scoped batching loaders.
+
+Routes that decorate a list of schedules or matches with user profiles used to
+call ``db.users.find_one`` once per row. A ``ProfileLoader`` collects every
+``load`` issued in the same event-loop tick and resolves them with a single
+``$in`` query, caching results for the rest of the request.
+"""
+import asyncio
+from typing import Dict, Iterable, List, Optional
+
+from fastapi import Request
+
+from services.database import db
+
+# Fields needed to render a profile card; never includes email or password_hash
+PROFILE_CARD_PROJECTION = {
+    "_id": 0,
+    "user_id": 1,
+    "name": 1,
+    "age": 1,
+    "bio": 1,
+    "profession": 1,
+    "location": 1,
+    "interests": 1,
+    "picture": 1,
+    "profile_photo": 1,
+    "photos": 1,
+    "photo_variants": 1,
+    "verified": 1,
+    "online": 1,
+    "last_active": 1
+}
+
+
+def card_photos(user: dict) -> dict:
+    """
+    Swap a listed user's photos for their resized variants where built: 256px
+    for the profile photo, 1080px for the gallery. The URLs are the JPEGs every
+    client can show; ``profile_photo_sources`` and ``photo_sources`` map each
+    format to its URL so clients can prefer WebP. Drops ``photo_variants``.
+    """
+    variants = {v["url"]: v for v in user.pop("photo_variants", None) or []}
+    photo = variants.get(user.get("profile_photo"))
+    if photo:
+        user["profile_photo_sources"] = dict(photo["sizes"]["256"])
+        user["profile_photo"] = photo["sizes"]["256"]["jpeg"]
+        user["profile_photo_placeholder"] = photo["placeholder"]
+    if user.get("photos") and variants:
+        sources = [dict(variants[url]["sizes"]["1080"]) if url in variants else None for url in user["photos"]]
+        user["photos"] = [s["jpeg"] if s else url for s, url in zip(sources, user["photos"])]
+        user["photo_sources"] = sources
+    return user
+
+
+class ProfileLoader:
+    """DataLoader-style batcher for user profile cards."""
+    
+    def __init__(self, projection: Optional[dict] = None, collection=None):
+        self.projection = projection or PROFILE_CARD_PROJECTION
+        self._collection = collection
+        self._futures: Dict[str, asyncio.Future] = {}
+        self._pending: List[str] = []
+        self.query_count = 0
+    
+    @property
+    def collection(self):
+        return self._collection if self._collection is not None else db.users
+    
+    def _enqueue(self, user_id: str) -> asyncio.Future:
+        future = self._futures.get(user_id)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self._futures[user_id] = loop.create_future()
+            if not self._pending:
+                # Runs after every coroutine already scheduled this tick has had a chance to enqueue
+                loop.create_task(self._dispatch())
+            self._pending.append(user_id)
+        return future
+    
+    async def _dispatch(self):
+        user_ids, self._pending = self._pending, []
+        try:
+            self.query_count += 1
+            docs = await self.collection.find(
+                {"user_id": {"$in": user_ids}}, self.projection
+            ).to_list(len(user_ids))
+        except Exception as e:
+            for user_id in user_ids:
+                self._futures.pop(user_id).set_exception(e)
+            return
+    
+        found = {doc["user_id"]: card_photos(doc) for doc in docs}
+        for user_id in user_ids:
+            self._futures[user_id].set_result(found.get(user_id))
+    
+    async def load(self, user_id: str) -> Optional[dict]:
+        """Return one profile card (a private copy), or None if the user doesn't exist."""
+        return await self._resolve(self._enqueue(user_id))
+    
+    async def load_many(self, user_ids: Iterable[str]) -> List[Optional[dict]]:
+        """Return profile cards in the same order as ``user_ids``."""
+        futures = [self._enqueue(user_id) for user_id in user_ids]
+        return [await self._resolve(future) for future in futures]
+    
+    @staticmethod
+    async def _resolve(future: asyncio.Future) -> Optional[dict]:
+        doc = await future
+        # Callers annotate the dict they get back, so each gets its own copy
+        return dict(doc) if doc is not None else None
+
+
+def get_profile_loader(request: Request) -> ProfileLoader:
+    """Return the profile loader for this request, creating it on first use."""
+    loader = getattr(request.state, "profile_loader", None)
+    if loader is None:
+        loader = request.state.profile_loader = ProfileLoader()
+    return loader
@@ -0,0 +1,240 @@
+"""Hierarchical grid of user locations for server-side map clustering.
+
+Every located, onboarded user is counted in one Web Mercator grid cell per
+zoom level (cells are ``CLUSTER_CELL_PIXELS`` on screen), each keeping a
+count, coordinate sums for the centroid, and how many are hot travelers. A
+map viewport therefore reads only the few hundred cells it covers at its zoom,
+whatever the number of users behind them. At ``MARKER_ZOOM`` and closer, a
+finer grid of member sets yields individual markers instead.
+
+Location writes update the grid in place; hot-traveler flags follow schedule
+writes. Other workers' writes arrive through the change feed, and the whole
+grid is rebuilt periodically as a backstop.
+"""
+import asyncio
+import logging
+from datetime import datetime, timezone
+from math import cos, floor, log, pi, radians, tan
+from typing import Dict, List, Optional, Set, Tuple
+
+from services.database import db
+from services.background import periodic
+from services.change_feed import change_feed
+from services.recurrence import occurrences, active_schedules_filter
+
+logger = logging.getLogger(__name__)
+
+CLUSTER_CELL_PIXELS = 64
+MARKER_ZOOM = 13
+MAX_MERCATOR_LAT = 85.05112878
+REBUILD_INTERVAL_SECONDS = 5 * 60
+
+Cell = Tuple[int, int]
+
+
+def grid_size(zoom: int) -> int:
+    """Cells per axis at a zoom level."""
+    return (256 // CLUSTER_CELL_PIXELS) << zoom
+
+
+def grid_cell(lat: float, lon: float, zoom: int) -> Cell:
+    """Web Mercator ``(x, y)`` cell containing the point."""
+    n = grid_size(zoom)
+    lat = max(-MAX_MERCATOR_LAT, min(MAX_MERCATOR_LAT, lat))
+    x = floor((lon + 180) / 360 * n)
+    y = floor((1 - log(tan(radians(lat)) + 1 / cos(radians(lat))) / pi) / 2 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+class MapClusterIndex:
+    """Per-zoom cell aggregates plus member sets at ``MARKER_ZOOM``."""
+    
+    def __init__(self):
+        # Aggregates are [count, lat_sum, lon_sum, hot_count]
+        self._levels: List[Dict[Cell, list]] = [{} for _ in range(MARKER_ZOOM)]
+        self._members: Dict[Cell, Set[str]] = {}
+        self._users: Dict[str, Tuple[float, float, bool]] = {}
+        self._loaded = False
+        self._lock = asyncio.Lock()
+        # Writes that land while a rebuild is reading MongoDB, replayed before the swap
+        self._journal: Optional[List[Tuple[str, tuple]]] = None
+    
+    def __len__(self) -> int:
+        return len(self._users)
+    
+    def _apply(self, user_id: str, lat: float, lon: float, hot: bool, sign: int):
+        for zoom, cells in enumerate(self._levels):
+            cell = grid_cell(lat, lon, zoom)
+            agg = cells.setdefault(cell, [0, 0.0, 0.0, 0])
+            agg[0] += sign
+            agg[1] += sign * lat
+            agg[2] += sign * lon
+            agg[3] += sign * hot
+            if agg[0] <= 0:
+                del cells[cell]
+        cell = grid_cell(lat, lon, MARKER_ZOOM)
+        if sign > 0:
+            self._members.setdefault(cell, set()).add(user_id)
+        else:
+            members = self._members.get(cell, set())
+            members.discard(user_id)
+            if not members:
+                self._members.pop(cell, None)
+    
+    def set_location(self, user_id: str, lat: Optional[float], lon: Optional[float], hot: Optional[bool] = None):
+        """Place, move or (with no coordinates) drop a user; ``hot=None`` keeps the current flag."""
+        if self._journal is not None:
+            self._journal.append(("set_location", (user_id, lat, lon, hot)))
+        previous = self._users.pop(user_id, None)
+        if previous:
+            self._apply(user_id, *previous, sign=-1)
+        if lat is None or lon is None:
+            return
+        if hot is None:
+            hot = previous[2] if previous else False
+        self._users[user_id] = (float(lat), float(lon), bool(hot))
+        self._apply(user_id, float(lat), float(lon), bool(hot), sign=1)
+    
+    def set_hot(self, user_id: str, hot: bool):
+        if self._journal is not None:
+            self._journal.append(("set_hot", (user_id, hot)))
+        current = self._users.get(user_id)
+        if current and current[2] != hot:
+            self.set_location(user_id, current[0], current[1], hot)
+    
+    def update_user(self, user: dict):
+        """Sync a user document after a profile or location write."""
+        if not user.get("onboarding_complete"):
+            self.set_location(user["user_id"], None, None)
+        else:
+            self.set_location(user["user_id"], user.get("latitude"), user.get("longitude"))
+    
+    def _cells_in(self, cells: dict, south: float, west: float, north: float, east: float, zoom: int):
+        """Keys of ``cells`` inside the bounding box (``west > east`` crosses the antimeridian)."""
+        n = grid_size(zoom)
+        x_west, y_top = grid_cell(north, west, zoom)
+        x_east, y_bottom = grid_cell(south, east, zoom)
+        x_ranges = [(x_west, x_east)] if west <= east else [(x_west, n - 1), (0, x_east)]
+        area = (y_bottom - y_top + 1) * sum(hi - lo + 1 for lo, hi in x_ranges)
+        if area > len(cells):
+            # Wide viewport over a sparse level: scanning the populated cells is cheaper
+            return [
+                cell for cell in cells
+                if y_top <= cell[1] <= y_bottom and any(lo <= cell[0] <= hi for lo, hi in x_ranges)
+            ]
+        return [
+            (x, y) for lo, hi in x_ranges for x in range(lo, hi + 1)
+            for y in range(y_top, y_bottom + 1) if (x, y) in cells
+        ]
+    
+    def clusters(self, south: float, west: float, north: float, east: float, zoom: int,
+                 exclude_user_id: Optional[str] = None) -> List[dict]:
+        """Clusters covering the viewport at ``zoom`` (capped below ``MARKER_ZOOM``), largest first."""
+        zoom = max(0, min(int(zoom), MARKER_ZOOM - 1))
+        cells = self._levels[zoom]
+        excluded = self._users.get(exclude_user_id) if exclude_user_id else None
+        excluded_cell = grid_cell(excluded[0], excluded[1], zoom) if excluded else None
+    
+        found = []
+        for cell in self._cells_in(cells, south, west, north, east, zoom):
+            count, lat_sum, lon_sum, hot = cells[cell]
+            if cell == excluded_cell:
+                count, lat_sum, lon_sum, hot = count - 1, lat_sum - excluded[0], lon_sum - excluded[1], hot - excluded[2]
+                if count <= 0:
+                    continue
+            found.append({
+                "id": f"{zoom}/{cell[0]}/{cell[1]}",
+                "latitude": round(lat_sum / count, 5),
+                "longitude": round(lon_sum / count, 5),
+                "count": count,
+                "hot_travelers_count": hot
+            })
+        found.sort(key=lambda c: -c["count"])
+        return found
+    
+    def members(self, south: float, west: float, north: float, east: float,
+                exclude_user_id: Optional[str] = None) -> List[Tuple[str, float, float, bool]]:
+        """``(user_id, lat, lon, hot)`` for every user inside the viewport."""
+        found = []
+        for cell in self._cells_in(self._members, south, west, north, east, MARKER_ZOOM):
+            for user_id in self._members[cell]:
+                lat, lon, hot = self._users[user_id]
+                inside_lon = west <= lon <= east if west <= east else (lon >= west or lon <= east)
+                if user_id != exclude_user_id and south <= lat <= north and inside_lon:
+                    found.append((user_id, lat, lon, hot))
+        return found
+    
+    async def refresh_hot(self, user_id: str):
+        """Recompute one user's hot-traveler flag after their schedules change."""
+        today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+        candidates = await db.schedules.find(
+            {"user_id": user_id, **active_schedules_filter(today)}, {"_id": 0}
+        ).to_list(None)
+        self.set_hot(user_id, any(occurrences(s, today, today) for s in candidates))
+    
+    async def reload_users(self, user_ids: List[str]):
+        """Re-read users' locations after another worker changed them; missing users are dropped."""
+        found = set()
+        async for user in db.users.find(
+            {"user_id": {"$in": user_ids}},
+            {"_id": 0, "user_id": 1, "onboarding_complete": 1, "latitude": 1, "longitude": 1}
+        ):
+            found.add(user["user_id"])
+            self.update_user(user)
+        for user_id in set(user_ids) - found:
+            self.set_location(user_id, None, None)
+    
+    async def ensure_loaded(self):
+        if not self._loaded:
+            async with self._lock:
+                if not self._loaded:
+                    await self.rebuild()
+    
+    async def rebuild(self):
+        """Reload every located, onboarded user and today's hot travelers, then swap in."""
+        fresh = MapClusterIndex()
+        self._journal = []
+        try:
+            today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+            hot = set()
+            async for schedule in db.schedules.find(
+                active_schedules_filter(today),
+                {"_id": 0, "user_id": 1, "start_date": 1, "end_date": 1, "recurrence": 1}
+            ):
+                if occurrences(schedule, today, today):
+                    hot.add(schedule["user_id"])
+            async for user in db.users.find(
+                {"onboarding_complete": True, "latitude": {"$ne": None}, "longitude": {"$ne": None}},
+                {"_id": 0, "user_id": 1, "latitude": 1, "longitude": 1}
+            ):
+                fresh.set_location(user["user_id"], user["latitude"], user["longitude"], user["user_id"] in hot)
+            for op, args in self._journal:
+                getattr(fresh, op)(*args)
+        finally:
+            self._journal = None
+        self._levels, self._members, self._users = fresh._levels, fresh._members, fresh._users
+        self._loaded = True
+        logger.info(f"Map cluster index loaded with {len(self)} users")
+
+
+# Global index instance
+map_cluster_index = MapClusterIndex()
+
+
+@periodic("rebuild_map_cluster_index", REBUILD_INTERVAL_SECONDS)
+async def rebuild_map_cluster_index():
+    await map_cluster_index.rebuild()
+
+
+async def apply_user_changes(entries: List[dict]):
+    await map_cluster_index.reload_users(list({entry["id"] for entry in entries}))
+
+
+async def apply_schedule_changes(entries: List[dict]):
+    # A schedule write can change its owner's hot-traveler flag
+    for user_id in {entry["data"].get("user_id") for entry in entries} - {None}:
+        await map_cluster_index.refresh_hot(user_id)
+
+
+change_feed.subscribe("user", apply_user_changes)
+change_feed.subscribe("schedule", apply_schedule_changes)
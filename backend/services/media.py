@@ -0,0 +1,295 @@
+"""Media records, deduplication, garbage collection and inline photo migration.
+
+``record_media`` writes the ``media`` document for a stored upload and
+``queue_variants`` schedules its resized variants; upload routes and
+background jobs share them. Uploads are hashed as they are stored, and an
+upload whose content the same user already stored is dropped in favour of the
+existing object (and its variants). Dedup never crosses users, so an object's
+URL reveals nothing about who else uploaded the same content.
+
+Objects are never deleted when a photo is removed or replaced. Instead a
+periodic collector, run by one worker at a time, counts references to each
+stored object from ``users.photos``, ``users.profile_photo``,
+``messages.media_url`` and the sender/match photos copied onto notifications,
+and deletes, in batches, those with none whose newest media record is older than
+``MEDIA_GC_GRACE`` (long enough for an upload to be attached or sent).
+Records are deleted before objects, and an object is only deleted if no
+record was added for it meanwhile, so a concurrent dedup onto it is safe.
+
+Photos used to be saved on the user document as base64 data URIs, which made
+every user read carry megabytes. ``store_inline_photo`` puts one such photo
+into media storage instead, and a periodic migration, run by one worker at a
+time, replaces any data URIs still left in ``users.photos``/``profile_photo``
+with media URLs.
+"""
+import base64
+import binascii
+import logging
+import re
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from services.database import db
+from services.background import periodic
+from services.jobs import job_queue
+from services.storage import store_bytes, delete_stored
+from services.images import VARIANT_CONTENT_TYPES, variant_key
+
+logger = logging.getLogger(__name__)
+
+PHOTO_TYPES = ["image/jpeg", "image/png", "image/webp"]
+MAX_PHOTO_SIZE = 10 * 1024 * 1024
+MIGRATION_INTERVAL_SECONDS = 6 * 60 * 60
+MIGRATION_BATCH_SIZE = 20
+MEDIA_GC_GRACE = timedelta(hours=24)
+MEDIA_GC_INTERVAL_SECONDS = 60 * 60
+MEDIA_GC_BATCH_SIZE = 500
+
+_DATA_URI = re.compile(r"^data:([\w.+-]+/[\w.+-]+);base64,", re.IGNORECASE)
+_EXTENSIONS = {"image/jpeg": "jpg", "image/png": "png", "image/webp": "webp"}
+
+
+def is_inline_photo(photo) -> bool:
+    return isinstance(photo, str) and photo.startswith("data:")
+
+
+def decode_photo_data(data_uri: str) -> Tuple[str, bytes]:
+    """``(content_type, bytes)`` of a base64 photo data URI; ValueError if it is not one."""
+    match = _DATA_URI.match(data_uri)
+    if not match:
+        raise ValueError("Photo must be a base64 data URI")
+    content_type = match.group(1).lower()
+    if content_type == "image/jpg":
+        content_type = "image/jpeg"
+    if content_type not in PHOTO_TYPES:
+        raise ValueError("Invalid format. Use JPEG, PNG, or WebP")
+    if (len(data_uri) - match.end()) * 3 // 4 > MAX_PHOTO_SIZE:
+        raise ValueError("Photo must be under 10MB")
+    try:
+        data = base64.b64decode(data_uri[match.end():], validate=True)
+    except binascii.Error:
+        raise ValueError("Photo data is not valid base64")
+    if not data:
+        raise ValueError("Photo is empty")
+    return content_type, data
+
+
+async def record_media(user_id: str, key: str, media_type: str, content_type: str, stored: dict) -> dict:
+    """
+    Save the media record for a stored upload.
+    
+    If the user already stored the same content, the new object is deleted and
+    the record points at the existing one; use the returned ``url``.
+    """
+    media_doc = {
+        "media_id": f"media_{uuid.uuid4().hex[:12]}",
+        "user_id": user_id,
+        "filename": key,
+        "media_type": media_type,
+        "content_type": content_type,
+        "size": stored["size"],
+        "url": stored["url"],
+        "storage_type": stored["storage_type"],
+        "sha256": stored.get("sha256"),
+        "created_at": datetime.now(timezone.utc).isoformat()
+    }
+    existing = None
+    if stored.get("sha256"):
+        existing = await db.media.find_one(
+            {
+                "user_id": user_id, "sha256": stored["sha256"],
+                "storage_type": stored["storage_type"], "filename": {"$ne": key}
+            },
+            {"_id": 0, "filename": 1, "url": 1, "variants": 1}
+        )
+    if existing:
+        media_doc.update(filename=existing["filename"], url=existing["url"])
+        if existing.get("variants"):
+            media_doc["variants"] = existing["variants"]
+    await db.media.insert_one(media_doc)
+    media_doc.pop("_id", None)
+    
+    if existing:
+        # The collector deletes records before objects: while another record remains, so does the object
+        still_stored = await db.media.find_one(
+            {"filename": existing["filename"], "media_id": {"$ne": media_doc["media_id"]}}, {"_id": 1}
+        )
+        if still_stored:
+            await delete_stored([key], stored["storage_type"])
+        else:
+            media_doc.update(filename=key, url=stored["url"])
+            media_doc.pop("variants", None)
+            await db.media.update_one(
+                {"media_id": media_doc["media_id"]},
+                {"$set": {"filename": key, "url": stored["url"]}, "$unset": {"variants": ""}}
+            )
+    return media_doc
+
+
+async def queue_variants(media: dict):
+    """Have the job queue build resized variants of an uploaded photo."""
+    if media["media_type"] == "image" and media["content_type"] in VARIANT_CONTENT_TYPES:
+        await job_queue.enqueue("image_variants", {"media_id": media["media_id"]}, job_id=f"variants_{media['media_id']}")
+
+
+async def store_inline_photo(user_id: str, data_uri: str) -> dict:
+    """
+    Store a base64 photo as a gallery object and return its media record.
+    
+    Call ``queue_variants`` once the URL is on the user, so the variants get recorded there.
+    """
+    content_type, data = decode_photo_data(data_uri)
+    key = f"gallery/{user_id}/{uuid.uuid4()}.{_EXTENSIONS[content_type]}"
+    stored = await store_bytes(data, key, content_type, fallback_to_local=True)
+    return await record_media(user_id, key, "image", content_type, stored)
+
+
+async def migrate_user_photos(user: dict) -> int:
+    """
+    Move one user's inline photos into media storage; returns how many moved.
+    
+    The user is only updated if their photos are unchanged since they were
+    read, so a concurrent edit is never overwritten (the next run retries).
+    """
+    moved: Dict[str, Optional[str]] = {}
+    media = []
+    photos = user.get("photos") or []
+    for photo in photos + [user.get("profile_photo")]:
+        if is_inline_photo(photo) and photo not in moved:
+            try:
+                media.append(await store_inline_photo(user["user_id"], photo))
+                moved[photo] = media[-1]["url"]
+            except ValueError as e:
+                logger.warning(f"Dropping unreadable inline photo for {user['user_id']}: {e}")
+                moved[photo] = None
+    if not moved:
+        return 0
+    
+    update = {"photos": [moved.get(p, p) for p in photos if moved.get(p, p)]}
+    if is_inline_photo(user.get("profile_photo")):
+        update["profile_photo"] = moved[user["profile_photo"]] or (update["photos"][0] if update["photos"] else None)
+    result = await db.users.update_one(
+        {"user_id": user["user_id"], "photos": user.get("photos"), "profile_photo": user.get("profile_photo")},
+        {"$set": update}
+    )
+    if result.matched_count == 0:
+        await discard_media(media)
+        return 0
+    for doc in media:
+        await queue_variants(doc)
+    return len(moved)
+
+
+async def discard_media(docs: List[dict]):
+    """Delete media records nothing was pointed at, and their objects unless another record shares them."""
+    if not docs:
+        return
+    await db.media.delete_many({"media_id": {"$in": [doc["media_id"] for doc in docs]}})
+    for doc in docs:
+        if not await db.media.find_one({"filename": doc["filename"]}, {"_id": 1}):
+            await delete_stored([doc["filename"]], doc["storage_type"])
+
+
+async def migrate_inline_photos():
+    """Move every remaining inline photo out of user documents."""
+    inline = {"$regex": "^data:"}
+    users = db.users.find(
+        {"$or": [{"photos": inline}, {"profile_photo": inline}]},
+        {"_id": 0, "user_id": 1, "photos": 1, "profile_photo": 1}
+    ).batch_size(MIGRATION_BATCH_SIZE)
+    migrated = photos = 0
+    async for user in users:
+        count = await migrate_user_photos(user)
+        migrated += 1 if count else 0
+        photos += count
+    if migrated:
+        logger.info(f"Moved {photos} inline photos out of {migrated} user documents")
+
+
+def storage_type_of(url: str) -> str:
+    return "local" if url.startswith("/api/media/") else "s3"
+
+
+async def referenced_urls(urls: List[str]) -> set:
+    """Which of ``urls`` a user profile, chat message or notification still uses."""
+    referenced = set()
+    async for user in db.users.find(
+        {"$or": [{"photos": {"$in": urls}}, {"profile_photo": {"$in": urls}}]},
+        {"_id": 0, "photos": 1, "profile_photo": 1}
+    ):
+        referenced.update(user.get("photos") or [])
+        referenced.add(user.get("profile_photo"))
+    async for message in db.messages.find({"media_url": {"$in": urls}}, {"_id": 0, "media_url": 1}):
+        referenced.add(message["media_url"])
+    async for notification in db.notifications.find(
+        {"$or": [{"from_user_photo": {"$in": urls}}, {"data.matched_user_photo": {"$in": urls}}]},
+        {"_id": 0, "from_user_photo": 1, "data.matched_user_photo": 1}
+    ):
+        referenced.add(notification.get("from_user_photo"))
+        referenced.add((notification.get("data") or {}).get("matched_user_photo"))
+    return referenced
+
+
+def variant_urls(obj: dict) -> List[Tuple[str, str, str]]:
+    """``(size, format, url)`` for each variant of a media object."""
+    return [
+        (size, fmt, url)
+        for size, formats in ((obj.get("variants") or {}).get("sizes") or {}).items()
+        for fmt, url in formats.items()
+    ]
+
+
+async def collect_batch(objects: List[dict], cutoff: str) -> int:
+    """Delete the unreferenced objects (with their variants) among ``objects``; returns how many."""
+    # Notifications copy card photos, which are variant URLs, so a variant in use keeps its original
+    urls = {obj["_id"]: [obj["url"]] + [url for _, _, url in variant_urls(obj)] for obj in objects}
+    referenced = await referenced_urls([url for obj_urls in urls.values() for url in obj_urls])
+    doomed: Dict[str, List[str]] = {"local": [], "s3": []}
+    removed = 0
+    for obj in objects:
+        if referenced.intersection(urls[obj["_id"]]):
+            continue
+        await db.media.delete_many({"filename": obj["_id"], "created_at": {"$lt": cutoff}})
+        if await db.media.find_one({"filename": obj["_id"]}, {"_id": 1}):
+            continue  # Uploaded again since the scan
+        doomed[obj["storage_type"]].append(obj["_id"])
+        for size, fmt, url in variant_urls(obj):
+            doomed[storage_type_of(url)].append(variant_key(obj["_id"], size, fmt))
+        removed += 1
+    for storage_type, keys in doomed.items():
+        if keys:
+            await delete_stored(keys, storage_type)
+    return removed
+
+
+async def collect_unreferenced_media():
+    """Delete stored objects nothing references any more, ``MEDIA_GC_BATCH_SIZE`` at a time."""
+    cutoff = (datetime.now(timezone.utc) - MEDIA_GC_GRACE).isoformat()
+    objects = db.media.aggregate([
+        {"$group": {
+            "_id": "$filename", "url": {"$first": "$url"}, "storage_type": {"$first": "$storage_type"},
+            "variants": {"$max": "$variants"}, "newest": {"$max": "$created_at"}
+        }},
+        {"$match": {"newest": {"$lt": cutoff}}}
+    ], allowDiskUse=True)
+    batch, removed = [], 0
+    async for obj in objects:
+        batch.append(obj)
+        if len(batch) >= MEDIA_GC_BATCH_SIZE:
+            removed += await collect_batch(batch, cutoff)
+            batch = []
+    if batch:
+        removed += await collect_batch(batch, cutoff)
+    if removed:
+        logger.info(f"Deleted {removed} unreferenced media objects")
+
+
+@periodic("collect_unreferenced_media", MEDIA_GC_INTERVAL_SECONDS, exclusive=True)
+async def collect_unreferenced_media_job():
+    await collect_unreferenced_media()
+
+
+@periodic("migrate_inline_photos", MIGRATION_INTERVAL_SECONDS, run_at_start=True, exclusive=True)
+async def migrate_inline_photos_job():
+    await migrate_inline_photos()
@@ -0,0 +1,307 @@
+"""Asynchronous notification pipeline.
+
+Request handlers call ``notification_service.enqueue(...)`` and return immediately.
+A background worker drains the queue in batches: it drops notifications the
+recipient has switched off (preferences are cached), applies per-type dedup
+windows, collapses chat messages into one rolling notification per
+conversation, writes everything with ``insert_many`` and pushes the results to
+connected sockets.
+
+Delivery is at-most-once: whatever is queued when the app stops is written
+by ``stop`` before shutdown completes, but a crash loses the queue.
+"""
+import asyncio
+import logging
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError
+
+from services.database import db
+from services.websocket import manager
+from services.counters import unread_counters
+from models.schemas import Notification
+
+logger = logging.getLogger(__name__)
+
+NOTIFICATION_DEFAULTS = {
+    "new_matches": True,
+    "new_messages": True,
+    "super_likes": True,
+    "likes_received": True,
+    "profile_views": False,
+    "marketing": False,
+    "sound": True,
+    "vibration": True
+}
+
+# Notification type -> notification_settings key that switches it off
+PREFERENCE_KEYS = {
+    "new_match": "new_matches",
+    "new_message": "new_messages",
+    "super_like": "super_likes",
+    "like": "likes_received",
+    "profile_view": "profile_views",
+}
+
+# Repeats of a type for the same (user, collapse key) inside the window are dropped
+DEDUP_WINDOWS = {
+    "profile_view": 60 * 60,
+    "super_like": 60,
+    "trip_overlap": 24 * 60 * 60,
+}
+
+# Types that accumulate into a single unread notification per collapse key
+ROLLING_TYPES = {"new_message"}
+
+BATCH_SIZE = 200
+FLUSH_INTERVAL_SECONDS = 0.05
+PREFERENCES_TTL_SECONDS = 300
+SHUTDOWN_TIMEOUT_SECONDS = 10
+
+
+class NotificationService:
+    """Queue-backed notification writer shared by all routes."""
+    
+    def __init__(self, batch_size: int = BATCH_SIZE, flush_interval: float = FLUSH_INTERVAL_SECONDS,
+                 preferences_ttl: float = PREFERENCES_TTL_SECONDS):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.preferences_ttl = preferences_ttl
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._preferences: Dict[str, Tuple[float, dict]] = {}
+        self._recent: Dict[Tuple[str, str, str], float] = {}
+    
+    def start(self):
+        """Start the background worker on the running loop (idempotent)."""
+        if self._worker and not self._worker.done():
+            return
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        self._worker = asyncio.create_task(self._run())
+    
+    async def stop(self, timeout: float = SHUTDOWN_TIMEOUT_SECONDS):
+        """Write whatever is queued and stop the worker."""
+        if self._queue is None:
+            return
+        if self._worker and not self._worker.done():
+            drained = asyncio.ensure_future(self._queue.join())
+            await asyncio.wait({drained, self._worker}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not drained.done():
+                drained.cancel()
+                logger.error(f"Notification queue not drained after {timeout}s; stopping the worker")
+        if self._worker:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._worker = None
+        # Whatever the worker left queued (it died, or timed out) is written directly
+        batch = []
+        while not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+            self._queue.task_done()
+        if batch:
+            try:
+                await self._process(batch)
+            except Exception as e:
+                logger.exception(f"Dropped {len(batch)} queued notifications at shutdown: {e}")
+    
+    def build(self, user_id: str, notif_type: str, title: str, message: str, data: Optional[dict] = None,
+              from_user: Optional[dict] = None, notification_id: Optional[str] = None) -> dict:
+        """
+        Build a notification document without queueing it.
+    
+        ``from_user`` fills the sender fields the client uses for avatars and
+        navigation. A deterministic ``notification_id`` makes ``deliver`` of the
+        same document idempotent.
+        """
+        notification = Notification(user_id=user_id, type=notif_type, title=title, message=message, data=data or {})
+        doc = notification.model_dump()
+        doc["created_at"] = doc["created_at"].isoformat()
+        doc["content"] = message
+        if notification_id:
+            doc["notification_id"] = notification_id
+        if from_user:
+            doc["from_user_id"] = from_user.get("user_id")
+            doc["from_user_name"] = from_user.get("name")
+            doc["from_user_photo"] = from_user.get("profile_photo")
+        return doc
+    
+    def enqueue(self, user_id: str, notif_type: str, title: str, message: str, data: Optional[dict] = None,
+                from_user: Optional[dict] = None, collapse_key: Optional[str] = None) -> dict:
+        """
+        Queue a notification and return the document that will be written.
+    
+        ``collapse_key`` scopes dedup windows and rolling types (e.g. the
+        conversation id for chat messages).
+        """
+        doc = self.build(user_id, notif_type, title, message, data, from_user)
+        self.start()
+        self._queue.put_nowait((doc, collapse_key))
+        return doc
+    
+    def invalidate_preferences(self, user_id: str):
+        self._preferences.pop(user_id, None)
+    
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self._process(batch)
+            except Exception as e:
+                logger.exception(f"Notification batch of {len(batch)} failed: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+    
+    async def _load_preferences(self, user_ids: List[str]) -> Dict[str, dict]:
+        now = time.monotonic()
+        missing = [uid for uid in user_ids if self._preferences.get(uid, (0, None))[0] <= now]
+        if missing:
+            users = await db.users.find(
+                {"user_id": {"$in": missing}}, {"_id": 0, "user_id": 1, "notification_settings": 1}
+            ).to_list(None)
+            found = {u["user_id"]: u.get("notification_settings") or {} for u in users}
+            for uid in missing:
+                self._preferences[uid] = (now + self.preferences_ttl, {**NOTIFICATION_DEFAULTS, **found.get(uid, {})})
+        return {uid: self._preferences[uid][1] for uid in user_ids}
+    
+    def _admit(self, doc: dict, collapse_key: Optional[str], preferences: Dict[str, dict]) -> bool:
+        """Apply preference and dedup-window rules to one queued notification."""
+        pref_key = PREFERENCE_KEYS.get(doc["type"])
+        if pref_key and not preferences.get(doc["user_id"], NOTIFICATION_DEFAULTS).get(pref_key, True):
+            return False
+    
+        window = DEDUP_WINDOWS.get(doc["type"])
+        if window and collapse_key:
+            key = (doc["user_id"], doc["type"], collapse_key)
+            now = time.monotonic()
+            if self._recent.get(key, float("-inf")) > now - window:
+                return False
+            self._recent[key] = now
+        return True
+    
+    async def _process(self, batch: List[Tuple[dict, Optional[str]]]):
+        preferences = await self._load_preferences(list({doc["user_id"] for doc, _ in batch}))
+    
+        inserts: List[dict] = []
+        rolling: Dict[Tuple[str, str, str], List[dict]] = {}
+        for doc, collapse_key in batch:
+            if not self._admit(doc, collapse_key, preferences):
+                continue
+            if doc["type"] in ROLLING_TYPES and collapse_key:
+                rolling.setdefault((doc["user_id"], doc["type"], collapse_key), []).append(doc)
+            else:
+                inserts.append(doc)
+    
+        written = await self.deliver(inserts)
+        for (user_id, notif_type, collapse_key), docs in rolling.items():
+            doc = await self._roll_up(user_id, notif_type, collapse_key, docs)
+            if doc:
+                written.append(doc)
+        await self.push(written)
+        self._prune_recent()
+    
+    async def deliver(self, docs: List[dict]) -> List[dict]:
+        """
+        Insert fully-built notification documents in one round trip.
+    
+        Documents whose ``notification_id`` already exists are skipped, so
+        retried jobs don't double-notify. Returns the documents actually written.
+        """
+        if not docs:
+            return []
+        try:
+            await db.notifications.insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            if any(error.get("code") != 11000 for error in errors):
+                raise
+            duplicates = {error["index"] for error in errors}
+            docs = [doc for i, doc in enumerate(docs) if i not in duplicates]
+        per_user: Dict[str, int] = {}
+        for doc in docs:
+            doc.pop("_id", None)
+            per_user[doc["user_id"]] = per_user.get(doc["user_id"], 0) + 1
+        await unread_counters.add_notifications(per_user)
+        return docs
+    
+    async def _roll_up(self, user_id: str, notif_type: str, collapse_key: str, docs: List[dict]) -> Optional[dict]:
+        """Fold queued notifications into the single unread one for their collapse key."""
+        latest = docs[-1]
+        sender_name = latest.get("from_user_name") or "Someone"
+        # User-supplied strings are wrapped in $literal so a leading "$" isn't read as a field path
+        rolled_text = {"$cond": [
+            {"$gt": ["$data.count", 1]},
+            {"$concat": [{"$toString": "$data.count"}, {"$literal": f" new messages from {sender_name}"}]},
+            {"$literal": latest["message"]}
+        ]}
+        doc = await db.notifications.find_one_and_update(
+            {"user_id": user_id, "type": notif_type, "read": False, "data.conversation_id": collapse_key},
+            [
+                {"$set": {
+                    "notification_id": {"$ifNull": ["$notification_id", f"notif_{uuid.uuid4().hex[:12]}"]},
+                    "title": {"$literal": latest["title"]},
+                    "data": {
+                        **{k: {"$literal": v} for k, v in latest["data"].items()},
+                        "conversation_id": collapse_key,
+                        "count": {"$add": [{"$ifNull": ["$data.count", 0]}, len(docs)]}
+                    },
+                    "from_user_id": {"$literal": latest.get("from_user_id")},
+                    "from_user_name": {"$literal": latest.get("from_user_name")},
+                    "from_user_photo": {"$literal": latest.get("from_user_photo")},
+                    "created_at": datetime.now(timezone.utc).isoformat()
+                }},
+                {"$set": {"message": rolled_text, "content": rolled_text}}
+            ],
+            projection={"_id": 0},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        if doc and doc["data"].get("count") == len(docs):
+            # A fresh unread notification was created rather than an existing one rolled up
+            await unread_counters.add_notifications({user_id: 1})
+        return doc
+    
+    async def mark_conversation_read(self, user_id: str, conversation_id: str) -> int:
+        """Mark the conversation's rolling chat notification read, so the next message starts a new one."""
+        result = await db.notifications.update_many(
+            {"user_id": user_id, "type": "new_message", "read": False, "data.conversation_id": conversation_id},
+            {"$set": {"read": True}}
+        )
+        await unread_counters.add_notifications({user_id: -result.modified_count})
+        return result.modified_count
+    
+    async def push(self, docs: List[dict]):
+        """Send written notifications to every recipient that is online, concurrently."""
+        sends = [
+            manager.send_personal_message({"type": "notification", "notification": doc}, doc["user_id"])
+            for doc in docs if manager.is_online(doc["user_id"])
+        ]
+        if sends:
+            await asyncio.gather(*sends)
+    
+    def _prune_recent(self):
+        if len(self._recent) < 10000:
+            return
+        cutoff = time.monotonic() - max(DEDUP_WINDOWS.values())
+        self._recent = {k: v for k, v in self._recent.items() if v > cutoff}
+
+
+# Global service instance
+notification_service = NotificationService()
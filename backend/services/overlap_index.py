@@ -0,0 +1,346 @@
+"""In-memory spatiotemporal index over travel schedules.
+
+Answers "which schedules are within R miles of P during [a, b]" without touching
+MongoDB. Schedules are bucketed into fixed-size lat/lon cells and each cell
+keeps a centered interval tree over the schedule's day range, so a query only
+visits the few cells the search circle covers and only the intervals that
+overlap the window. Recurring schedules are stored once with their whole
+series as the interval and expanded into occurrences only inside the query
+window. The index is loaded at startup, kept current by schedule
+create/delete here and by other workers' writes through the change feed,
+and rebuilt periodically as a backstop. Every query looks ahead from today,
+so a rebuild loads only trips (or series) that have not ended yet, which
+also drops the ones that ended since the last rebuild.
+"""
+import asyncio
+import logging
+from datetime import datetime, timezone
+from math import floor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from services.database import db
+from services.background import periodic
+from services.change_feed import change_feed
+from services.recurrence import occurrences, series_end_date
+from services.corridors import RouteIndex, cells_around, without_route, ROUTE_FIELDS
+from utils.helpers import calculate_distance
+
+logger = logging.getLogger(__name__)
+
+CELL_DEGREES = 1.0
+EARTH_RADIUS_MILES = 3956
+PAIR_CHUNK_SIZE = 250_000
+REBUILD_INTERVAL_SECONDS = 5 * 60
+
+Entry = Tuple[int, int, dict]
+
+
+def day_number(date_str: str) -> int:
+    """Convert a ``YYYY-MM-DD`` (or ISO datetime) string to a proleptic ordinal day."""
+    return datetime.strptime(date_str[:10], "%Y-%m-%d").toordinal()
+
+
+class IntervalTree:
+    """Static centered interval tree over (start_day, end_day, schedule) entries."""
+
+    __slots__ = ("center", "by_start", "by_end", "left", "right")
+
+    def __init__(self, entries: List[Entry]):
+        endpoints = sorted([e[0] for e in entries] + [e[1] for e in entries])
+        self.center = endpoints[len(endpoints) // 2]
+
+        here, left, right = [], [], []
+        for entry in entries:
+            if entry[1] < self.center:
+                left.append(entry)
+            elif entry[0] > self.center:
+                right.append(entry)
+            else:
+                here.append(entry)
+
+        self.by_start = sorted(here, key=lambda e: e[0])
+        self.by_end = sorted(here, key=lambda e: e[1], reverse=True)
+        self.left = IntervalTree(left) if left else None
+        self.right = IntervalTree(right) if right else None
+
+    def query(self, start: int, end: int, out: List[dict]):
+        """Append every schedule whose [start_day, end_day] overlaps [start, end]."""
+        if end < self.center:
+            for entry in self.by_start:
+                if entry[0] > end:
+                    break
+                out.append(entry[2])
+            if self.left:
+                self.left.query(start, end, out)
+        elif start > self.center:
+            for entry in self.by_end:
+                if entry[1] < start:
+                    break
+                out.append(entry[2])
+            if self.right:
+                self.right.query(start, end, out)
+        else:
+            out.extend(entry[2] for entry in self.by_start)
+            if self.left:
+                self.left.query(start, end, out)
+            if self.right:
+                self.right.query(start, end, out)
+
+
+class OverlapIndex:
+    """Geo-cell buckets of interval trees, keyed by schedule_id for updates."""
+
+    def __init__(self, cell_degrees: float = CELL_DEGREES):
+        self.cell_degrees = cell_degrees
+        self.columns = int(round(360 / cell_degrees))
+        self._cells: Dict[Tuple[int, int], Dict[str, Entry]] = {}
+        self._trees: Dict[Tuple[int, int], IntervalTree] = {}
+        self._cell_of: Dict[str, Tuple[int, int]] = {}
+        self._routes = RouteIndex(cell_degrees)
+        self._loaded = False
+        self._lock = asyncio.Lock()
+        # Writes that land while a rebuild is reading MongoDB, replayed before the swap
+        self._journal: Optional[List[Tuple[str, object]]] = None
+
+    def __len__(self) -> int:
+        return len(self._cell_of)
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return (floor(lat / self.cell_degrees), floor((lon + 180) / self.cell_degrees) % self.columns)
+
+    def add(self, schedule: dict):
+        """
+        Insert or replace a schedule, with its route fields merged in if it has one.
+        Schedules without coordinates are ignored.
+        """
+        if self._journal is not None:
+            self._journal.append(("add", schedule))
+        schedule_id = schedule.get("schedule_id")
+        if schedule_id in self._cell_of:
+            self.remove(schedule_id)
+        self._routes.add(schedule)
+        schedule = without_route(schedule)
+        if schedule.get("latitude") is None or schedule.get("longitude") is None:
+            return
+        try:
+            entry = (day_number(schedule["start_date"]), day_number(series_end_date(schedule)), schedule)
+        except (KeyError, TypeError, ValueError):
+            return
+
+        cell = self._cell(schedule["latitude"], schedule["longitude"])
+        self._cells.setdefault(cell, {})[schedule_id] = entry
+        self._cell_of[schedule_id] = cell
+        self._trees.pop(cell, None)
+
+    def remove(self, schedule_id: str):
+        if self._journal is not None:
+            self._journal.append(("remove", schedule_id))
+        self._routes.remove(schedule_id)
+        cell = self._cell_of.pop(schedule_id, None)
+        if cell is None:
+            return
+        bucket = self._cells.get(cell, {})
+        bucket.pop(schedule_id, None)
+        if not bucket:
+            self._cells.pop(cell, None)
+        self._trees.pop(cell, None)
+
+    def _tree(self, cell: Tuple[int, int]) -> Optional[IntervalTree]:
+        tree = self._trees.get(cell)
+        if tree is None and cell in self._cells:
+            tree = self._trees[cell] = IntervalTree(list(self._cells[cell].values()))
+        return tree
+
+    def _cells_around(self, lat: float, lon: float, radius_miles: float):
+        return cells_around(lat, lon, radius_miles, self.cell_degrees)
+
+    def search_routes(self, lat: float, lon: float, radius_miles: float, start_date: str, end_date: str,
+                      exclude_user_id: Optional[str] = None) -> List[Tuple[dict, float]]:
+        """Routed schedules passing within ``radius_miles`` of the point during the window."""
+        return self._routes.search(lat, lon, radius_miles, start_date, end_date, exclude_user_id)
+
+    def search(self, lat: float, lon: float, radius_miles: float, start_date: str, end_date: str,
+               exclude_user_id: Optional[str] = None) -> List[Tuple[dict, float]]:
+        """
+        Return (schedule copy, distance_miles) pairs within ``radius_miles`` of the
+        point whose dates overlap [start_date, end_date], nearest first.
+        Recurring schedules contribute one pair per occurrence in the window.
+        """
+        start, end = day_number(start_date), day_number(end_date)
+        candidates: List[dict] = []
+        for cell in self._cells_around(lat, lon, radius_miles):
+            tree = self._tree(cell)
+            if tree:
+                tree.query(start, end, candidates)
+
+        results = []
+        for schedule in candidates:
+            if exclude_user_id and schedule.get("user_id") == exclude_user_id:
+                continue
+            distance = calculate_distance(lat, lon, schedule["latitude"], schedule["longitude"])
+            if distance > radius_miles:
+                continue
+            if schedule.get("recurrence"):
+                results.extend((occurrence, distance) for occurrence in occurrences(schedule, start_date, end_date))
+            else:
+                results.append((dict(schedule), distance))
+        results.sort(key=lambda r: (r[1], r[0]["start_date"]))
+        return results
+
+    def search_schedule(self, schedule: dict, radius_miles: float, window_start: Optional[str] = None,
+                        window_end: Optional[str] = None, exclude_user_id: Optional[str] = None,
+                        max_occurrences: int = 60) -> List[Tuple[dict, float]]:
+        """
+        ``search`` around every occurrence of ``schedule`` inside the window
+        (its whole series by default), so a recurring trip only matches
+        schedules that overlap one of its actual occurrences.
+        """
+        window_start = window_start or schedule["start_date"]
+        window_end = window_end or series_end_date(schedule)
+        results, seen = [], set()
+        for occurrence in occurrences(schedule, window_start, window_end, limit=max_occurrences):
+            for other, distance in self.search(
+                schedule["latitude"], schedule["longitude"], radius_miles,
+                occurrence["start_date"], occurrence["end_date"], exclude_user_id
+            ):
+                key = (other["schedule_id"], other["start_date"])
+                if key not in seen:
+                    seen.add(key)
+                    results.append((other, distance))
+        results.sort(key=lambda r: (r[1], r[0]["start_date"]))
+        return results
+
+    def schedules_between(self, start_date: str, end_date: str) -> List[dict]:
+        """Every indexed schedule whose dates overlap [start_date, end_date], recurring ones as occurrences."""
+        start, end = day_number(start_date), day_number(end_date)
+        found: List[dict] = []
+        for cell in list(self._cells):
+            self._tree(cell).query(start, end, found)
+        expanded = []
+        for schedule in found:
+            if schedule.get("recurrence"):
+                expanded.extend(occurrences(schedule, start_date, end_date))
+            else:
+                expanded.append(schedule)
+        return expanded
+
+    async def ensure_loaded(self):
+        if not self._loaded:
+            async with self._lock:
+                if not self._loaded:
+                    await self.rebuild()
+
+    async def rebuild(self):
+        """Reload every schedule with coordinates that hasn't ended from MongoDB and swap it in."""
+        fresh = OverlapIndex(self.cell_degrees)
+        self._journal = []
+        try:
+            today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+            schedules = await db.schedules.find(
+                {
+                    "latitude": {"$ne": None}, "longitude": {"$ne": None},
+                    "$or": [{"end_date": {"$gte": today}}, {"series_end_date": {"$gte": today}}]
+                },
+                {"_id": 0}
+            ).to_list(None)
+            # Routes are written before their schedules, so every schedule read here has its route
+            routes = await load_routes([s["schedule_id"] for s in schedules if s.get("has_route")])
+            for schedule in schedules:
+                fresh.add({**schedule, **routes.get(schedule["schedule_id"], {})})
+            for op, arg in self._journal:
+                fresh.add(arg) if op == "add" else fresh.remove(arg)
+        finally:
+            self._journal = None
+        self._cells, self._trees, self._cell_of = fresh._cells, fresh._trees, fresh._cell_of
+        self._routes = fresh._routes
+        self._loaded = True
+        logger.info(f"Overlap index loaded with {len(self)} schedules")
+
+    async def reload(self, schedule_ids: List[str]):
+        """Re-read schedules from MongoDB after another worker changed them; missing ones are removed."""
+        found = set()
+        routes = await load_routes(schedule_ids)
+        async for schedule in db.schedules.find({"schedule_id": {"$in": schedule_ids}}, {"_id": 0}):
+            found.add(schedule["schedule_id"])
+            self.add({**schedule, **routes.get(schedule["schedule_id"], {})})
+        for schedule_id in set(schedule_ids) - found:
+            self.remove(schedule_id)
+
+    async def query(self, lat: float, lon: float, radius_miles: float, start_date: str, end_date: str,
+                    exclude_user_id: Optional[str] = None) -> List[Tuple[dict, float]]:
+        """Load the index on first use, then run ``search``."""
+        await self.ensure_loaded()
+        return self.search(lat, lon, radius_miles, start_date, end_date, exclude_user_id)
+
+    async def query_schedule(self, schedule: dict, radius_miles: float, window_start: Optional[str] = None,
+                             window_end: Optional[str] = None,
+                             exclude_user_id: Optional[str] = None) -> List[Tuple[dict, float]]:
+        """Load the index on first use, then run ``search_schedule``."""
+        await self.ensure_loaded()
+        return self.search_schedule(schedule, radius_miles, window_start, window_end, exclude_user_id)
+
+    async def query_routes(self, lat: float, lon: float, radius_miles: float, start_date: str, end_date: str,
+                           exclude_user_id: Optional[str] = None) -> List[Tuple[dict, float]]:
+        """Load the index on first use, then run ``search_routes``."""
+        await self.ensure_loaded()
+        return self.search_routes(lat, lon, radius_miles, start_date, end_date, exclude_user_id)
+
+
+async def load_routes(schedule_ids: Optional[List[str]] = None) -> Dict[str, dict]:
+    """schedule_id -> route fields from ``schedule_routes``, for all schedules or the given ones."""
+    query = {} if schedule_ids is None else {"schedule_id": {"$in": schedule_ids}}
+    routes = {}
+    async for doc in db.schedule_routes.find(query, {"_id": 0}):
+        routes[doc["schedule_id"]] = {field: doc.get(field) for field in ROUTE_FIELDS}
+    return routes
+
+
+def overlap_pairs(schedules: List[dict], candidates: List[dict],
+                  radius_miles: float) -> List[Tuple[int, int, float]]:
+    """
+    Vectorized all-pairs overlap test between two lists of schedules.
+
+    Returns ``(schedule_index, candidate_index, distance_miles)`` for every pair
+    whose date ranges overlap and whose destinations are within ``radius_miles``.
+    Candidates are processed in chunks so memory stays bounded for large pools.
+    """
+    if not schedules or not candidates:
+        return []
+    lat1 = np.radians([s["latitude"] for s in schedules])[:, None]
+    lon1 = np.radians([s["longitude"] for s in schedules])[:, None]
+    start1 = np.array([day_number(s["start_date"]) for s in schedules])[:, None]
+    end1 = np.array([day_number(s["end_date"]) for s in schedules])[:, None]
+
+    pairs = []
+    chunk = max(1, PAIR_CHUNK_SIZE // len(schedules))
+    for offset in range(0, len(candidates), chunk):
+        block = candidates[offset:offset + chunk]
+        lat2 = np.radians([c["latitude"] for c in block])[None, :]
+        lon2 = np.radians([c["longitude"] for c in block])[None, :]
+        start2 = np.array([day_number(c["start_date"]) for c in block])[None, :]
+        end2 = np.array([day_number(c["end_date"]) for c in block])[None, :]
+
+        a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+        miles = np.round(2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(np.clip(a, 0, 1))), 1)
+        hits = (start1 <= end2) & (end1 >= start2) & (miles <= radius_miles)
+        for i, j in zip(*np.nonzero(hits)):
+            pairs.append((int(i), offset + int(j), float(miles[i, j])))
+    return pairs
+
+
+# Global index instance
+overlap_index = OverlapIndex()
+
+
+@periodic("rebuild_overlap_index", REBUILD_INTERVAL_SECONDS)
+async def rebuild_overlap_index():
+    await overlap_index.rebuild()
+
+
+async def apply_schedule_changes(entries: List[dict]):
+    await overlap_index.reload(list({entry["id"] for entry in entries}))
+
+
+change_feed.subscribe("schedule", apply_schedule_changes)
@@ -0,0 +1,112 @@
+"""Recurring travel schedules.
+
+A schedule may carry a ``recurrence`` rule instead of being entered once per
+rotation::
+
+    {"frequency": "weekly", "interval": 2, "count": 10, "until": "2027-06-30"}
+
+The stored ``start_date``/``end_date`` describe the first occurrence and
+``series_end_date`` the end of the last one. Occurrence ``k`` is the first one
+shifted by ``k * interval`` days (daily) or weeks (weekly). Occurrences are
+never stored; ``occurrences`` expands only those inside a query window.
+"""
+from datetime import date, timedelta
+from typing import List, Optional
+
+# Rules without count or until stop this long after the first occurrence
+MAX_SERIES_DAYS = 366
+
+STEP_DAYS = {"daily": 1, "weekly": 7}
+
+
+def _day(value: str) -> date:
+    return date.fromisoformat(value[:10])
+
+
+def _step(rule: dict) -> int:
+    return max(1, int(rule.get("interval") or 1)) * STEP_DAYS[rule.get("frequency", "weekly")]
+
+
+def occurrence_count(schedule: dict) -> int:
+    """Number of occurrences in the series (1 for a one-off schedule)."""
+    rule = schedule.get("recurrence")
+    if not rule:
+        return 1
+    step = _step(rule)
+    start = _day(schedule["start_date"])
+    until = _day(rule["until"]) if rule.get("until") else start + timedelta(days=MAX_SERIES_DAYS)
+    count = (until - start).days // step + 1
+    if rule.get("count"):
+        count = min(count, int(rule["count"]))
+    return max(count, 1)
+
+
+def validate_recurrence(schedule: dict):
+    """Raise ValueError if the schedule's recurrence rule can't describe a series."""
+    rule = schedule.get("recurrence")
+    if not rule or not rule.get("until"):
+        return
+    try:
+        until = _day(rule["until"])
+    except ValueError:
+        raise ValueError("recurrence.until must be YYYY-MM-DD")
+    if until < _day(schedule["start_date"]):
+        raise ValueError("recurrence.until is before start_date")
+
+
+def series_end_date(schedule: dict) -> str:
+    """End date of the last occurrence; ``end_date`` for a one-off schedule."""
+    rule = schedule.get("recurrence")
+    if not rule:
+        return schedule["end_date"]
+    last = _day(schedule["end_date"]) + timedelta(days=(occurrence_count(schedule) - 1) * _step(rule))
+    return last.isoformat()
+
+
+def occurrences(schedule: dict, window_start: str, window_end: str, limit: Optional[int] = None) -> List[dict]:
+    """
+    Occurrences of ``schedule`` whose dates overlap [window_start, window_end].
+    
+    Each occurrence is a copy of the schedule with its own ``start_date``,
+    ``end_date`` and ``occurrence`` number; one-off schedules yield a plain copy.
+    """
+    rule = schedule.get("recurrence")
+    if not rule:
+        if schedule["start_date"] <= window_end and schedule["end_date"] >= window_start:
+            return [dict(schedule)]
+        return []
+    
+    step = _step(rule)
+    first_start, first_end = _day(schedule["start_date"]), _day(schedule["end_date"])
+    lo, hi = _day(window_start), _day(window_end)
+    # Occurrence k overlaps the window when first_end + k*step >= lo and first_start + k*step <= hi
+    k_min = max(0, -(-(lo - first_end).days // step))
+    k_max = min(occurrence_count(schedule) - 1, (hi - first_start).days // step)
+    if limit is not None:
+        k_max = min(k_max, k_min + limit - 1)
+    
+    found = []
+    for k in range(k_min, k_max + 1):
+        shift = timedelta(days=k * step)
+        found.append({
+            **schedule,
+            "start_date": (first_start + shift).isoformat(),
+            "end_date": (first_end + shift).isoformat(),
+            "occurrence": k
+        })
+    return found
+
+
+def active_schedules_filter(day: str) -> dict:
+    """
+    Mongo filter for schedules that may have an occurrence covering ``day``.
+    
+    Recurring candidates still need ``occurrences(schedule, day, day)`` to confirm.
+    """
+    return {
+        "start_date": {"$lte": day},
+        "$or": [
+            {"end_date": {"$gte": day}},
+            {"recurrence": {"$ne": None}, "series_end_date": {"$gte": day}}
+        ]
+    }
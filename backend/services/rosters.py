@@ -0,0 +1,141 @@
+"""Parsing and validation for bulk schedule imports.
+
+Crew rosters arrive either as an iCalendar file (one VEVENT per layover) or a
+JSON roster. Both are reduced to plain entries::
+
+    {"title", "destination", "start_date", "end_date", "latitude", "longitude", "notes"}
+
+which ``validate_entry`` checks before they become schedules.
+"""
+from datetime import date, datetime, timedelta
+from typing import Any, List, Optional, Tuple
+
+MAX_ROSTER_ENTRIES = 500
+MAX_TRIP_DAYS = 365
+
+
+def _unfold(text: str) -> List[str]:
+    """Join RFC 5545 folded lines (continuations start with a space or tab)."""
+    lines: List[str] = []
+    for raw in text.replace("\r\n", "\n").replace("\r", "\n").split("\n"):
+        if raw[:1] in (" ", "\t") and lines:
+            lines[-1] += raw[1:]
+        elif raw:
+            lines.append(raw)
+    return lines
+
+
+def _unescape(value: str) -> str:
+    return (value.replace("\\n", "\n").replace("\\N", "\n")
+            .replace("\\,", ",").replace("\\;", ";").replace("\\\\", "\\"))
+
+
+def _ics_date(value: str) -> Tuple[date, bool]:
+    """Parse a DATE or DATE-TIME value; the flag is True for all-day dates."""
+    return datetime.strptime(value[:8], "%Y%m%d").date(), "T" not in value
+
+
+def parse_ics(text: str) -> List[dict]:
+    """Extract one entry per VEVENT from an iCalendar document."""
+    if "BEGIN:VCALENDAR" not in text.upper():
+        raise ValueError("Not an iCalendar file")
+    
+    entries: List[dict] = []
+    event: Optional[dict] = None
+    for line in _unfold(text):
+        name, _, value = line.partition(":")
+        name = name.split(";", 1)[0].upper()
+        if name == "BEGIN" and value.upper() == "VEVENT":
+            event = {}
+        elif name == "END" and value.upper() == "VEVENT" and event is not None:
+            entries.append(_event_entry(event))
+            event = None
+        elif event is not None:
+            event[name] = value
+    return entries
+
+
+def _event_entry(event: dict) -> dict:
+    entry: dict = {
+        "title": _unescape(event.get("SUMMARY", "")).strip() or None,
+        "destination": _unescape(event.get("LOCATION", "")).strip() or None,
+        "notes": _unescape(event.get("DESCRIPTION", "")).strip() or None,
+    }
+    try:
+        start, _ = _ics_date(event["DTSTART"])
+        entry["start_date"] = start.isoformat()
+        end, all_day = _ics_date(event.get("DTEND", event["DTSTART"]))
+        # All-day DTEND is exclusive; a one-day layover ends on its start date
+        if all_day and "DTEND" in event and end > start:
+            end -= timedelta(days=1)
+        entry["end_date"] = end.isoformat()
+    except (KeyError, ValueError):
+        entry["start_date"] = entry["end_date"] = None
+    if "GEO" in event:
+        try:
+            lat, lon = event["GEO"].split(";")
+            entry["latitude"], entry["longitude"] = float(lat), float(lon)
+        except ValueError:
+            pass
+    return entry
+
+
+def parse_json_roster(payload: Any) -> List[dict]:
+    """Accept either a list of entries or ``{"schedules": [...]}``."""
+    if isinstance(payload, dict):
+        payload = payload.get("schedules")
+    if not isinstance(payload, list):
+        raise ValueError("Expected a list of schedules or {\"schedules\": [...]}")
+    return [entry if isinstance(entry, dict) else {} for entry in payload]
+
+
+def _text(entry: dict, field: str) -> str:
+    """A stripped optional string field; ValueError if it holds anything else."""
+    value = entry.get(field)
+    if value is None:
+        return ""
+    if not isinstance(value, str):
+        raise ValueError(f"{field} must be a string")
+    return value.strip()
+
+
+def validate_entry(entry: dict, today: Optional[date] = None) -> dict:
+    """Return a normalized entry or raise ValueError describing what is wrong with it."""
+    destination = _text(entry, "destination")
+    title = _text(entry, "title")
+    notes = _text(entry, "notes")
+    if not destination:
+        raise ValueError("destination is required")
+    try:
+        start = date.fromisoformat(str(entry.get("start_date"))[:10])
+        end = date.fromisoformat(str(entry.get("end_date") or entry.get("start_date"))[:10])
+    except ValueError:
+        raise ValueError("start_date and end_date must be YYYY-MM-DD")
+    if end < start:
+        raise ValueError("end_date is before start_date")
+    if (end - start).days > MAX_TRIP_DAYS:
+        raise ValueError(f"trip is longer than {MAX_TRIP_DAYS} days")
+    if today and end < today:
+        raise ValueError("trip is in the past")
+    
+    latitude, longitude = entry.get("latitude"), entry.get("longitude")
+    if latitude is not None and longitude is not None:
+        try:
+            latitude, longitude = float(latitude), float(longitude)
+        except (TypeError, ValueError):
+            raise ValueError("latitude and longitude must be numbers")
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            raise ValueError("latitude/longitude out of range")
+    else:
+        latitude = longitude = None
+    
+    return {
+        "title": title or f"Layover in {destination}",
+        "destination": destination,
+        "start_date": start.isoformat(),
+        "end_date": end.isoformat(),
+        "latitude": latitude,
+        "longitude": longitude,
+        "notes": notes or None,
+        "looking_to_meet": bool(entry.get("looking_to_meet", True))
+    }
@@ -0,0 +1,257 @@
+"""Media object storage: S3 when configured, the local uploads directory otherwise.
+
+Uploads are streamed in ``CHUNK_SIZE`` pieces and never held whole in memory.
+Local files are written off the event loop to a ``.part`` file that is renamed
+into place once complete; S3 objects go up as a multipart upload of
+``S3_PART_SIZE`` parts. Either way the size limit aborts the transfer as soon
+as it is passed and nothing partial is left behind.
+
+boto3 is blocking, so every S3 call goes through ``s3_call``, which runs it on
+a dedicated pool of ``S3_MAX_CONCURRENCY`` threads matching the client's HTTP
+connection pool. Slow transfers queue there instead of stalling the event loop
+or starving the shared threadpool that sync endpoints and file I/O use.
+
+Stored content is hashed (SHA-256) as it streams, so callers can deduplicate
+identical uploads without reading them back.
+"""
+import asyncio
+import functools
+import hashlib
+import logging
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import AsyncIterator, Callable, Iterable
+
+import anyio
+import boto3
+from botocore.config import Config
+from fastapi import UploadFile
+
+logger = logging.getLogger(__name__)
+
+# Local fallback directory
+UPLOAD_DIR = Path(__file__).parent.parent / "uploads"
+UPLOAD_DIR.mkdir(exist_ok=True)
+
+# AWS S3 Configuration
+AWS_ACCESS_KEY_ID = os.environ.get('AWS_ACCESS_KEY_ID')
+AWS_SECRET_ACCESS_KEY = os.environ.get('AWS_SECRET_ACCESS_KEY')
+S3_BUCKET_NAME = os.environ.get('S3_BUCKET_NAME')
+AWS_REGION = os.environ.get('AWS_REGION', 'us-east-1')
+# S3-compatible endpoint (MinIO, LocalStack); unset for AWS
+S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL')
+S3_MAX_CONCURRENCY = int(os.environ.get('S3_MAX_CONCURRENCY', '8'))
+
+CHUNK_SIZE = 1024 * 1024
+# Most keys S3 accepts in one DeleteObjects request
+S3_DELETE_BATCH = 1000
+# S3's minimum part size; also the most an S3 upload buffers at once
+S3_PART_SIZE = 5 * 1024 * 1024
+
+# Initialize S3 client if credentials are available
+s3_client = None
+if AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY and S3_BUCKET_NAME:
+    try:
+        s3_client = boto3.client(
+            's3',
+            aws_access_key_id=AWS_ACCESS_KEY_ID,
+            aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
+            region_name=AWS_REGION,
+            endpoint_url=S3_ENDPOINT_URL,
+            config=Config(
+                max_pool_connections=S3_MAX_CONCURRENCY,
+                connect_timeout=5,
+                read_timeout=60,
+                retries={"max_attempts": 3, "mode": "standard"}
+            )
+        )
+        logger.info(f"S3 client initialized for bucket: {S3_BUCKET_NAME}")
+    except Exception as e:
+        logger.error(f"Failed to initialize S3 client: {e}")
+        s3_client = None
+
+_s3_executor = ThreadPoolExecutor(max_workers=S3_MAX_CONCURRENCY, thread_name_prefix="s3")
+
+
+class UploadTooLarge(Exception):
+    """Raised mid-stream once an upload passes its size limit."""
+    
+    def __init__(self, max_size: int):
+        super().__init__(f"Upload exceeds {max_size} bytes")
+        self.max_size = max_size
+
+
+def get_s3_url(filename: str) -> str:
+    """Get the public URL for an S3 object."""
+    if S3_ENDPOINT_URL:
+        return f"{S3_ENDPOINT_URL.rstrip('/')}/{S3_BUCKET_NAME}/{filename}"
+    return f"https://{S3_BUCKET_NAME}.s3.{AWS_REGION}.amazonaws.com/{filename}"
+
+
+def local_name(key: str) -> str:
+    """Flat filename under ``UPLOAD_DIR`` for a storage key."""
+    return key.replace("/", "_")
+
+
+async def s3_call(method: str, **kwargs):
+    """Run a blocking ``s3_client`` method on the S3 thread pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_s3_executor, functools.partial(getattr(s3_client, method), **kwargs))
+
+
+async def iter_upload(file: UploadFile, max_size: int) -> AsyncIterator[bytes]:
+    """Yield the upload in chunks, raising ``UploadTooLarge`` as soon as it passes ``max_size``."""
+    await file.seek(0)
+    size = 0
+    while True:
+        chunk = await file.read(CHUNK_SIZE)
+        if not chunk:
+            return
+        size += len(chunk)
+        if size > max_size:
+            raise UploadTooLarge(max_size)
+        yield chunk
+
+
+async def save_local(chunks: AsyncIterator[bytes], key: str) -> int:
+    """Stream chunks to ``UPLOAD_DIR`` without blocking the event loop; returns the size."""
+    name = local_name(key)
+    part = UPLOAD_DIR / f".{name}.{uuid.uuid4().hex[:8]}.part"
+    size = 0
+    try:
+        async with await anyio.open_file(part, "wb") as f:
+            async for chunk in chunks:
+                await f.write(chunk)
+                size += len(chunk)
+        await anyio.Path(part).rename(UPLOAD_DIR / name)
+    except BaseException:
+        part.unlink(missing_ok=True)
+        raise
+    return size
+
+
+async def save_s3(chunks: AsyncIterator[bytes], key: str, content_type: str) -> int:
+    """Stream chunks to S3 as a multipart upload; returns the size."""
+    upload = await s3_call(
+        "create_multipart_upload", Bucket=S3_BUCKET_NAME, Key=key, ContentType=content_type
+    )
+    upload_id = upload["UploadId"]
+    parts, buffer, size = [], bytearray(), 0
+    
+    async def send_part():
+        number = len(parts) + 1
+        response = await s3_call(
+            "upload_part", Bucket=S3_BUCKET_NAME, Key=key, UploadId=upload_id,
+            PartNumber=number, Body=bytes(buffer)
+        )
+        parts.append({"ETag": response["ETag"], "PartNumber": number})
+        buffer.clear()
+    
+    try:
+        async for chunk in chunks:
+            buffer += chunk
+            size += len(chunk)
+            if len(buffer) >= S3_PART_SIZE:
+                await send_part()
+        if buffer or not parts:
+            await send_part()
+        await s3_call(
+            "complete_multipart_upload", Bucket=S3_BUCKET_NAME, Key=key, UploadId=upload_id,
+            MultipartUpload={"Parts": parts}
+        )
+    except BaseException:
+        # Shielded so a client disconnect still releases the stored parts
+        with anyio.CancelScope(shield=True):
+            try:
+                await s3_call(
+                    "abort_multipart_upload", Bucket=S3_BUCKET_NAME, Key=key, UploadId=upload_id
+                )
+            except Exception as e:
+                logger.error(f"S3 abort failed for {key}: {e}")
+        raise
+    return size
+
+
+async def store_chunks(open_chunks: Callable[[], AsyncIterator[bytes]], key: str, content_type: str,
+                       fallback_to_local: bool = False) -> dict:
+    """
+    Stream content to S3 (or local storage when S3 is not configured).
+    
+    ``open_chunks`` returns a fresh chunk iterator, so an S3 failure can be
+    retried into local storage when ``fallback_to_local`` is set. Returns
+    ``{"url", "storage_type", "size", "sha256"}``.
+    """
+    async def hashed(digest) -> AsyncIterator[bytes]:
+        async for chunk in open_chunks():
+            digest.update(chunk)
+            yield chunk
+    
+    if s3_client:
+        try:
+            digest = hashlib.sha256()
+            size = await save_s3(hashed(digest), key, content_type)
+            logger.info(f"Uploaded to S3: {key}")
+            return {"url": get_s3_url(key), "storage_type": "s3", "size": size, "sha256": digest.hexdigest()}
+        except UploadTooLarge:
+            raise
+        except Exception as e:
+            if not fallback_to_local:
+                raise
+            logger.error(f"S3 upload failed, falling back to local: {e}")
+    
+    digest = hashlib.sha256()
+    size = await save_local(hashed(digest), key)
+    return {"url": f"/api/media/{local_name(key)}", "storage_type": "local", "size": size, "sha256": digest.hexdigest()}
+
+
+async def store_bytes(data: bytes, key: str, content_type: str, fallback_to_local: bool = False) -> dict:
+    """``store_chunks`` for content already in memory, sent to S3 as a single ``put_object``."""
+    sha256 = hashlib.sha256(data).hexdigest()
+    if s3_client:
+        try:
+            await s3_call("put_object", Bucket=S3_BUCKET_NAME, Key=key, Body=data, ContentType=content_type)
+            logger.info(f"Uploaded to S3: {key}")
+            return {"url": get_s3_url(key), "storage_type": "s3", "size": len(data), "sha256": sha256}
+        except Exception as e:
+            if not fallback_to_local:
+                raise
+            logger.error(f"S3 upload failed, falling back to local: {e}")
+    
+    async def chunks():
+        yield data
+    
+    size = await save_local(chunks(), key)
+    return {"url": f"/api/media/{local_name(key)}", "storage_type": "local", "size": size, "sha256": sha256}
+
+
+async def read_stored(key: str, storage_type: str) -> bytes:
+    """Whole content of a stored object."""
+    if storage_type == "s3":
+        response = await s3_call("get_object", Bucket=S3_BUCKET_NAME, Key=key)
+        return await asyncio.get_running_loop().run_in_executor(_s3_executor, response["Body"].read)
+    return await anyio.Path(UPLOAD_DIR / local_name(key)).read_bytes()
+
+
+async def delete_stored(keys: Iterable[str], storage_type: str):
+    """Delete stored objects (missing ones are ignored), in batches on S3."""
+    keys = list(keys)
+    if storage_type == "s3":
+        for i in range(0, len(keys), S3_DELETE_BATCH):
+            objects = [{"Key": key} for key in keys[i:i + S3_DELETE_BATCH]]
+            response = await s3_call("delete_objects", Bucket=S3_BUCKET_NAME, Delete={"Objects": objects, "Quiet": True})
+            for error in response.get("Errors", []):
+                logger.error(f"S3 delete failed for {error.get('Key')}: {error.get('Message')}")
+        return
+    for key in keys:
+        await anyio.Path(UPLOAD_DIR / local_name(key)).unlink(missing_ok=True)
+
+
+async def store_upload(file: UploadFile, key: str, max_size: int, fallback_to_local: bool = False) -> dict:
+    """``store_chunks`` for an UploadFile; raises ``UploadTooLarge`` if it passes ``max_size``."""
+    return await store_chunks(
+        lambda: iter_upload(file, max_size), key, file.content_type or "application/octet-stream",
+        fallback_to_local
+    )
+
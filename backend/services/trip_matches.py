@@ -0,0 +1,100 @@
+"""Materialized per-trip match lists.
+
+``trip_matches`` holds one document per schedule listing the other travelers
+whose schedules overlap it in space and time::
+
+    {"schedule_id": ..., "user_id": ..., "matches": [{"user_id", "schedule_id",
+     "their_destination", "their_dates", "distance_miles"}], "computed_at": ...}
+
+Lists are computed on first read and only invalidated when a schedule inside
+the trip's window is created or deleted, or the trip itself is removed.
+Profiles are not stored; callers hydrate them so avatars and names stay fresh.
+A TTL on ``computed_at`` bounds staleness if another worker's overlap index
+lagged when a list was computed.
+"""
+from datetime import datetime, timezone
+from typing import Dict, List
+
+from pymongo import ReplaceOne
+
+from services.database import db
+from services.overlap_index import overlap_index
+from services.recurrence import series_end_date
+
+MATCH_RADIUS_MILES = 50
+
+
+class TripMatchCache:
+    """Read-through cache of match lists keyed by schedule_id."""
+    
+    @property
+    def collection(self):
+        return db.trip_matches
+    
+    async def get_many(self, schedules: List[dict]) -> Dict[str, List[dict]]:
+        """Return match rows for each schedule, computing and storing any that are missing."""
+        ids = [s["schedule_id"] for s in schedules]
+        cached = {
+            doc["schedule_id"]: doc["matches"]
+            async for doc in self.collection.find({"schedule_id": {"$in": ids}}, {"_id": 0})
+        }
+    
+        computed = {}
+        for schedule in schedules:
+            if schedule["schedule_id"] not in cached:
+                computed[schedule["schedule_id"]] = await self._compute(schedule)
+        if computed:
+            now = datetime.now(timezone.utc)
+            owners = {s["schedule_id"]: s["user_id"] for s in schedules}
+            await self.collection.bulk_write([
+                ReplaceOne(
+                    {"schedule_id": schedule_id},
+                    {"schedule_id": schedule_id, "user_id": owners[schedule_id], "matches": matches, "computed_at": now},
+                    upsert=True
+                )
+                for schedule_id, matches in computed.items()
+            ], ordered=False)
+        return {**cached, **computed}
+    
+    async def _compute(self, schedule: dict) -> List[dict]:
+        # Recurring trips match against their upcoming occurrences only
+        today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+        overlapping = await overlap_index.query_schedule(
+            schedule, MATCH_RADIUS_MILES, window_start=max(schedule["start_date"], today),
+            exclude_user_id=schedule["user_id"]
+        )
+        # Nearest overlapping schedule per other traveler
+        nearest = {}
+        for other_sched, distance in overlapping:
+            nearest.setdefault(other_sched["user_id"], {
+                "user_id": other_sched["user_id"],
+                "schedule_id": other_sched["schedule_id"],
+                "their_destination": other_sched.get("destination"),
+                "their_dates": f"{other_sched['start_date']} - {other_sched['end_date']}",
+                "distance_miles": round(distance, 1)
+            })
+        return list(nearest.values())
+    
+    async def invalidate_for(self, schedule: dict):
+        """Drop the cached lists a created or deleted schedule could change, including its own."""
+        await self.invalidate_many([schedule])
+    
+    async def invalidate_many(self, schedules: List[dict]):
+        """``invalidate_for`` over several schedules with a single delete."""
+        affected = set()
+        for schedule in schedules:
+            affected.add(schedule["schedule_id"])
+            if schedule.get("latitude") is not None and schedule.get("longitude") is not None:
+                # The whole series envelope: over-invalidating is cheaper than missing a list
+                overlapping = await overlap_index.query(
+                    schedule["latitude"], schedule["longitude"], MATCH_RADIUS_MILES,
+                    schedule["start_date"], series_end_date(schedule),
+                    exclude_user_id=schedule["user_id"]
+                )
+                affected.update(other["schedule_id"] for other, _ in overlapping)
+        if affected:
+            await self.collection.delete_many({"schedule_id": {"$in": list(affected)}})
+
+
+# Global cache instance
+trip_match_cache = TripMatchCache()
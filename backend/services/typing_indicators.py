@@ -0,0 +1,94 @@
+"""Server-side typing indicator state with coalescing and rate limiting."""
+import asyncio
+import time
+from typing import Dict, Tuple
+
+from services.websocket import manager, ConnectionManager
+
+# "Is typing" auto-expires if no refresh arrives within this window
+TYPING_TIMEOUT_SECONDS = 6.0
+# Token bucket per sender connection for typing frames
+TYPING_FRAMES_PER_SECOND = 1.0
+TYPING_BURST = 3
+
+
+class TypingTracker:
+    """
+    Tracks typing state per (sender, recipient) and only forwards transitions.
+    
+    Keystroke-level "typing" frames refresh the expiry timer without reaching the
+    recipient; the recipient sees one ``is_typing: true`` when typing starts and
+    one ``is_typing: false`` when it stops, a message is sent, the sender
+    disconnects, or the state times out.
+    """
+    
+    def __init__(self, connection_manager: ConnectionManager, timeout: float = TYPING_TIMEOUT_SECONDS,
+                 rate: float = TYPING_FRAMES_PER_SECOND, burst: int = TYPING_BURST):
+        self.manager = connection_manager
+        self.timeout = timeout
+        self.rate = rate
+        self.burst = burst
+        self._expiry: Dict[Tuple[str, str], asyncio.TimerHandle] = {}
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+    
+    def _allow(self, sender: str) -> bool:
+        """Take a token from the sender's bucket; False means the frame is dropped."""
+        now = time.monotonic()
+        tokens, last = self._buckets.get(sender, (float(self.burst), now))
+        tokens = min(float(self.burst), tokens + (now - last) * self.rate)
+        if tokens < 1.0:
+            self._buckets[sender] = (tokens, now)
+            return False
+        self._buckets[sender] = (tokens - 1.0, now)
+        return True
+    
+    def _arm(self, key: Tuple[str, str]):
+        handle = self._expiry.pop(key, None)
+        if handle:
+            handle.cancel()
+        loop = asyncio.get_running_loop()
+        self._expiry[key] = loop.call_later(self.timeout, lambda: asyncio.create_task(self._expire(key)))
+    
+    async def _expire(self, key: Tuple[str, str]):
+        if self._expiry.pop(key, None):
+            await self.manager.send_typing_indicator(key[0], key[1], False)
+    
+    def is_typing(self, sender: str, recipient: str) -> bool:
+        return (sender, recipient) in self._expiry
+    
+    async def update(self, sender: str, recipient: str, is_typing: bool) -> bool:
+        """Apply a typing frame. Returns True if a state transition was forwarded."""
+        if not recipient:
+            return False
+        key = (sender, recipient)
+        active = key in self._expiry
+    
+        if not is_typing:
+            return await self.clear(sender, recipient)
+    
+        if not self._allow(sender):
+            return False
+        self._arm(key)
+        if active:
+            return False
+        await self.manager.send_typing_indicator(sender, recipient, True)
+        return True
+    
+    async def clear(self, sender: str, recipient: str) -> bool:
+        """Stop typing for a pair (e.g. the message was sent), forwarding the transition."""
+        handle = self._expiry.pop((sender, recipient), None)
+        if not handle:
+            return False
+        handle.cancel()
+        await self.manager.send_typing_indicator(sender, recipient, False)
+        return True
+    
+    async def forget(self, sender: str):
+        """Drop all state for a sender whose connection closed."""
+        self._buckets.pop(sender, None)
+        for key in [k for k in self._expiry if k[0] == sender]:
+            await self.clear(*key)
+
+
+# Global tracker instance
+typing_tracker = TypingTracker(manager)
@@ -0,0 +1,221 @@
+"""Resumable media uploads.
+
+A session in ``upload_sessions`` tracks one file sent over several requests::
+
+    {"upload_id", "user_id", "key", "content_type", "media_type", "size",
+     "offset", "parts": [{"offset", "size", "name"}], "status", "expires_at"}
+
+Each chunk is written to its own temp part under ``PARTS_DIR/<upload_id>``
+and committed by advancing ``offset`` only if it still matches the chunk's
+start, so a retried or duplicated chunk can never be applied twice. If the
+connection drops mid-chunk, the bytes that did arrive are kept and the client
+resumes from the new offset. On completion the parts are streamed, in order,
+into media storage (an S3 multipart upload when S3 is configured). The request
+doing that holds the session for ``ASSEMBLY_LEASE``, so a session left
+"assembling" by a worker that died can be completed again afterwards. Sessions
+idle past ``SESSION_TTL`` are removed along with their parts.
+"""
+import logging
+import os
+import shutil
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import AsyncIterator, Awaitable, Callable, Optional
+
+import anyio
+from pymongo import ReturnDocument
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import ClientDisconnect
+
+from services.database import db
+from services.background import periodic
+from services.storage import CHUNK_SIZE, store_chunks
+
+logger = logging.getLogger(__name__)
+
+PARTS_DIR = Path(os.environ.get("UPLOAD_PARTS_DIR", Path(__file__).parent.parent / "upload_parts"))
+SESSION_TTL = timedelta(hours=24)
+ASSEMBLY_LEASE = timedelta(minutes=10)
+EXPIRY_INTERVAL_SECONDS = 30 * 60
+
+
+class ChunkRejected(Exception):
+    """A chunk that does not fit the session; ``offset`` is where the client should resume."""
+    
+    def __init__(self, message: str, offset: int):
+        super().__init__(message)
+        self.offset = offset
+
+
+class ResumableUploads:
+    """Create, append to, complete and expire upload sessions."""
+    
+    @property
+    def collection(self):
+        return db.upload_sessions
+    
+    async def create(self, user_id: str, key: str, content_type: str, media_type: str, size: int) -> dict:
+        now = datetime.now(timezone.utc)
+        session = {
+            "upload_id": f"upload_{uuid.uuid4().hex}",
+            "user_id": user_id,
+            "key": key,
+            "content_type": content_type,
+            "media_type": media_type,
+            "size": size,
+            "offset": 0,
+            "parts": [],
+            "status": "open",
+            "created_at": now,
+            "expires_at": now + SESSION_TTL
+        }
+        await self.collection.insert_one(session)
+        session.pop("_id", None)
+        return session
+    
+    async def get(self, upload_id: str, user_id: str) -> Optional[dict]:
+        return await self.collection.find_one({"upload_id": upload_id, "user_id": user_id}, {"_id": 0})
+    
+    async def append(self, session: dict, offset: int, stream: AsyncIterator[bytes]) -> int:
+        """
+        Write a chunk starting at ``offset`` and return the session's new offset.
+    
+        Raises ``ChunkRejected`` if the offset is not the session's current one,
+        the chunk runs past the declared size, or another request got there first.
+        """
+        if session["status"] == "complete":
+            raise ChunkRejected("Upload is already complete", session["offset"])
+        if session["status"] != "open":
+            raise ChunkRejected("Upload is being completed", session["offset"])
+        if offset != session["offset"]:
+            raise ChunkRejected("Offset does not match the upload", session["offset"])
+        remaining = session["size"] - offset
+    
+        directory = PARTS_DIR / session["upload_id"]
+        await anyio.Path(directory).mkdir(parents=True, exist_ok=True)
+        name = f"{offset:012d}_{uuid.uuid4().hex[:8]}.part"
+        path = directory / name
+        written = 0
+        try:
+            async with await anyio.open_file(path, "wb") as f:
+                try:
+                    async for chunk in stream:
+                        if written + len(chunk) > remaining:
+                            raise ChunkRejected("Chunk runs past the declared size", offset)
+                        await f.write(chunk)
+                        written += len(chunk)
+                except ClientDisconnect:
+                    # Keep what arrived; the client resumes from the new offset
+                    pass
+        except BaseException:
+            path.unlink(missing_ok=True)
+            raise
+    
+        committed = None
+        if written:
+            now = datetime.now(timezone.utc)
+            committed = await self.collection.find_one_and_update(
+                {"upload_id": session["upload_id"], "offset": offset, "status": "open"},
+                {
+                    "$set": {"offset": offset + written, "expires_at": now + SESSION_TTL},
+                    "$push": {"parts": {"offset": offset, "size": written, "name": name}}
+                },
+                projection={"_id": 0, "offset": 1},
+                return_document=ReturnDocument.AFTER
+            )
+        if committed is None:
+            path.unlink(missing_ok=True)
+            if written:
+                current = await self.collection.find_one({"upload_id": session["upload_id"]}, {"offset": 1})
+                raise ChunkRejected("Another request wrote this chunk", (current or session)["offset"])
+        return committed["offset"] if committed else offset
+    
+    async def _read_parts(self, session: dict) -> AsyncIterator[bytes]:
+        directory = PARTS_DIR / session["upload_id"]
+        for part in sorted(session["parts"], key=lambda p: p["offset"]):
+            async with await anyio.open_file(directory / part["name"], "rb") as f:
+                while True:
+                    chunk = await f.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    yield chunk
+    
+    async def complete(self, session: dict, record: Callable[[dict], Awaitable[dict]]) -> dict:
+        """
+        Assemble the parts into media storage and pass ``{"url", "storage_type",
+        "size"}`` to ``record``, which returns the media document to keep on the
+        session. Only one request can complete a session at a time; a claim older
+        than ``ASSEMBLY_LEASE`` is treated as abandoned.
+        """
+        now = datetime.now(timezone.utc)
+        assembly_id = uuid.uuid4().hex
+        claimed = await self.collection.find_one_and_update(
+            {
+                "upload_id": session["upload_id"], "offset": session["size"],
+                "$or": [{"status": "open"}, {"status": "assembling", "assembling_until": {"$lt": now}}]
+            },
+            {"$set": {"status": "assembling", "assembly_id": assembly_id, "assembling_until": now + ASSEMBLY_LEASE}}
+        )
+        if claimed is None:
+            raise ChunkRejected("Upload is incomplete or already being completed", session["offset"])
+        if claimed["status"] == "assembling":
+            logger.warning(f"Reclaimed upload {session['upload_id']} left assembling since {claimed['assembling_until']}")
+        ours = {"upload_id": session["upload_id"], "assembly_id": assembly_id}
+        try:
+            stored = await store_chunks(
+                lambda: self._read_parts(session), session["key"], session["content_type"], fallback_to_local=True
+            )
+            media = await record(stored)
+        except BaseException:
+            with anyio.CancelScope(shield=True):
+                await self.collection.update_one(ours, {"$set": {"status": "open"}})
+            raise
+        await self.collection.update_one(
+            ours,
+            {"$set": {
+                "status": "complete", "media_id": media["media_id"], "parts": [],
+                "expires_at": datetime.now(timezone.utc) + SESSION_TTL
+            }}
+        )
+        await self._remove_parts(session["upload_id"])
+        return media
+    
+    async def abort(self, session: dict):
+        await self.collection.delete_one({"upload_id": session["upload_id"]})
+        await self._remove_parts(session["upload_id"])
+    
+    async def _remove_parts(self, upload_id: str):
+        await run_in_threadpool(shutil.rmtree, PARTS_DIR / upload_id, True)
+    
+    async def expire(self):
+        """Drop sessions idle past their expiry, and part directories no session owns."""
+        now = datetime.now(timezone.utc)
+        expired = [
+            doc["upload_id"]
+            async for doc in self.collection.find({"expires_at": {"$lt": now}}, {"_id": 0, "upload_id": 1})
+        ]
+        for upload_id in expired:
+            await self._remove_parts(upload_id)
+        if expired:
+            await self.collection.delete_many({"upload_id": {"$in": expired}})
+            logger.info(f"Expired {len(expired)} upload sessions")
+    
+        if PARTS_DIR.exists():
+            cutoff = (now - SESSION_TTL).timestamp()
+            stale = [d.name for d in PARTS_DIR.iterdir() if d.is_dir() and d.stat().st_mtime < cutoff]
+            known = {
+                doc["upload_id"]
+                async for doc in self.collection.find({"upload_id": {"$in": stale}}, {"_id": 0, "upload_id": 1})
+            }
+            for upload_id in set(stale) - known:
+                await self._remove_parts(upload_id)
+
+
+# Global instance
+resumable_uploads = ResumableUploads()
+
+
+@periodic("expire_upload_sessions", EXPIRY_INTERVAL_SECONDS)
+async def expire_upload_sessions():
+    await resumable_uploads.expire()
@@ -1,23 +1,40 @@
 """WebSocket connection manager for real-time chat."""
 from fastapi import WebSocket
-from typing import Dict
+from typing import Awaitable, Callable, Dict, Optional, Set
 from datetime import datetime, timezone
+import asyncio
+import time
+
+# RPC frames one socket may have running at once
+MAX_CONCURRENT_RPCS = 8
+# How long a socket's principal is trusted before its session is checked again
+SESSION_RECHECK_SECONDS = 60
 
 
 class ConnectionManager:
     def __init__(self):
         self.active_connections: Dict[str, WebSocket] = {}
         self.user_status: Dict[str, dict] = {}
+        # Principal authenticated at connect time, reused for every RPC frame
+        self.principals: Dict[str, dict] = {}
+        # Conversation each connected user currently has on screen
+        self.focused_conversations: Dict[str, str] = {}
     
-    async def connect(self, websocket: WebSocket, user_id: str):
+    async def connect(self, websocket: WebSocket, user_id: str, principal: Optional[dict] = None):
         await websocket.accept()
         self.active_connections[user_id] = websocket
+        if principal:
+            self.principals[user_id] = principal
+        else:
+            self.principals.pop(user_id, None)
         self.user_status[user_id] = {"online": True, "last_seen": datetime.now(timezone.utc).isoformat()}
         await self.broadcast_status(user_id, True)
     
     def disconnect(self, user_id: str):
         if user_id in self.active_connections:
             del self.active_connections[user_id]
+        self.principals.pop(user_id, None)
+        self.focused_conversations.pop(user_id, None)
         self.user_status[user_id] = {"online": False, "last_seen": datetime.now(timezone.utc).isoformat()}
     
     async def send_personal_message(self, message: dict, user_id: str):
@@ -52,9 +69,65 @@ class ConnectionManager:
             except:
                 pass
     
+    def set_focus(self, user_id: str, conversation_id: Optional[str]):
+        if conversation_id and user_id in self.active_connections:
+            self.focused_conversations[user_id] = conversation_id
+        else:
+            self.focused_conversations.pop(user_id, None)
+    
+    def is_focused(self, user_id: str, conversation_id: str) -> bool:
+        return user_id in self.active_connections and self.focused_conversations.get(user_id) == conversation_id
+    
+    def get_principal(self, user_id: str) -> Optional[dict]:
+        return self.principals.get(user_id)
+    
     def is_online(self, user_id: str) -> bool:
         return user_id in self.active_connections
 
 
+class RpcConnection:
+    """
+    One socket's RPC state. At most ``max_concurrent`` frames run at once,
+    and the principal is re-authenticated once it is older than
+    ``recheck_seconds``, so a logout or expired session also stops RPCs on
+    sockets that are already open.
+    """
+    
+    def __init__(self, principal: Optional[dict], authenticate: Callable[[], Awaitable[Optional[dict]]],
+                 max_concurrent: int = MAX_CONCURRENT_RPCS, recheck_seconds: float = SESSION_RECHECK_SECONDS):
+        self.principal = principal
+        self.tasks: Set[asyncio.Task] = set()
+        self._authenticate = authenticate
+        self._recheck_seconds = recheck_seconds
+        self._checked_at = time.monotonic()
+        self._check_lock = asyncio.Lock()
+        self._slots = asyncio.Semaphore(max_concurrent)
+    
+    async def current_principal(self) -> Optional[dict]:
+        """The principal, re-authenticated if due; None once the session is gone."""
+        if self.principal is None or time.monotonic() - self._checked_at < self._recheck_seconds:
+            return self.principal
+        async with self._check_lock:
+            if self.principal is not None and time.monotonic() - self._checked_at >= self._recheck_seconds:
+                self.principal = await self._authenticate()
+                self._checked_at = time.monotonic()
+        return self.principal
+    
+    async def submit(self, run: Callable[[], Awaitable]):
+        """Start ``run()`` once a slot is free; while waiting the socket reads no more frames."""
+        await self._slots.acquire()
+        task = asyncio.create_task(run())
+        self.tasks.add(task)
+        task.add_done_callback(self._finished)
+    
+    def _finished(self, task: asyncio.Task):
+        self.tasks.discard(task)
+        self._slots.release()
+    
+    def cancel(self):
+        for task in list(self.tasks):
+            task.cancel()
+
+
 # Global manager instance
 manager = ConnectionManager()
@@ -0,0 +1,95 @@
+"""
+Journeyman Dating App - Candidate Cache Tests
+Tests single-flight loading, invalidation and geo keys of the discovery caches
+"""
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "journeyman_test")
+
+from services.cache import CoalescingCache, geo_key, geo_search_area, invalidate_near
+from utils.helpers import calculate_distance
+
+
+class TestCoalescingCache:
+    """Test that identical misses share one load"""
+    
+    def test_concurrent_misses_load_once(self):
+        calls = []
+    
+        async def loader():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return ["candidate"]
+    
+        async def run():
+            cache = CoalescingCache(ttl=60)
+            first = await asyncio.gather(*(cache.get("key", loader) for _ in range(50)))
+            second = await cache.get("key", loader)
+            return first, second
+    
+        first, second = asyncio.run(run())
+        assert len(calls) == 1
+        assert all(result == ["candidate"] for result in first)
+        assert second == ["candidate"]
+        print("SUCCESS: 51 lookups ran the loader once")
+    
+    def test_invalidation_during_load_is_not_cached(self):
+        calls = []
+    
+        async def run():
+            cache = CoalescingCache(ttl=60)
+    
+            async def loader():
+                calls.append(1)
+                await asyncio.sleep(0.01)
+                return len(calls)
+    
+            pending = asyncio.ensure_future(cache.get("key", loader))
+            await asyncio.sleep(0)
+            cache.invalidate()
+            stale = await pending
+            fresh = await cache.get("key", loader)
+            return stale, fresh
+    
+        stale, fresh = asyncio.run(run())
+        assert (stale, fresh) == (1, 2)
+        print("SUCCESS: Load racing a write was not stored")
+
+
+class TestGeoKeys:
+    """Test that a cell's search area covers every query sharing its key"""
+    
+    def test_search_area_covers_cell(self):
+        for lat, lon in [(40.71, -74.0), (40.74, -73.76), (64.9, -147.7), (-33.86, 151.2)]:
+            key = geo_key(lat, lon, 40, "2026-10-19")
+            center_lat, center_lon, radius = geo_search_area(key)
+            assert key[1] == 50
+            # Anything within 50 miles of the user is inside the shared search
+            assert calculate_distance(center_lat, center_lon, lat, lon) + 50 <= radius
+        print("SUCCESS: Search areas cover their cells")
+    
+    def test_invalidate_near(self):
+        async def run():
+            cache = CoalescingCache(ttl=60)
+            nyc = geo_key(40.71, -74.0, 50)
+            la = geo_key(34.05, -118.24, 50)
+            calls = []
+    
+            async def loader():
+                calls.append(1)
+                return []
+    
+            for key in (nyc, la):
+                await cache.get(key, loader)
+            invalidate_near(cache, 40.9, -73.9)
+            for key in (nyc, la):
+                await cache.get(key, loader)
+            return len(calls)
+    
+        # Only New York reloads
+        assert asyncio.run(run()) == 3
+        print("SUCCESS: Writes invalidate only nearby cells")
@@ -0,0 +1,142 @@
+"""
+Journeyman Dating App - Change Feed Tests
+Tests that index writes on one worker reach the others, and exclusive periodic jobs
+"""
+import asyncio
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "journeyman_test")
+
+from services import background
+from services.change_feed import ChangeFeed
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+    
+    def sort(self, field, direction):
+        self.docs.sort(key=lambda d: d[field], reverse=direction < 0)
+        return self
+    
+    def __aiter__(self):
+        return self._iter()
+    
+    async def _iter(self):
+        for doc in self.docs:
+            yield doc
+
+
+class FakeChanges:
+    def __init__(self):
+        self.docs = []
+    
+    async def insert_many(self, docs, ordered=True):
+        for doc in docs:
+            # Stored the way MongoDB returns it: naive UTC
+            self.docs.append({**doc, "_id": ObjectId(), "at": doc["at"].replace(tzinfo=None)})
+    
+    def find(self, query):
+        cutoff = query["at"]["$gte"].replace(tzinfo=None)
+        return FakeCursor([dict(d) for d in self.docs if d["at"] >= cutoff])
+
+
+@pytest.fixture
+def workers(monkeypatch):
+    changes = FakeChanges()
+    monkeypatch.setattr(ChangeFeed, "collection", property(lambda self: changes))
+    applied = {"a": [], "b": []}
+    feeds = {}
+    for name in applied:
+        feeds[name] = ChangeFeed()
+    
+        async def handler(entries, name=name):
+            applied[name].extend(e["id"] for e in entries)
+    
+        feeds[name].subscribe("schedule", handler)
+    return feeds, applied, changes
+
+
+class TestChangeFeed:
+    """Test that each worker applies other workers' changes exactly once"""
+    
+    def test_remote_changes_applied_once(self, workers):
+        feeds, applied, changes = workers
+    
+        async def run():
+            await feeds["a"].publish("schedule", ["s1", "s2"], {"user_id": "u1"})
+            await feeds["b"].publish("schedule", ["s3"], {"user_id": "u2"})
+            for _ in range(2):
+                await feeds["a"].catch_up()
+                await feeds["b"].catch_up()
+    
+        asyncio.run(run())
+        assert applied == {"a": ["s3"], "b": ["s1", "s2"]}
+        print("SUCCESS: Workers apply each other's changes once and skip their own")
+    
+    def test_late_insert_inside_overlap_applied(self, workers):
+        feeds, applied, changes = workers
+    
+        async def run():
+            await feeds["a"].publish("schedule", ["s1"])
+            await feeds["b"].catch_up()
+            # Stamped before the newest entry b has seen (clock skew or a slow insert)
+            await feeds["a"].publish("schedule", ["s2"])
+            changes.docs[-1]["at"] -= timedelta(seconds=2)
+            await feeds["b"].catch_up()
+    
+        asyncio.run(run())
+        assert applied["b"] == ["s1", "s2"]
+        print("SUCCESS: Out-of-order entries inside the overlap window are not missed")
+
+
+class FakeLeases:
+    """A collection with a unique index on name"""
+    
+    def __init__(self):
+        self.docs = {}
+    
+    async def update_one(self, query, update, upsert=False):
+        doc = self.docs.get(query["name"])
+        if doc is None:
+            self.docs[query["name"]] = {"name": query["name"], **update["$set"]}
+            return
+        held_by_other = doc["worker_id"] != query["$or"][1]["worker_id"]
+        if held_by_other and doc["lease_until"] > query["$or"][0]["lease_until"]["$lte"]:
+            raise DuplicateKeyError("E11000 duplicate key")
+        doc.update(update["$set"])
+
+
+class FakeDb:
+    def __init__(self):
+        self.periodic_leases = FakeLeases()
+
+
+class TestExclusivePeriodic:
+    """Test that an exclusive periodic job runs on one worker per interval"""
+    
+    def test_lease(self, monkeypatch):
+        fake = FakeDb()
+        monkeypatch.setattr(background, "db", fake)
+    
+        async def run():
+            monkeypatch.setattr(background, "_worker_id", "worker_a")
+            first = await background.take_lease("heatmap", 600)
+            renewed = await background.take_lease("heatmap", 600)
+            monkeypatch.setattr(background, "_worker_id", "worker_b")
+            other = await background.take_lease("heatmap", 600)
+            fake.periodic_leases.docs["heatmap"]["lease_until"] = datetime.now(timezone.utc) - timedelta(seconds=1)
+            after_expiry = await background.take_lease("heatmap", 600)
+            return first, renewed, other, after_expiry
+    
+        assert asyncio.run(run()) == (True, True, False, True)
+        assert fake.periodic_leases.docs["heatmap"]["worker_id"] == "worker_b"
+        print("SUCCESS: Only the lease holder runs the job until the lease expires")
@@ -0,0 +1,127 @@
+"""
+Journeyman Dating App - Route Corridor Tests
+Tests for polyline decoding, ETA interpolation and corridor search
+"""
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "journeyman_test")
+
+from services.corridors import decode_polyline, build_route, RouteIndex, IndexedRoute
+from services.overlap_index import OverlapIndex
+
+
+def road_trip(route, start_date="2031-05-01", end_date="2031-05-04", **extra):
+    return {
+        "schedule_id": "sched_road",
+        "user_id": "user_trucker",
+        "destination": "Los Angeles",
+        "start_date": start_date,
+        "end_date": end_date,
+        "route": route,
+        **extra
+    }
+
+
+class TestRouteParsing:
+    """Test that waypoints and polylines become route vertices"""
+    
+    def test_decode_polyline(self):
+        points = decode_polyline("_p~iF~ps|U_ulLnnqC_mqNvxq`@")
+        assert points == [[38.5, -120.2], [40.7, -120.95], [43.252, -126.453]]
+        with pytest.raises(ValueError):
+            decode_polyline("_p~iF~ps|U_ulL")
+        print("SUCCESS: Polyline decoded")
+    
+    def test_waypoint_etas_become_anchors(self):
+        route, anchors = build_route(waypoints=[
+            {"latitude": 41.88, "longitude": -87.63},
+            {"latitude": 39.74, "longitude": -104.99, "eta": "2031-05-02"},
+            {"latitude": 34.05, "longitude": -118.24}
+        ])
+        assert len(route) == 3 and anchors == {1: "2031-05-02"}
+        with pytest.raises(ValueError):
+            build_route(waypoints=[{"latitude": 41.88, "longitude": -87.63}])
+        print("SUCCESS: Waypoints parsed with ETA anchors")
+
+
+class TestCorridorSearch:
+    """Test point-to-segment corridor matching with ETAs"""
+    
+    # Chicago -> Denver -> Los Angeles, driven over four days
+    ROUTE = [[41.88, -87.63], [39.74, -104.99], [34.05, -118.24]]
+    
+    def test_passes_between_vertices(self):
+        index = RouteIndex()
+        index.add(road_trip(self.ROUTE, route_eta_anchors={"1": "2031-05-02"}))
+        
+        # Omaha-ish: far from every vertex but close to the Chicago-Denver segment
+        hits = index.search(41.0, -96.0, 50, "2031-05-01", "2031-05-02")
+        assert len(hits) == 1
+        schedule, distance = hits[0]
+        assert distance <= 50
+        assert schedule["passing_date"] in ("2031-05-01", "2031-05-02")
+        assert "route" not in schedule
+        print(f"SUCCESS: Route matched {distance} miles away on {schedule['passing_date']}")
+    
+    def test_eta_window_filters(self):
+        index = RouteIndex()
+        index.add(road_trip(self.ROUTE, route_eta_anchors={"1": "2031-05-02"}))
+        # Near Denver, which the route reaches on May 2nd, not May 4th
+        assert index.search(39.74, -104.99, 30, "2031-05-04", "2031-05-10") == []
+        assert index.search(39.74, -104.99, 30, "2031-05-02", "2031-05-02")[0][0]["passing_date"] == "2031-05-02"
+        assert index.search(39.74, -104.99, 30, "2031-05-02", "2031-05-02", exclude_user_id="user_trucker") == []
+        print("SUCCESS: Corridor matches respect the expected time at the segment")
+    
+    def test_matches_dense_sampling(self, monkeypatch):
+        rng = np.random.default_rng(3)
+        # A wiggly 5000-vertex route across the US
+        lon = np.linspace(-120, -75, 5000)
+        lat = 38 + 3 * np.sin(lon / 3) + rng.normal(0, 0.02, lon.size)
+        route = np.column_stack([lat, lon]).tolist()
+        index = RouteIndex()
+        index.add(road_trip(route, end_date="2031-05-10"))
+        
+        # Densely sample the route to approximate the true nearest distance
+        fine = np.column_stack([np.interp(np.linspace(0, 4999, 200000), np.arange(5000), lat),
+                                np.interp(np.linspace(0, 4999, 200000), np.arange(5000), lon)])
+        for _ in range(20):
+            qlat, qlon = rng.uniform(33, 43), rng.uniform(-118, -77)
+            dy = (fine[:, 0] - qlat) * 69.0
+            dx = (fine[:, 1] - qlon) * 69.0 * np.cos(np.radians(qlat))
+            expected = np.hypot(dx, dy).min()
+            hits = index.search(qlat, qlon, 100, "2031-05-01", "2031-05-10")
+            if expected <= 99:
+                assert hits and abs(hits[0][1] - expected) < 0.5
+            elif expected > 101:
+                assert hits == []
+        
+        # Only segments in the cells around the point are measured
+        examined = []
+        closest = IndexedRoute.closest
+        
+        def spy(route, segments, *args):
+            examined.append(len(segments))
+            return closest(route, segments, *args)
+        
+        monkeypatch.setattr(IndexedRoute, "closest", spy)
+        on_route = int(np.argmin(np.abs(lon + 100)))
+        assert index.search(lat[on_route] + 0.5, -100.0, 100, "2031-05-01", "2031-05-10")
+        assert examined and sum(examined) < 5000 // 5
+        print(f"SUCCESS: 5000-vertex corridor search measured {sum(examined)} segments")
+    
+    def test_overlap_index_keeps_route_out_of_results(self):
+        index = OverlapIndex()
+        index.add(road_trip(self.ROUTE, latitude=34.05, longitude=-118.24, route_eta_anchors={"1": "2031-05-02"}))
+        [(schedule, _)] = index.search(34.05, -118.24, 10, "2031-05-04", "2031-05-04")
+        assert "route" not in schedule and "route_eta_anchors" not in schedule
+        [(passing, _)] = index.search_routes(41.0, -96.0, 50, "2031-05-01", "2031-05-02")
+        assert passing["schedule_id"] == "sched_road" and "route" not in passing
+        index.remove("sched_road")
+        assert index.search_routes(41.0, -96.0, 50, "2031-05-01", "2031-05-02") == []
+        print("SUCCESS: Routes are indexed but not returned with schedules")
@@ -0,0 +1,160 @@
+"""
+Journeyman Dating App - Direct Upload Tests
+Tests signed local upload URLs and upload intent completion
+"""
+import asyncio
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "journeyman_test")
+
+from services import storage
+from services.direct_uploads import UploadIntents, IntentRejected, verify_upload_signature
+
+
+class FakeIntents:
+    """upload_intents stand-in supporting the operations UploadIntents uses"""
+    
+    def __init__(self):
+        self.docs = {}
+    
+    def _match(self, doc, query):
+        return all(
+            doc.get(k) in v["$in"] if isinstance(v, dict) else doc.get(k) == v
+            for k, v in query.items()
+        )
+    
+    async def insert_one(self, doc):
+        self.docs[doc["intent_id"]] = dict(doc)
+    
+    async def find_one(self, query, projection=None):
+        doc = self.docs.get(query["intent_id"])
+        return dict(doc) if doc and self._match(doc, query) else None
+    
+    async def find_one_and_update(self, query, update):
+        doc = self.docs.get(query["intent_id"])
+        if not doc or not self._match(doc, query):
+            return None
+        before = dict(doc)
+        doc.update(update["$set"])
+        return before
+    
+    async def update_one(self, query, update):
+        self.docs[query["intent_id"]].update(update["$set"])
+    
+    async def delete_one(self, query):
+        self.docs.pop(query["intent_id"], None)
+    
+    async def find(self, query, projection=None):
+        for doc in list(self.docs.values()):
+            if doc["expires_at"] < query["expires_at"]["$lt"]:
+                yield dict(doc)
+    
+    async def delete_many(self, query):
+        for intent_id in query["intent_id"]["$in"]:
+            self.docs.pop(intent_id, None)
+
+
+async def chunks(data, size=1000):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "UPLOAD_DIR", tmp_path)
+    monkeypatch.setattr(storage, "s3_client", None)
+    intents = FakeIntents()
+    monkeypatch.setattr(UploadIntents, "collection", property(lambda self: intents))
+    return UploadIntents()
+
+
+class TestDirectUploads:
+    """Test the local upload intent flow"""
+    
+    def test_signed_upload_and_complete(self, service, tmp_path):
+        data = os.urandom(5000)
+    
+        async def run():
+            intent = await service.create("user_1", "gallery/user_1/a.jpg", "image/jpeg", "image", "gallery", len(data))
+            query = parse_qs(urlparse(intent["upload"]["url"]).query)
+            expires, signature = int(query["expires"][0]), query["signature"][0]
+            assert verify_upload_signature(intent["intent_id"], expires, signature)
+            assert not verify_upload_signature("intent_other", expires, signature)
+            assert not verify_upload_signature(intent["intent_id"], int(time.time()) - 1, signature)
+    
+            # Nothing to complete until the bytes arrive
+            with pytest.raises(IntentRejected):
+                await service.complete(intent, None)
+    
+            assert await service.receive_local(intent, chunks(data)) == len(data)
+            with pytest.raises(IntentRejected):
+                await service.receive_local(intent, chunks(data))
+    
+            async def record(stored):
+                return {"media_id": "media_1", **stored}
+    
+            return await service.complete(intent, record), await service.get(intent["intent_id"])
+    
+        media, intent = asyncio.run(run())
+        assert media["url"] == "/api/media/gallery_user_1_a.jpg" and media["size"] == len(data)
+        assert (tmp_path / "gallery_user_1_a.jpg").read_bytes() == data
+        assert intent["status"] == "complete" and intent["media_id"] == "media_1"
+        print("SUCCESS: Signed local upload received and completed")
+    
+    def test_size_mismatch_rejected(self, service, tmp_path):
+        async def run():
+            intent = await service.create("user_1", "user_1/b.jpg", "image/jpeg", "image", "media", 3000)
+            with pytest.raises(IntentRejected):
+                await service.receive_local(intent, chunks(os.urandom(4000)))
+            with pytest.raises(IntentRejected):
+                await service.receive_local(intent, chunks(os.urandom(2000)))
+            return await service.get(intent["intent_id"])
+    
+        assert asyncio.run(run())["status"] == "pending"
+        assert list(tmp_path.iterdir()) == []
+        print("SUCCESS: Uploads not matching the declared size are discarded")
+    
+    def test_failed_record_deletes_object(self, service, tmp_path):
+        data = os.urandom(2000)
+    
+        async def run():
+            intent = await service.create("user_1", "gallery/user_1/c.jpg", "image/jpeg", "image", "gallery", len(data))
+            await service.receive_local(intent, chunks(data))
+    
+            async def record(stored):
+                raise ValueError("gallery full")
+    
+            with pytest.raises(ValueError):
+                await service.complete(intent, record)
+            return await service.get(intent["intent_id"])
+    
+        assert asyncio.run(run()) is None
+        assert list(tmp_path.iterdir()) == []
+        print("SUCCESS: An upload that fails to record leaves no object behind")
+    
+    def test_expire_deletes_uncompleted_objects(self, service, tmp_path):
+        async def run():
+            kept = await service.create("user_1", "user_1/live.jpg", "image/jpeg", "image", "media", 100)
+            abandoned = await service.create("user_1", "user_1/gone.jpg", "image/jpeg", "image", "media", 100)
+            done = await service.create("user_1", "user_1/done.jpg", "image/jpeg", "image", "media", 100)
+            for intent in (kept, abandoned, done):
+                await service.receive_local(intent, chunks(os.urandom(100)))
+            service.collection.docs[done["intent_id"]]["status"] = "complete"
+            long_ago = datetime.now(timezone.utc) - timedelta(days=2)
+            for intent in (abandoned, done):
+                service.collection.docs[intent["intent_id"]]["expires_at"] = long_ago
+            await service.expire()
+            return service.collection.docs
+    
+        docs = asyncio.run(run())
+        assert [doc["key"] for doc in docs.values()] == ["user_1/live.jpg"]
+        assert sorted(p.name for p in tmp_path.iterdir()) == ["user_1_done.jpg", "user_1_live.jpg"]
+        print("SUCCESS: Expired intents are dropped along with objects never recorded")
@@ -0,0 +1,71 @@
+"""
+Journeyman Dating App - Media Serving Tests
+Tests ETag revalidation and byte-range responses for local media
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "journeyman_test")
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.testclient import TestClient
+
+from services.file_responses import file_response, parse_range, resolve_upload
+
+CONTENT = bytes(range(256)) * 4096
+
+
+@pytest.fixture
+def client(tmp_path):
+    (tmp_path / "clip.mp4").write_bytes(CONTENT)
+    app = FastAPI()
+    
+    @app.api_route("/media/{filename}", methods=["GET", "HEAD"])
+    async def media(filename: str, request: Request):
+        path = resolve_upload(tmp_path, filename)
+        if path is None:
+            raise HTTPException(status_code=404)
+        return await file_response(request, path, "video/mp4")
+    
+    return TestClient(app)
+
+
+class TestFileResponses:
+    """Conditional and range requests for served files"""
+    
+    def test_full_and_conditional(self, client):
+        response = client.get("/media/clip.mp4")
+        assert response.status_code == 200
+        assert response.content == CONTENT
+        assert response.headers["accept-ranges"] == "bytes"
+        etag = response.headers["etag"]
+    
+        assert client.get("/media/clip.mp4", headers={"If-None-Match": etag}).status_code == 304
+        head = client.head("/media/clip.mp4")
+        assert head.headers["content-length"] == str(len(CONTENT)) and head.content == b""
+        assert client.get("/media/..%2Fclip.mp4").status_code == 404
+        print("SUCCESS: Full response carries an ETag that revalidates with 304")
+    
+    def test_ranges(self, client):
+        response = client.get("/media/clip.mp4", headers={"Range": "bytes=1000-1999"})
+        assert response.status_code == 206
+        assert response.content == CONTENT[1000:2000]
+        assert response.headers["content-range"] == f"bytes 1000-1999/{len(CONTENT)}"
+    
+        tail = client.get("/media/clip.mp4", headers={"Range": "bytes=-10"})
+        assert tail.content == CONTENT[-10:]
+    
+        stale = client.get("/media/clip.mp4", headers={"Range": "bytes=0-9", "If-Range": '"stale"'})
+        assert stale.status_code == 200 and len(stale.content) == len(CONTENT)
+    
+        unsatisfiable = client.get("/media/clip.mp4", headers={"Range": f"bytes={len(CONTENT)}-"})
+        assert unsatisfiable.status_code == 416
+        assert unsatisfiable.headers["content-range"] == f"bytes */{len(CONTENT)}"
+    
+        assert parse_range("bytes=0-1,4-5", 10) is None
+        assert parse_range("bytes=5-100", 10) == (5, 9)
+        print("SUCCESS: Single byte ranges are served with 206 and validated")
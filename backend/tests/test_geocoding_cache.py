@@ -0,0 +1,148 @@
+"""
+Journeyman Dating App - Geocoding Cache Tests
+Tests coalescing, the shared Mongo cache, reverse cells and the upstream rate limit
+"""
+import asyncio
+import os
+import sys
+from datetime import timedelta
+
+import httpx
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "journeyman_test")
+
+from pymongo.errors import DuplicateKeyError
+
+from services import http_client
+from services.geocoding import Geocoder, GeocodingBusy, SharedRateLimit, TokenBucket, reverse_cell
+
+
+class FakeCollection:
+    def __init__(self):
+        self.docs = {}
+    
+    async def find_one(self, query, projection=None):
+        return self.docs.get(query["key"])
+    
+    async def update_one(self, query, update, upsert=False):
+        self.docs[query["key"]] = dict(update["$set"])
+
+
+class FakeRateLimits:
+    """rate_limits stand-in evaluating SharedRateLimit's conditional pipeline update"""
+    
+    def __init__(self):
+        self.docs = {}
+    
+    async def find_one_and_update(self, query, pipeline, upsert=False, return_document=None):
+        doc = self.docs.get(query["_id"])
+        latest = query.get("$or", [{"next_at": {"$lte": None}}])[0]["next_at"]["$lte"]
+        if doc and latest is not None and doc["next_at"] > latest:
+            raise DuplicateKeyError("E11000 duplicate key")
+        add = pipeline[0]["$set"]["next_at"]["$add"]
+        now, interval = add[0]["$max"][1], add[1]
+        doc = self.docs[query["_id"]] = {"next_at": max(doc["next_at"] if doc else now, now) + timedelta(milliseconds=interval)}
+        return dict(doc)
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    calls = []
+    
+    async def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        await asyncio.sleep(0.01)
+        if request.url.path.endswith("/reverse"):
+            return httpx.Response(200, json={"address": {"town": "Hounslow", "state": "England", "country": "UK"}})
+        return httpx.Response(200, json=[{
+            "class": "place", "type": "city", "name": "Paris", "lat": "48.85", "lon": "2.35",
+            "address": {"city": "Paris", "state": "Ile-de-France", "country": "France"}
+        }])
+    
+    collection, rate_limits = FakeCollection(), FakeRateLimits()
+    monkeypatch.setattr(http_client, "_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(Geocoder, "collection", property(lambda self: collection))
+    monkeypatch.setattr(SharedRateLimit, "collection", property(lambda self: rate_limits))
+    return calls
+
+
+class TestGeocodingCache:
+    """Test that repeated lookups reuse one upstream call across requests and processes"""
+    
+    def test_concurrent_searches_coalesced(self, upstream):
+        geocoder = Geocoder(rate=100)
+    
+        async def run():
+            return await asyncio.gather(*(geocoder.search_cities(q) for q in ["Paris", "paris ", " PARIS"] * 5))
+    
+        results = asyncio.run(run())
+        assert len(upstream) == 1
+        assert all(r == results[0] for r in results)
+        assert results[0][0]["display_name"] == "Paris, Ile-de-France, France"
+        print("SUCCESS: 15 concurrent city searches made 1 upstream call")
+    
+    def test_shared_cache_serves_other_workers(self, upstream):
+        async def run():
+            first = await Geocoder(rate=100).geocode("Paris")
+            # A fresh instance has an empty local cache, like another worker or a restart
+            second = await Geocoder(rate=100).geocode("paris")
+            return first, second
+    
+        first, second = asyncio.run(run())
+        assert first == second and first["latitude"] == 48.85
+        assert len(upstream) == 1
+        print("SUCCESS: A second geocoder was served from the shared cache")
+    
+    def test_reverse_keyed_by_cell(self, upstream):
+        geocoder = Geocoder(rate=100)
+        assert reverse_cell(51.4712, -0.4521) == reverse_cell(51.4698, -0.4549) == (51.47, -0.45)
+    
+        async def run():
+            return await geocoder.reverse(51.4712, -0.4521), await geocoder.reverse(51.4698, -0.4549)
+    
+        first, second = asyncio.run(run())
+        assert first == second and first["city"] == "Hounslow"
+        assert len(upstream) == 1 and upstream[0].url.params["lat"] == "51.47"
+        print("SUCCESS: Nearby points shared one reverse lookup")
+    
+    def test_token_bucket_limits_wait(self):
+        bucket = TokenBucket(rate=20)
+    
+        async def run():
+            assert await bucket.acquire(max_wait=0)
+            # The next token is 50ms away
+            assert not await bucket.acquire(max_wait=0.01)
+            assert await bucket.acquire(max_wait=0.1)
+    
+        asyncio.run(run())
+        print("SUCCESS: The token bucket refuses waits over the limit")
+    
+    def test_busy_autocomplete(self, upstream):
+        geocoder = Geocoder(rate=0.01)
+    
+        async def run():
+            await geocoder.search_cities("Paris")
+            with pytest.raises(GeocodingBusy):
+                await geocoder.search_cities("Lyon")
+    
+        asyncio.run(run())
+        assert len(upstream) == 1
+        print("SUCCESS: Autocomplete gives up instead of queueing behind the rate limit")
+    
+    def test_rate_limit_shared_between_workers(self, upstream):
+        # Two geocoders stand in for two API workers sharing the rate_limits document
+        first, second = Geocoder(rate=0.01), Geocoder(rate=0.01)
+    
+        async def run():
+            await first.search_cities("Paris")
+            with pytest.raises(GeocodingBusy):
+                await second.search_cities("Lyon")
+            with pytest.raises(GeocodingBusy):
+                await second.reverse(51.47, -0.45)
+    
+        asyncio.run(run())
+        assert len(upstream) == 1
+        print("SUCCESS: A second worker waits on the first worker's upstream call")
@@ -0,0 +1,72 @@
+"""
+Journeyman Dating App - GIPHY Proxy Tests
+Tests the pooled client, normalized search caching and coalescing
+"""
+import asyncio
+import os
+import sys
+
+import httpx
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "journeyman_test")
+
+from services import http_client
+from services.giphy import GiphyClient
+
+
+def gif(n: int) -> dict:
+    image = {"url": f"https://media.giphy.com/{n}.gif", "width": "200", "height": "150"}
+    return {
+        "id": str(n), "title": f"GIF {n}", "url": f"https://giphy.com/gifs/{n}",
+        "images": {"fixed_width_small": image, "original": image, "fixed_width": image}
+    }
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    calls = []
+    
+    async def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        await asyncio.sleep(0.01)
+        if request.url.params.get("q") == "fail":
+            return httpx.Response(503)
+        return httpx.Response(200, json={"data": [gif(n) for n in range(int(request.url.params["limit"]))]})
+    
+    monkeypatch.setattr(http_client, "_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    return calls
+
+
+class TestGiphyCache:
+    """Test that repeated and concurrent GIF lookups reuse one upstream call"""
+    
+    def test_search_normalized_coalesced_and_cached(self, upstream):
+        giphy = GiphyClient()
+    
+        async def run():
+            concurrent = await asyncio.gather(*(giphy.search(q, 20) for q in ["Cats", "cats ", " CATS"] * 10))
+            return concurrent, await giphy.search("cats", 5), await giphy.trending(10), await giphy.trending(3)
+    
+        concurrent, later, trending, trending_small = asyncio.run(run())
+        searches = [c for c in upstream if c.url.path.endswith("/search")]
+        assert len(searches) == 1 and searches[0].url.params["q"] == "cats"
+        assert all(len(result) == 20 for result in concurrent)
+        assert [g["id"] for g in later] == ["0", "1", "2", "3", "4"]
+        assert len(trending) == 10 and len(trending_small) == 3
+        assert len(upstream) == 2
+        print("SUCCESS: 31 searches and 2 trending lookups made 2 upstream calls")
+    
+    def test_failures_not_cached(self, upstream):
+        giphy = GiphyClient()
+    
+        async def run():
+            for _ in range(2):
+                with pytest.raises(httpx.HTTPStatusError):
+                    await giphy.search("fail", 10)
+    
+        asyncio.run(run())
+        assert len(upstream) == 2
+        print("SUCCESS: Upstream errors are retried, not cached")
@@ -0,0 +1,73 @@
+"""
+Journeyman Dating App - Image Variant Tests
+Tests orientation, metadata stripping and resized photos on profile cards
+"""
+import asyncio
+import base64
+import io
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "journeyman_test")
+
+from PIL import Image
+
+from services.images import render_variants, process_image, shutdown_image_pool
+from services.loaders import card_photos
+
+
+def camera_photo(width=2400, height=1600, orientation=6) -> bytes:
+    """A landscape JPEG tagged to display rotated, with a GPS tag like a phone photo."""
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    exif[0x8825] = {2: (40.0, 44.0, 0.0)}
+    out = io.BytesIO()
+    Image.new("RGB", (width, height), (200, 40, 40)).save(out, "JPEG", exif=exif)
+    return out.getvalue()
+
+
+class TestImageVariants:
+    """Test derivative rendering and their use in listings"""
+    
+    def test_render_orients_and_strips(self):
+        rendered = render_variants(camera_photo())
+        assert (rendered["width"], rendered["height"]) == (1600, 2400)
+        for size, formats in rendered["sizes"].items():
+            for fmt, data in formats.items():
+                image = Image.open(io.BytesIO(data))
+                assert image.format == fmt.upper()
+                # Rotated to portrait, longest side at the variant size
+                assert image.height == int(size) and image.width < image.height
+                assert not image.getexif() and "exif" not in image.info
+        header, encoded = rendered["placeholder"].split(",", 1)
+        assert header == "data:image/jpeg;base64" and len(base64.b64decode(encoded)) < 1000
+    
+        # Small images are never upscaled
+        small = render_variants(camera_photo(100, 50, orientation=1))
+        assert Image.open(io.BytesIO(small["sizes"]["1080"]["webp"])).size == (100, 50)
+        print("SUCCESS: Variants oriented, resized and stripped of metadata")
+    
+    def test_process_pool_and_card_photos(self):
+        try:
+            rendered = asyncio.run(process_image(camera_photo(orientation=1)))
+        finally:
+            shutdown_image_pool()
+        assert rendered["width"] == 2400
+    
+        variant = {
+            "url": "/api/media/a.jpg", "placeholder": "data:x",
+            "sizes": {s: {"webp": f"/api/media/a_{s}.webp", "jpeg": f"/api/media/a_{s}.jpg"} for s in ("64", "256", "1080")}
+        }
+        card = card_photos({
+            "user_id": "user_1", "profile_photo": "/api/media/a.jpg",
+            "photos": ["/api/media/a.jpg", "/api/media/b.jpg"], "photo_variants": [variant]
+        })
+        assert card["profile_photo"] == "/api/media/a_256.jpg"
+        assert card["profile_photo_sources"] == {"webp": "/api/media/a_256.webp", "jpeg": "/api/media/a_256.jpg"}
+        assert card["profile_photo_placeholder"] == "data:x"
+        assert card["photos"] == ["/api/media/a_1080.jpg", "/api/media/b.jpg"]
+        assert card["photo_sources"] == [{"webp": "/api/media/a_1080.webp", "jpeg": "/api/media/a_1080.jpg"}, None]
+        assert "photo_variants" not in card
+        print("SUCCESS: Rendered in the process pool and listed with small variants")
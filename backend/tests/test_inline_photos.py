@@ -0,0 +1,99 @@
+"""
+Journeyman Dating App - Inline Photo Migration Tests
+Tests decoding base64 photos and moving them out of user documents
+"""
+import asyncio
+import base64
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "journeyman_test")
+
+from services import media, storage
+from services.media import decode_photo_data, migrate_user_photos
+
+PNG = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg=="
+)
+PNG_URI = "data:image/png;base64," + base64.b64encode(PNG).decode()
+
+
+class FakeCollection:
+    def __init__(self, docs=()):
+        self.docs = list(docs)
+    
+    async def insert_one(self, doc):
+        self.docs.append(dict(doc))
+    
+    async def find_one(self, query, projection=None):
+        plain = {k: v for k, v in query.items() if not isinstance(v, dict)}
+        return next((dict(d) for d in self.docs if all(d.get(k) == v for k, v in plain.items())), None)
+    
+    async def delete_many(self, query):
+        ids = query["media_id"]["$in"]
+        self.docs = [d for d in self.docs if d["media_id"] not in ids]
+    
+    async def update_one(self, query, update):
+        for doc in self.docs:
+            if all(doc.get(k) == v for k, v in query.items()):
+                doc.update(update["$set"])
+                return SimpleNamespace(matched_count=1)
+        return SimpleNamespace(matched_count=0)
+
+
+@pytest.fixture
+def fake_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "UPLOAD_DIR", tmp_path)
+    monkeypatch.setattr(storage, "s3_client", None)
+    fake = SimpleNamespace(users=FakeCollection(), media=FakeCollection(), queued=[])
+    monkeypatch.setattr(media, "db", fake)
+    
+    async def enqueue(kind, payload, job_id=None):
+        fake.queued.append(payload["media_id"])
+    
+    monkeypatch.setattr(media.job_queue, "enqueue", enqueue)
+    return fake
+
+
+class TestInlinePhotos:
+    """Test that base64 photos end up in media storage"""
+    
+    def test_decode_photo_data(self):
+        assert decode_photo_data(PNG_URI) == ("image/png", PNG)
+        assert decode_photo_data("data:image/jpg;base64,AAAA")[0] == "image/jpeg"
+        for bad in ("https://example.com/a.png", "data:image/gif;base64,AAAA", "data:image/png;base64,%%%", "data:image/png;base64,"):
+            with pytest.raises(ValueError):
+                decode_photo_data(bad)
+        print("SUCCESS: Data URIs decoded and validated")
+    
+    def test_migrate_user_photos(self, fake_db, tmp_path):
+        user = {
+            "user_id": "user_1",
+            "photos": [PNG_URI, "/api/media/existing.jpg", "data:image/png;base64,%%%"],
+            "profile_photo": PNG_URI
+        }
+        fake_db.users.docs.append(dict(user))
+        assert asyncio.run(migrate_user_photos(user)) == 2
+    
+        migrated = fake_db.users.docs[0]
+        url = migrated["photos"][0]
+        assert url.startswith("/api/media/gallery_user_1_") and url.endswith(".png")
+        assert migrated["photos"] == [url, "/api/media/existing.jpg"]
+        assert migrated["profile_photo"] == url
+        assert (tmp_path / url.rsplit("/", 1)[1]).read_bytes() == PNG
+        # The shared inline photo is stored once, and its variants queued after the user update
+        assert [m["url"] for m in fake_db.media.docs] == [url]
+        assert fake_db.queued == [fake_db.media.docs[0]["media_id"]]
+    
+        # A user edited since being read is left for the next run, without leaving records or objects behind
+        assert asyncio.run(migrate_user_photos({**user, "user_id": "user_2"})) == 0
+        other = "data:image/png;base64," + base64.b64encode(b"other photo").decode()
+        assert asyncio.run(migrate_user_photos({"user_id": "user_3", "photos": [other]})) == 0
+        assert [m["url"] for m in fake_db.media.docs] == [url]
+        assert sorted(p.name for p in tmp_path.iterdir()) == [url.rsplit("/", 1)[1]]
+        print("SUCCESS: Inline photos moved to media storage")
@@ -0,0 +1,64 @@
+"""
+Journeyman Dating App - Job Queue Tests
+Tests that jobs abandoned on their last attempt are marked failed
+"""
+import asyncio
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "journeyman_test")
+
+from services.jobs import JobQueue
+
+
+def matches(doc: dict, query: dict) -> bool:
+    for field, condition in query.items():
+        value = doc.get(field)
+        if isinstance(condition, dict):
+            if "$lt" in condition and not (value is not None and value < condition["$lt"]):
+                return False
+            if "$gte" in condition and not (value is not None and value >= condition["$gte"]):
+                return False
+        elif value != condition:
+            return False
+    return True
+
+
+class FakeJobs:
+    def __init__(self, docs):
+        self.docs = docs
+    
+    async def update_many(self, query, update):
+        hits = [doc for doc in self.docs if matches(doc, query)]
+        for doc in hits:
+            doc.update(update["$set"])
+            for field in update.get("$unset", {}):
+                doc.pop(field, None)
+        return SimpleNamespace(modified_count=len(hits))
+    
+    async def find_one_and_update(self, *args, **kwargs):
+        return None
+
+
+class TestAbandonedJobs:
+    """Test the sweep for jobs whose worker died mid-attempt"""
+    
+    def test_last_attempt_marked_failed(self, monkeypatch):
+        expired = datetime.now(timezone.utc) - timedelta(seconds=1)
+        jobs = FakeJobs([
+            {"job_id": "last", "status": "running", "attempts": 3, "lease_until": expired},
+            {"job_id": "retryable", "status": "running", "attempts": 2, "lease_until": expired},
+            {"job_id": "leased", "status": "running", "attempts": 3,
+             "lease_until": datetime.now(timezone.utc) + timedelta(seconds=60)},
+        ])
+        monkeypatch.setattr(JobQueue, "collection", property(lambda self: jobs))
+    
+        asyncio.run(JobQueue(max_attempts=3).run_pending())
+        status = {doc["job_id"]: doc["status"] for doc in jobs.docs}
+        assert status == {"last": "failed", "retryable": "running", "leased": "running"}
+        assert "lease_until" not in jobs.docs[0]
+        print("SUCCESS: Only jobs abandoned on their last attempt are failed")
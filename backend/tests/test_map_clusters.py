@@ -0,0 +1,65 @@
+"""
+Journeyman Dating App - Map Cluster Index Tests
+Tests zoom-level aggregates, viewport queries and in-place location updates
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "journeyman_test")
+
+from services.map_clusters import MapClusterIndex, MARKER_ZOOM
+
+# Around JFK, plus one user in Los Angeles
+NYC_BOX = (40.4, -74.3, 41.0, -73.5)
+
+
+def build_index():
+    index = MapClusterIndex()
+    for i in range(40):
+        index.set_location(f"nyc_{i}", 40.64 + i * 0.001, -73.78 + i * 0.001, hot=i < 10)
+    index.set_location("lax", 33.94, -118.41)
+    return index
+
+
+class TestMapClusterIndex:
+    """Test clusters and markers for a viewport"""
+    
+    def test_low_zoom_clusters(self):
+        index = build_index()
+        clusters = index.clusters(-85, -180, 85, 180, zoom=3)
+        assert sum(c["count"] for c in clusters) == 41
+        assert clusters[0]["count"] == 40
+        assert clusters[0]["hot_travelers_count"] == 10
+        assert abs(clusters[0]["latitude"] - 40.6595) < 0.001
+    
+        # The viewing user is left out of their own cluster
+        clusters = index.clusters(*NYC_BOX, zoom=3, exclude_user_id="nyc_0")
+        assert [c["count"] for c in clusters] == [39]
+        assert clusters[0]["hot_travelers_count"] == 9
+        print("SUCCESS: Low zoom returns aggregated clusters")
+    
+    def test_markers_and_moves(self):
+        index = build_index()
+        members = index.members(*NYC_BOX)
+        assert len(members) == 40
+    
+        # Moving and removing users updates every level in place
+        index.set_location("nyc_1", 33.95, -118.40)
+        index.set_location("nyc_2", None, None)
+        assert len(index.members(*NYC_BOX)) == 38
+        la = index.clusters(33.5, -118.8, 34.3, -118.0, zoom=MARKER_ZOOM - 1)
+        assert sum(c["count"] for c in la) == 2
+        assert sum(c["count"] for c in index.clusters(-85, -180, 85, 180, zoom=0)) == 40
+        print("SUCCESS: Location writes move users between clusters")
+    
+    def test_antimeridian_viewport(self):
+        index = MapClusterIndex()
+        index.set_location("fiji", -17.7, 178.0)
+        index.set_location("samoa", -13.8, -171.8)
+        index.set_location("sydney", -33.9, 151.2)
+        clusters = index.clusters(-25, 170, -10, -165, zoom=4)
+        assert sum(c["count"] for c in clusters) == 2
+        assert {m[0] for m in index.members(-25, 170, -10, -165)} == {"fiji", "samoa"}
+        print("SUCCESS: Viewports crossing the antimeridian wrap around")
@@ -0,0 +1,150 @@
+"""
+Journeyman Dating App - Media Deduplication Tests
+Tests content-hash dedup on upload and collection of unreferenced objects
+"""
+import asyncio
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "journeyman_test")
+
+from services import media, storage
+from services.media import record_media, collect_batch
+from services.storage import store_bytes
+
+
+def matches(doc, query):
+    for field, cond in query.items():
+        if field == "$or":
+            if not any(matches(doc, q) for q in cond):
+                return False
+            continue
+        value = doc
+        for part in field.split("."):
+            value = value.get(part) if isinstance(value, dict) else None
+        values = value if isinstance(value, list) else [value]
+        if isinstance(cond, dict):
+            if "$ne" in cond and cond["$ne"] in values:
+                return False
+            if "$in" in cond and not set(values) & set(cond["$in"]):
+                return False
+            if "$lt" in cond and not (value is not None and value < cond["$lt"]):
+                return False
+        elif cond not in values:
+            return False
+    return True
+
+
+class FakeCollection:
+    """Just enough of a Motor collection for record_media and the collector"""
+    
+    def __init__(self, docs=()):
+        self.docs = [dict(d) for d in docs]
+    
+    async def insert_one(self, doc):
+        self.docs.append(dict(doc))
+    
+    async def find_one(self, query, projection=None):
+        return next((dict(d) for d in self.docs if matches(d, query)), None)
+    
+    async def update_one(self, query, update):
+        for doc in self.docs:
+            if matches(doc, query):
+                doc.update(update.get("$set", {}))
+                for field in update.get("$unset", {}):
+                    doc.pop(field, None)
+                return
+    
+    async def delete_many(self, query):
+        self.docs = [d for d in self.docs if not matches(d, query)]
+    
+    async def find(self, query, projection=None):
+        for doc in list(self.docs):
+            if matches(doc, query):
+                yield dict(doc)
+
+
+@pytest.fixture
+def fake_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "UPLOAD_DIR", tmp_path)
+    monkeypatch.setattr(storage, "s3_client", None)
+    fake = SimpleNamespace(
+        media=FakeCollection(), users=FakeCollection(), messages=FakeCollection(), notifications=FakeCollection()
+    )
+    monkeypatch.setattr(media, "db", fake)
+    return fake
+
+
+def iso(hours_ago: float) -> str:
+    return (datetime.now(timezone.utc) - timedelta(hours=hours_ago)).isoformat()
+
+
+class TestMediaDedup:
+    """Test that storage holds each content once and drops unreferenced objects"""
+    
+    def test_duplicate_upload_reuses_object(self, fake_db, tmp_path):
+        async def upload(key, user_id="user_1"):
+            stored = await store_bytes(b"same photo bytes", key, "image/jpeg")
+            return await record_media(user_id, key, "image", "image/jpeg", stored)
+    
+        first = asyncio.run(upload("gallery/user_1/a.jpg"))
+        second = asyncio.run(upload("gallery/user_1/b.jpg"))
+        assert second["url"] == first["url"] == "/api/media/gallery_user_1_a.jpg"
+        assert second["media_id"] != first["media_id"]
+        assert sorted(p.name for p in tmp_path.iterdir()) == ["gallery_user_1_a.jpg"]
+    
+        different = asyncio.run(record_media(
+            "user_1", "gallery/user_1/c.jpg", "image", "image/jpeg",
+            asyncio.run(store_bytes(b"other bytes", "gallery/user_1/c.jpg", "image/jpeg"))
+        ))
+        assert different["url"] == "/api/media/gallery_user_1_c.jpg"
+    
+        # Another user's identical upload keeps its own object
+        other = asyncio.run(upload("gallery/user_2/a.jpg", user_id="user_2"))
+        assert other["url"] == "/api/media/gallery_user_2_a.jpg"
+        print("SUCCESS: Identical content stored once per user")
+    
+    def test_collect_unreferenced(self, fake_db, tmp_path):
+        names = ("kept.jpg", "message.jpg", "notified.jpg", "matched.jpg", "orphan.jpg", "orphan_256.webp", "recent.jpg")
+        for name in names:
+            (tmp_path / name).write_bytes(b"x")
+        cutoff = iso(24)
+        objects = []
+        for name, created in (("kept.jpg", 48), ("message.jpg", 48), ("notified.jpg", 48), ("matched.jpg", 48),
+                              ("orphan.jpg", 48), ("recent.jpg", 1)):
+            fake_db.media.docs.append({"filename": name, "url": f"/api/media/{name}", "created_at": iso(created)})
+            if created > 24:
+                objects.append({"_id": name, "url": f"/api/media/{name}", "storage_type": "local"})
+        objects[4]["variants"] = {"sizes": {"256": {"webp": "/api/media/orphan_256.webp"}}}
+        fake_db.users.docs.append({"user_id": "user_1", "photos": ["/api/media/kept.jpg"], "profile_photo": None})
+        fake_db.messages.docs.append({"message_id": "msg_1", "media_url": "/api/media/message.jpg"})
+        # The user has since changed photo, but old notifications still show it
+        fake_db.notifications.docs.append({"notification_id": "n_1", "from_user_photo": "/api/media/notified.jpg"})
+        fake_db.notifications.docs.append({"notification_id": "n_2", "data": {"matched_user_photo": "/api/media/matched.jpg"}})
+    
+        assert asyncio.run(collect_batch(objects, cutoff)) == 1
+        kept = ["kept.jpg", "matched.jpg", "message.jpg", "notified.jpg", "recent.jpg"]
+        assert sorted(p.name for p in tmp_path.iterdir()) == kept
+        assert sorted(d["filename"] for d in fake_db.media.docs) == kept
+        print("SUCCESS: Only unreferenced objects and their variants collected")
+    
+    def test_notified_variant_keeps_original(self, fake_db, tmp_path):
+        for name in ("card.jpg", "card_256.jpeg"):
+            (tmp_path / name).write_bytes(b"x")
+        fake_db.media.docs.append({"filename": "card.jpg", "url": "/api/media/card.jpg", "created_at": iso(48)})
+        obj = {
+            "_id": "card.jpg", "url": "/api/media/card.jpg", "storage_type": "local",
+            "variants": {"sizes": {"256": {"jpeg": "/api/media/card_256.jpeg"}}}
+        }
+        # Notifications are built from card users, whose profile photo is the 256px variant
+        fake_db.notifications.docs.append({"notification_id": "n_1", "from_user_photo": "/api/media/card_256.jpeg"})
+    
+        assert asyncio.run(collect_batch([obj], iso(24))) == 0
+        assert sorted(p.name for p in tmp_path.iterdir()) == ["card.jpg", "card_256.jpeg"]
+        print("SUCCESS: A variant shown by a notification keeps its original and variants")
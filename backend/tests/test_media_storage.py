@@ -0,0 +1,121 @@
+"""
+Journeyman Dating App - Media Storage Tests
+Tests streamed local uploads and mid-stream size limits
+"""
+import asyncio
+import hashlib
+import io
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "journeyman_test")
+
+from fastapi import UploadFile
+from starlette.datastructures import Headers
+
+from services import storage
+from services.storage import store_upload, store_bytes, UploadTooLarge, CHUNK_SIZE, S3_PART_SIZE
+
+
+def make_upload(data: bytes, content_type: str = "image/jpeg") -> UploadFile:
+    return UploadFile(io.BytesIO(data), filename="photo.jpg", headers=Headers({"content-type": content_type}))
+
+
+@pytest.fixture
+def upload_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "UPLOAD_DIR", tmp_path)
+    monkeypatch.setattr(storage, "s3_client", None)
+    return tmp_path
+
+
+class BlockingS3:
+    """Blocking S3 stand-in whose part uploads wait until the event loop releases them."""
+    
+    def __init__(self):
+        self.parts = {}
+        self.blocked: threading.Event = None
+        self.released = []
+    
+    def create_multipart_upload(self, **kwargs):
+        return {"UploadId": "upload-1"}
+    
+    def upload_part(self, PartNumber, Body, **kwargs):
+        # Only a coroutine running while this part is in flight can set the event
+        self.blocked = threading.Event()
+        self.released.append(self.blocked.wait(timeout=5))
+        self.blocked = None
+        self.parts[PartNumber] = Body
+        return {"ETag": f'"{PartNumber}"'}
+    
+    def complete_multipart_upload(self, **kwargs):
+        self.completed = [p["PartNumber"] for p in kwargs["MultipartUpload"]["Parts"]]
+    
+    def abort_multipart_upload(self, **kwargs):
+        pass
+    
+    def put_object(self, Key, Body, **kwargs):
+        self.put = (Key, Body)
+
+
+class TestStreamedUploads:
+    """Test that uploads are written in chunks and abort past the limit"""
+    
+    def test_local_upload_streams_to_disk(self, upload_dir):
+        data = os.urandom(3 * CHUNK_SIZE + 17)
+        stored = asyncio.run(store_upload(make_upload(data), "gallery/user_1/a.jpg", 10 * CHUNK_SIZE))
+        assert stored == {
+            "url": "/api/media/gallery_user_1_a.jpg", "storage_type": "local", "size": len(data),
+            "sha256": hashlib.sha256(data).hexdigest()
+        }
+        assert (upload_dir / "gallery_user_1_a.jpg").read_bytes() == data
+        print("SUCCESS: Local upload written in chunks")
+    
+    def test_oversized_upload_leaves_nothing(self, upload_dir):
+        data = os.urandom(5 * CHUNK_SIZE)
+        with pytest.raises(UploadTooLarge):
+            asyncio.run(store_upload(make_upload(data), "gallery/user_1/b.jpg", 2 * CHUNK_SIZE))
+        assert list(upload_dir.iterdir()) == []
+        print("SUCCESS: Oversized upload aborted without leftovers")
+    
+    def test_s3_upload_does_not_block_event_loop(self, monkeypatch):
+        fake = BlockingS3()
+        monkeypatch.setattr(storage, "s3_client", fake)
+        data = os.urandom(2 * S3_PART_SIZE + 100)
+    
+        async def run():
+            # Stands in for chat frames: releases each part only if it gets to run while the part blocks
+            running = True
+    
+            async def ticker():
+                while running:
+                    await asyncio.sleep(0.01)
+                    blocked = fake.blocked
+                    if blocked is not None:
+                        blocked.set()
+    
+            tick = asyncio.create_task(ticker())
+            stored = await store_upload(make_upload(data, "video/mp4"), "media/user_1/v.mp4", 3 * S3_PART_SIZE)
+            running = False
+            await tick
+            return stored
+    
+        stored = asyncio.run(run())
+        assert stored["storage_type"] == "s3" and stored["size"] == len(data)
+        assert b"".join(fake.parts[n] for n in fake.completed) == data
+        assert fake.released == [True, True, True]
+        print("SUCCESS: Event loop stays responsive during a slow S3 upload")
+    
+    def test_in_memory_content_is_one_put(self, monkeypatch):
+        fake = BlockingS3()
+        monkeypatch.setattr(storage, "s3_client", fake)
+        monkeypatch.setattr(fake, "create_multipart_upload", None)
+        data = os.urandom(3 * CHUNK_SIZE)
+        stored = asyncio.run(store_bytes(data, "gallery/user_1/v_256.webp", "image/webp"))
+        assert fake.put == ("gallery/user_1/v_256.webp", data)
+        assert stored["storage_type"] == "s3" and stored["sha256"] == hashlib.sha256(data).hexdigest()
+        print("SUCCESS: In-memory content stored with a single put")
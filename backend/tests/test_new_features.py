@@ -6,6 +6,7 @@ import pytest
 import requests
 import os
 import uuid
+import time
 from datetime import datetime
 
 BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
@@ -332,5 +333,156 @@ class TestNotifications:
         print("SUCCESS: All notifications marked as read")
 
 
+class TestUnreadCounters:
+    """Test maintained unread counters for badges and conversations"""
+    
+    @pytest.fixture
+    def two_matched_users(self):
+        """Create two users who have matched with each other"""
+        users = []
+        for label in ["Badge1", "Badge2"]:
+            unique_id = uuid.uuid4().hex[:8]
+            res = requests.post(f"{BASE_URL}/api/auth/register", json={
+                "name": f"{label} {unique_id}", "email": f"{label.lower()}_{unique_id}@example.com", "password": "testpass123"
+            })
+            data = res.json()
+            users.append({"user_id": data["user_id"], "token": data["session_token"]})
+        
+        for a, b in [(users[0], users[1]), (users[1], users[0])]:
+            requests.post(
+                f"{BASE_URL}/api/discover/action?target_user_id={b['user_id']}&action=like",
+                headers={"Authorization": f"Bearer {a['token']}"}
+            )
+        return {"user1": users[0], "user2": users[1]}
+    
+    def badges(self, user):
+        response = requests.get(
+            f"{BASE_URL}/api/notifications/unread-count",
+            headers={"Authorization": f"Bearer {user['token']}"}
+        )
+        assert response.status_code == 200
+        return response.json()
+    
+    def test_chat_unread_follows_send_and_read(self, two_matched_users):
+        """Chat unread count goes up on send and back to zero on read"""
+        user1 = two_matched_users["user1"]
+        user2 = two_matched_users["user2"]
+        
+        for text in ["first", "second"]:
+            requests.post(
+                f"{BASE_URL}/api/chat/{user2['user_id']}",
+                headers={"Authorization": f"Bearer {user1['token']}"},
+                json={"recipient_id": user2["user_id"], "content": text}
+            )
+        assert self.badges(user2)["chat_unread"] == 2
+        
+        conversations = requests.get(
+            f"{BASE_URL}/api/conversations",
+            headers={"Authorization": f"Bearer {user2['token']}"}
+        ).json()["conversations"]
+        assert conversations[0]["unread_count"] == 2
+        
+        requests.post(
+            f"{BASE_URL}/api/chat/{user1['user_id']}/read",
+            headers={"Authorization": f"Bearer {user2['token']}"}
+        )
+        assert self.badges(user2)["chat_unread"] == 0
+        print("SUCCESS: Chat unread counter tracks send and read")
+    
+    def test_notification_count_follows_read_all(self, two_matched_users):
+        """Notification badge drops to zero after read-all"""
+        user1 = two_matched_users["user1"]
+        time.sleep(0.5)  # match notifications are written by the background worker
+        assert self.badges(user1)["count"] >= 1
+        
+        requests.post(
+            f"{BASE_URL}/api/notifications/read-all",
+            headers={"Authorization": f"Bearer {user1['token']}"}
+        )
+        assert self.badges(user1)["count"] == 0
+        print("SUCCESS: Notification counter reset by read-all")
+
+
+class TestTripOverlapJobs:
+    """Test that trip-overlap notifications are sent by the background job queue"""
+    
+    def register(self, label):
+        unique_id = uuid.uuid4().hex[:8]
+        res = requests.post(f"{BASE_URL}/api/auth/register", json={
+            "name": f"{label} {unique_id}", "email": f"{label.lower()}_{unique_id}@example.com", "password": "testpass123"
+        })
+        data = res.json()
+        return {"user_id": data["user_id"], "token": data["session_token"]}
+    
+    def create_schedule(self, user, start_date, end_date):
+        response = requests.post(
+            f"{BASE_URL}/api/schedules",
+            headers={"Authorization": f"Bearer {user['token']}"},
+            json={
+                "title": "Overlap Trip",
+                "destination": "Reykjavik, Iceland",
+                "start_date": start_date,
+                "end_date": end_date,
+                "latitude": 64.1466,
+                "longitude": -21.9426
+            }
+        )
+        assert response.status_code == 200
+        return response.json()
+    
+    def test_overlap_notified_once(self):
+        """The existing traveler gets exactly one trip_overlap notification"""
+        resident = self.register("Resident")
+        visitor = self.register("Visitor")
+        self.create_schedule(resident, "2031-07-01", "2031-07-20")
+        schedule = self.create_schedule(visitor, "2031-07-10", "2031-07-12")
+        
+        overlaps = []
+        for _ in range(20):
+            time.sleep(0.25)
+            notifications = requests.get(
+                f"{BASE_URL}/api/notifications",
+                headers={"Authorization": f"Bearer {resident['token']}"}
+            ).json()["notifications"]
+            overlaps = [n for n in notifications if n["type"] == "trip_overlap"]
+            if overlaps:
+                break
+        
+        assert len(overlaps) == 1
+        assert overlaps[0]["data"]["schedule_id"] == schedule["schedule_id"]
+        assert overlaps[0]["from_user_id"] == visitor["user_id"]
+        print("SUCCESS: Overlap notification delivered once by the job queue")
+
+    
+    def trip_matches(self, user):
+        response = requests.get(
+            f"{BASE_URL}/api/schedules/trip-matches",
+            headers={"Authorization": f"Bearer {user['token']}"}
+        )
+        assert response.status_code == 200
+        return response.json()
+    
+    def test_trip_matches_invalidated_by_overlapping_writes(self):
+        """Cached trip matches pick up a new overlapping trip and drop a deleted one"""
+        resident = self.register("Planner")
+        visitor = self.register("Joiner")
+        self.create_schedule(resident, "2031-08-01", "2031-08-20")
+        
+        # First load materializes an empty match list for the trip
+        assert self.trip_matches(resident)["total_matches"] == 0
+        
+        schedule = self.create_schedule(visitor, "2031-08-05", "2031-08-07")
+        matches = self.trip_matches(resident)
+        assert matches["total_matches"] == 1
+        assert matches["trips"][0]["matches"][0]["user"]["user_id"] == visitor["user_id"]
+        
+        requests.delete(
+            f"{BASE_URL}/api/schedules/{schedule['schedule_id']}",
+            headers={"Authorization": f"Bearer {visitor['token']}"}
+        )
+        assert self.trip_matches(resident)["total_matches"] == 0
+        print("SUCCESS: Trip match cache invalidated by overlapping create and delete")
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v", "--tb=short"])
@@ -0,0 +1,213 @@
+"""
+Journeyman Dating App - Notification Service Tests
+Tests preference filtering, dedup windows, chat roll-ups and the shutdown drain
+"""
+import asyncio
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "journeyman_test")
+
+from services import notifications
+from services.notifications import NotificationService
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+    
+    async def to_list(self, length):
+        return self.docs
+
+
+class FakeUsers:
+    def __init__(self, settings):
+        self.settings = settings
+        self.reads = 0
+    
+    def find(self, query, projection=None):
+        self.reads += 1
+        return FakeCursor([
+            {"user_id": uid, "notification_settings": self.settings[uid]}
+            for uid in query["user_id"]["$in"] if uid in self.settings
+        ])
+
+
+class FakeNotifications:
+    def __init__(self):
+        self.inserted = []
+        self.rolled = []
+        self.rolling = []
+    
+    def _unread(self, query):
+        return [
+            doc for doc in self.rolling
+            if not doc["read"] and doc["user_id"] == query["user_id"] and doc["type"] == query["type"]
+            and doc["data"]["conversation_id"] == query["data.conversation_id"]
+        ]
+    
+    async def insert_many(self, docs, ordered=True):
+        self.inserted.extend(docs)
+    
+    async def find_one_and_update(self, query, pipeline, **kwargs):
+        self.rolled.append((query, pipeline))
+        added = pipeline[0]["$set"]["data"]["count"]["$add"][1]
+        existing = self._unread(query)
+        if existing:
+            existing[0]["data"]["count"] += added
+            return existing[0]
+        doc = {"user_id": query["user_id"], "type": query["type"], "read": False,
+               "data": {"conversation_id": query["data.conversation_id"], "count": added}}
+        self.rolling.append(doc)
+        return doc
+    
+    async def update_many(self, query, update):
+        matched = self._unread(query)
+        for doc in matched:
+            doc.update(update["$set"])
+        return SimpleNamespace(modified_count=len(matched))
+
+
+class FakeDb:
+    def __init__(self, settings):
+        self.users = FakeUsers(settings)
+        self.notifications = FakeNotifications()
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    db = FakeDb({"muted": {"new_matches": False}, "viewer_fan": {"profile_views": True}})
+    counted = []
+    
+    async def add_notifications(counts):
+        counted.append(counts)
+    
+    monkeypatch.setattr(notifications, "db", db)
+    monkeypatch.setattr(notifications.unread_counters, "add_notifications", add_notifications)
+    db.counted = counted
+    return db
+
+
+def enqueue_batches(service: NotificationService, *batches, between=None):
+    """Queue each batch of (user_id, type, collapse_key) and wait for it to be written."""
+    async def run():
+        for i, batch in enumerate(batches):
+            if between:
+                between(i)
+            for user_id, notif_type, collapse_key in batch:
+                service.enqueue(user_id, notif_type, "Title", f"{notif_type} for {user_id}",
+                                data={"conversation_id": collapse_key} if notif_type == "new_message" else {},
+                                from_user={"user_id": "sender", "name": "Sam"}, collapse_key=collapse_key)
+            await service.stop()
+    
+    asyncio.run(run())
+
+
+class TestNotificationService:
+    """Test the rules the background worker applies to queued notifications"""
+    
+    def test_preferences_filter(self, fake_db):
+        service = NotificationService()
+        enqueue_batches(service, [
+            ("muted", "new_match", None),
+            ("muted", "like", None),
+            ("someone", "new_match", None),
+            ("someone", "profile_view", "viewer"),
+            ("viewer_fan", "profile_view", "viewer"),
+        ])
+        written = [(doc["user_id"], doc["type"]) for doc in fake_db.notifications.inserted]
+        assert written == [("muted", "like"), ("someone", "new_match"), ("viewer_fan", "profile_view")]
+        assert fake_db.counted == [{"muted": 1, "someone": 1, "viewer_fan": 1}]
+        print("SUCCESS: Switched-off and off-by-default types are dropped")
+    
+    def test_preferences_cached(self, fake_db):
+        service = NotificationService(preferences_ttl=60)
+        enqueue_batches(
+            service, *[[("someone", "like", None)]] * 4,
+            between=lambda i: i == 2 and service.invalidate_preferences("someone")
+        )
+        # Read for the first batch, reused by the second, read again after invalidation
+        assert fake_db.users.reads == 2
+        assert len(fake_db.notifications.inserted) == 4
+        print("SUCCESS: Preferences are read once until invalidated")
+    
+    def test_dedup_window(self, fake_db):
+        service = NotificationService()
+        enqueue_batches(service, [
+            ("viewer_fan", "profile_view", "viewer"),
+            ("viewer_fan", "profile_view", "viewer"),
+            ("viewer_fan", "profile_view", "other_viewer"),
+            ("someone", "like", "sender"),
+            ("someone", "like", "sender"),
+        ], [
+            # A later batch inside the window is deduplicated too
+            ("viewer_fan", "profile_view", "viewer")
+        ])
+        written = [(doc["user_id"], doc["type"]) for doc in fake_db.notifications.inserted]
+        assert written.count(("viewer_fan", "profile_view")) == 2
+        assert written.count(("someone", "like")) == 2
+        print("SUCCESS: Repeats inside a dedup window are dropped, other keys and types are not")
+    
+    def test_chat_roll_up(self, fake_db):
+        service = NotificationService()
+        enqueue_batches(service, [
+            ("someone", "new_message", "conv_a"),
+            ("someone", "new_message", "conv_a"),
+            ("someone", "new_message", "conv_b"),
+            ("someone", "new_message", "conv_a"),
+        ])
+        assert fake_db.notifications.inserted == []
+        rolled = {query["data.conversation_id"]: pipeline[0]["$set"]["data"]["count"]["$add"][1]
+                  for query, pipeline in fake_db.notifications.rolled}
+        assert rolled == {"conv_a": 3, "conv_b": 1}
+        assert all(query["read"] is False for query, _ in fake_db.notifications.rolled)
+        print("SUCCESS: A burst rolls up into one unread notification per conversation")
+    
+    def test_reading_conversation_restarts_roll_up(self, fake_db):
+        service = NotificationService()
+        
+        async def send(count):
+            for _ in range(count):
+                service.enqueue("someone", "new_message", "Title", "Hi", data={"conversation_id": "conv_a"},
+                                from_user={"user_id": "sender", "name": "Sam"}, collapse_key="conv_a")
+            await service.stop()
+        
+        async def run():
+            await send(2)
+            assert await service.mark_conversation_read("someone", "conv_a") == 1
+            await send(1)
+        
+        asyncio.run(run())
+        unread = [doc for doc in fake_db.notifications.rolling if not doc["read"]]
+        assert [doc["data"]["count"] for doc in unread] == [1]
+        assert fake_db.counted == [{"someone": 1}, {"someone": -1}, {"someone": 1}]
+        print("SUCCESS: A message after reading the conversation starts a fresh notification")
+    
+    def test_stop_drains_queue(self, fake_db, monkeypatch):
+        service = NotificationService(flush_interval=0)
+        insert_many = fake_db.notifications.insert_many
+        writes = []
+    
+        async def stuck_then_ok(docs, ordered=True):
+            writes.append(docs)
+            if len(writes) == 1:
+                await asyncio.Event().wait()
+            await insert_many(docs, ordered)
+    
+        monkeypatch.setattr(fake_db.notifications, "insert_many", stuck_then_ok)
+    
+        async def run():
+            # The worker takes the first one and hangs writing it; the rest stay queued
+            for i in range(4):
+                service.enqueue(f"user_{i}", "like", "Title", "Liked you")
+            await service.stop(timeout=0.05)
+    
+        asyncio.run(run())
+        assert [doc["user_id"] for doc in fake_db.notifications.inserted] == ["user_1", "user_2", "user_3"]
+        assert service._queue.empty()
+        print("SUCCESS: Queued notifications are written at shutdown even with a stuck worker")
@@ -0,0 +1,130 @@
+"""
+Journeyman Dating App - Overlap Index Tests
+Tests that the in-memory spatiotemporal index matches a brute-force scan
+"""
+import asyncio
+import os
+import random
+import sys
+from datetime import date, timedelta
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "journeyman_test")
+
+from services.overlap_index import OverlapIndex
+
+# services/__init__ re-exports the index instance under the module's name
+overlap_module = sys.modules["services.overlap_index"]
+from utils.helpers import calculate_distance
+
+
+def make_schedule(i, lat, lon, start, days, user_id=None):
+    return {
+        "schedule_id": f"sched_{i}",
+        "user_id": user_id or f"user_{i % 50}",
+        "destination": f"Place {i}",
+        "latitude": lat,
+        "longitude": lon,
+        "start_date": start.strftime("%Y-%m-%d"),
+        "end_date": (start + timedelta(days=days)).strftime("%Y-%m-%d")
+    }
+
+
+class FakeSchedules:
+    """Evaluates the rebuild's "not ended" filter"""
+    
+    def __init__(self, docs):
+        self.docs = docs
+    
+    def find(self, query, projection=None):
+        def live(doc):
+            return any(doc.get(field) is not None and doc[field] >= cond[field]["$gte"]
+                       for cond in query["$or"] for field in cond)
+        return SimpleNamespace(to_list=lambda length: asyncio.sleep(0, [d for d in self.docs if live(d)]))
+
+
+class FakeRoutes:
+    async def find(self, query, projection=None):
+        return
+        yield
+
+
+def brute_force(schedules, lat, lon, radius, start, end, exclude=None):
+    found = set()
+    for s in schedules:
+        if exclude and s["user_id"] == exclude:
+            continue
+        if s["start_date"] > end or s["end_date"] < start:
+            continue
+        if calculate_distance(lat, lon, s["latitude"], s["longitude"]) <= radius:
+            found.add(s["schedule_id"])
+    return found
+
+
+class TestOverlapIndex:
+    """Test index queries against a full scan"""
+    
+    def test_matches_brute_force(self):
+        rng = random.Random(7)
+        base = date(2026, 1, 1)
+        schedules = [
+            make_schedule(i, rng.uniform(25, 49), rng.uniform(-124, -67),
+                          base + timedelta(days=rng.randint(0, 120)), rng.randint(0, 14))
+            for i in range(2000)
+        ]
+        index = OverlapIndex()
+        for s in schedules:
+            index.add(s)
+        
+        for _ in range(50):
+            lat, lon = rng.uniform(25, 49), rng.uniform(-124, -67)
+            start = base + timedelta(days=rng.randint(0, 120))
+            end = start + timedelta(days=rng.randint(0, 10))
+            radius = rng.choice([50, 100, 200])
+            s, e = start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d")
+            
+            results = index.search(lat, lon, radius, s, e, exclude_user_id="user_3")
+            assert {r[0]["schedule_id"] for r in results} == brute_force(schedules, lat, lon, radius, s, e, "user_3")
+            assert [r[1] for r in results] == sorted(r[1] for r in results)
+        print("SUCCESS: Index results match brute-force scan")
+    
+    def test_remove_and_replace(self):
+        index = OverlapIndex()
+        index.add(make_schedule(1, 40.7, -74.0, date(2026, 3, 1), 5))
+        assert len(index.search(40.7, -74.0, 10, "2026-03-02", "2026-03-02")) == 1
+        
+        # Re-adding the same schedule_id moves it rather than duplicating it
+        index.add(make_schedule(1, 34.0, -118.2, date(2026, 3, 1), 5))
+        assert index.search(40.7, -74.0, 10, "2026-03-02", "2026-03-02") == []
+        assert len(index.search(34.0, -118.2, 10, "2026-03-02", "2026-03-02")) == 1
+        
+        index.remove("sched_1")
+        assert len(index) == 0
+        assert index.search(34.0, -118.2, 10, "2026-03-02", "2026-03-02") == []
+        print("SUCCESS: Index updates on replace and remove")
+    
+    def test_rebuild_skips_ended_trips(self, monkeypatch):
+        today = date.today()
+        ended = make_schedule(1, 40.7, -74.0, today - timedelta(days=10), 5)
+        current = make_schedule(2, 40.7, -74.0, today - timedelta(days=2), 5)
+        series = {**make_schedule(3, 40.7, -74.0, today - timedelta(days=30), 2),
+                  "recurrence": {"frequency": "weekly", "count": 10},
+                  "series_end_date": (today + timedelta(days=40)).strftime("%Y-%m-%d")}
+        fake = SimpleNamespace(schedules=FakeSchedules([ended, current, series]), schedule_routes=FakeRoutes())
+        monkeypatch.setattr(overlap_module, "db", fake)
+        
+        index = OverlapIndex()
+        index.add(ended)
+        asyncio.run(index.rebuild())
+        assert len(index) == 2
+        assert "sched_1" not in index._cell_of
+        print("SUCCESS: Rebuild keeps live trips and series, drops ended ones")
+    
+    def test_antimeridian(self):
+        index = OverlapIndex()
+        index.add(make_schedule(1, -17.8, 179.9, date(2026, 5, 1), 3))
+        results = index.search(-17.8, -179.9, 50, "2026-05-02", "2026-05-02")
+        assert [r[0]["schedule_id"] for r in results] == ["sched_1"]
+        print("SUCCESS: Queries wrap across the antimeridian")
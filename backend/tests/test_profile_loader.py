@@ -0,0 +1,96 @@
+"""
+Journeyman Dating App - Profile Loader Tests
+Tests that profile lookups are batched into one $in query per tick
+"""
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "journeyman_test")
+
+from services.loaders import ProfileLoader, PROFILE_CARD_PROJECTION
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+    
+    async def to_list(self, length):
+        return self.docs[:length]
+
+
+class FakeUsers:
+    """users collection stand-in that records every find() it receives"""
+    
+    def __init__(self, count):
+        self.docs = {
+            f"user_{i}": {"user_id": f"user_{i}", "name": f"User {i}", "email": f"u{i}@example.com"}
+            for i in range(count)
+        }
+        self.queries = []
+    
+    def find(self, query, projection):
+        self.queries.append((query, projection))
+        ids = query["user_id"]["$in"]
+        return FakeCursor([
+            {k: v for k, v in self.docs[i].items() if projection.get(k)}
+            for i in ids if i in self.docs
+        ])
+
+
+class TestProfileLoader:
+    """Test batching, caching and projection of profile lookups"""
+    
+    def test_concurrent_loads_issue_one_query(self):
+        users = FakeUsers(50)
+        
+        async def run():
+            loader = ProfileLoader(collection=users)
+            # The per-row pattern routes used to have: one lookup per schedule, many repeats
+            ids = [f"user_{i % 20}" for i in range(200)] + ["missing"]
+            results = await asyncio.gather(*(loader.load(i) for i in ids))
+            return loader, ids, results
+        
+        loader, ids, results = asyncio.run(run())
+        assert loader.query_count == 1
+        assert len(users.queries) == 1
+        assert sorted(users.queries[0][0]["user_id"]["$in"]) == sorted(set(ids))
+        assert results[-1] is None
+        assert [r["user_id"] for r in results[:-1]] == ids[:-1]
+        print("SUCCESS: 201 loads resolved with a single $in query")
+    
+    def test_load_many_and_cache(self):
+        users = FakeUsers(10)
+        
+        async def run():
+            loader = ProfileLoader(collection=users)
+            first = await loader.load_many(["user_1", "user_2", "user_3"])
+            second = await loader.load_many(["user_2", "user_3"])
+            third = await loader.load("user_4")
+            return loader, first, second, third
+        
+        loader, first, second, third = asyncio.run(run())
+        assert [u["name"] for u in first] == ["User 1", "User 2", "User 3"]
+        assert [u["name"] for u in second] == ["User 2", "User 3"]
+        assert third["name"] == "User 4"
+        # Cached ids are not re-queried; only user_4 needed a second round trip
+        assert loader.query_count == 2
+        assert users.queries[1][0]["user_id"]["$in"] == ["user_4"]
+        print("SUCCESS: Repeat loads are served from the request cache")
+    
+    def test_card_projection_and_private_copies(self):
+        users = FakeUsers(3)
+        
+        async def run():
+            loader = ProfileLoader(collection=users)
+            a, b = await loader.load_many(["user_1", "user_1"])
+            a["match_type"] = "traveler"
+            return a, b
+        
+        a, b = asyncio.run(run())
+        assert users.queries[0][1] is PROFILE_CARD_PROJECTION
+        assert "email" not in a and "password_hash" not in PROFILE_CARD_PROJECTION
+        assert "match_type" not in b
+        print("SUCCESS: Cards use the slim projection and callers get their own copy")
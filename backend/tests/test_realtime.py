@@ -0,0 +1,150 @@
+"""
+Journeyman Dating App - Realtime Tests
+Tests for the multiplexed RPC envelope on the /ws/{user_id} socket
+"""
+import pytest
+import requests
+import os
+import json
+import time
+import uuid
+from websockets.sync.client import connect
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+WS_URL = BASE_URL.replace("https://", "wss://").replace("http://", "ws://")
+
+
+def register_user(prefix: str) -> dict:
+    """Register a throwaway user and return its id and session token."""
+    unique_id = uuid.uuid4().hex[:8]
+    response = requests.post(f"{BASE_URL}/api/auth/register", json={
+        "name": f"{prefix} {unique_id}",
+        "email": f"{prefix.lower()}_{unique_id}@example.com",
+        "password": "testpass123"
+    })
+    assert response.status_code == 200
+    data = response.json()
+    return {"user_id": data["user_id"], "token": data["session_token"]}
+
+
+def rpc(ws, op: str, payload: dict = None) -> dict:
+    """Send one RPC frame and wait for the reply with the same id."""
+    request_id = uuid.uuid4().hex
+    ws.send(json.dumps({"type": "rpc", "id": request_id, "op": op, "payload": payload or {}}))
+    while True:
+        frame = json.loads(ws.recv(timeout=10))
+        if frame.get("type") == "rpc_result" and frame.get("id") == request_id:
+            return frame
+
+
+class TestWebSocketRpc:
+    """Test request/response operations over the WebSocket"""
+
+    @pytest.fixture
+    def user(self):
+        return register_user("Rpc")
+
+    def test_rpc_unread_count(self, user):
+        """RPC reply is correlated by id and carries the HTTP handler's payload"""
+        with connect(f"{WS_URL}/ws/{user['user_id']}?token={user['token']}") as ws:
+            reply = rpc(ws, "notifications.unread_count")
+
+        assert reply["ok"] is True
+        assert "count" in reply["data"]
+        print(f"SUCCESS: RPC unread count: {reply['data']['count']}")
+
+    def test_rpc_pipelined_requests(self, user):
+        """Several in-flight requests each get their own reply"""
+        with connect(f"{WS_URL}/ws/{user['user_id']}?token={user['token']}") as ws:
+            ids = []
+            for op in ["notifications.list", "chat.conversations", "notifications.unread_count"]:
+                request_id = uuid.uuid4().hex
+                ids.append(request_id)
+                ws.send(json.dumps({"type": "rpc", "id": request_id, "op": op, "payload": {}}))
+
+            replies = {}
+            while len(replies) < len(ids):
+                frame = json.loads(ws.recv(timeout=10))
+                if frame.get("type") == "rpc_result":
+                    replies[frame["id"]] = frame
+
+        assert set(replies) == set(ids)
+        assert all(r["ok"] for r in replies.values())
+        print("SUCCESS: Pipelined RPC requests all answered")
+
+    def test_rpc_errors_mirror_http(self, user):
+        """Handler HTTP errors come back as error replies"""
+        other = register_user("RpcOther")
+        with connect(f"{WS_URL}/ws/{user['user_id']}?token={user['token']}") as ws:
+            unmatched = rpc(ws, "chat.send", {"user_id": other["user_id"], "content": "hi"})
+            unknown = rpc(ws, "nope.nothing")
+            missing = rpc(ws, "discover.action", {"action": "like"})
+
+        assert unmatched["ok"] is False and unmatched["error"]["status"] == 403
+        assert unknown["ok"] is False and unknown["error"]["status"] == 404
+        assert missing["ok"] is False and missing["error"]["status"] == 400
+        print("SUCCESS: RPC errors returned with HTTP status codes")
+
+    def test_rpc_requires_authenticated_socket(self, user):
+        """A socket opened without a session can't issue RPCs"""
+        with connect(f"{WS_URL}/ws/{user['user_id']}") as ws:
+            reply = rpc(ws, "notifications.unread_count")
+
+        assert reply["ok"] is False
+        assert reply["error"]["status"] == 401
+        print("SUCCESS: Unauthenticated RPC rejected")
+
+
+class TestFocusedConversationNotifications:
+    """Test presence-aware notification suppression on the chat send path"""
+    
+    @pytest.fixture
+    def matched_pair(self):
+        sender = register_user("FocusSender")
+        recipient = register_user("FocusRecipient")
+        for a, b in [(sender, recipient), (recipient, sender)]:
+            response = requests.post(
+                f"{BASE_URL}/api/discover/action?target_user_id={b['user_id']}&action=like",
+                headers={"Authorization": f"Bearer {a['token']}"}
+            )
+            assert response.status_code == 200
+        return sender, recipient
+    
+    def message_notifications(self, user):
+        response = requests.get(
+            f"{BASE_URL}/api/notifications",
+            headers={"Authorization": f"Bearer {user['token']}"}
+        )
+        assert response.status_code == 200
+        return [n for n in response.json()["notifications"] if n["type"] == "new_message"]
+    
+    def send(self, sender, recipient, text):
+        response = requests.post(
+            f"{BASE_URL}/api/chat/{recipient['user_id']}",
+            headers={"Authorization": f"Bearer {sender['token']}"},
+            json={"recipient_id": recipient["user_id"], "content": text}
+        )
+        assert response.status_code == 200
+    
+    def test_focused_recipient_gets_no_notification(self, matched_pair):
+        sender, recipient = matched_pair
+        with connect(f"{WS_URL}/ws/{recipient['user_id']}?token={recipient['token']}") as ws:
+            ws.send(json.dumps({"type": "focus", "user_id": sender["user_id"]}))
+            rpc(ws, "notifications.unread_count")  # round trip so the focus frame is processed
+            self.send(sender, recipient, "you there?")
+        time.sleep(0.5)
+        
+        assert self.message_notifications(recipient) == []
+        print("SUCCESS: No notification for a focused conversation")
+    
+    def test_unfocused_burst_collapses(self, matched_pair):
+        sender, recipient = matched_pair
+        for i in range(3):
+            self.send(sender, recipient, f"message {i}")
+        time.sleep(0.5)  # notifications are written by the background worker
+        
+        notifications = self.message_notifications(recipient)
+        assert len(notifications) == 1
+        assert notifications[0]["data"]["count"] == 3
+        assert notifications[0]["message"].startswith("3 new messages from")
+        print(f"SUCCESS: Burst collapsed into: {notifications[0]['message']}")
@@ -0,0 +1,94 @@
+"""
+Journeyman Dating App - Recurring Schedule Tests
+Tests for lazy expansion of recurrence rules and recurring schedules in the overlap index
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "journeyman_test")
+
+from services.recurrence import occurrences, series_end_date, occurrence_count, validate_recurrence
+from services.overlap_index import OverlapIndex
+
+# Two weeks on the rig, two weeks off, for six rotations
+ROTATION = {
+    "schedule_id": "sched_rig",
+    "user_id": "user_rig",
+    "destination": "Aberdeen",
+    "latitude": 57.1497,
+    "longitude": -2.0943,
+    "start_date": "2031-01-01",
+    "end_date": "2031-01-14",
+    "recurrence": {"frequency": "weekly", "interval": 4, "count": 6, "until": None}
+}
+
+
+def one_off(schedule_id, user_id, start_date, end_date):
+    return {**ROTATION, "schedule_id": schedule_id, "user_id": user_id,
+            "start_date": start_date, "end_date": end_date, "recurrence": None}
+
+
+class TestRecurrenceExpansion:
+    """Test that rules expand only inside the requested window"""
+    
+    def test_series_end(self):
+        assert occurrence_count(ROTATION) == 6
+        assert series_end_date(ROTATION) == "2031-06-03"
+        until = {**ROTATION, "recurrence": {"frequency": "daily", "interval": 2, "until": "2031-01-09"}}
+        assert occurrence_count(until) == 5
+        print("SUCCESS: Series end computed from count and until")
+    
+    def test_window_expansion(self):
+        # The window falls in the second rotation's off-weeks and the third rotation
+        found = occurrences(ROTATION, "2031-02-15", "2031-03-02")
+        assert [(o["start_date"], o["end_date"], o["occurrence"]) for o in found] == [
+            ("2031-02-26", "2031-03-11", 2)
+        ]
+        assert occurrences(ROTATION, "2031-01-16", "2031-01-28") == []
+        assert occurrences(ROTATION, "2031-06-04", "2031-12-31") == []
+        print("SUCCESS: Only occurrences inside the window are expanded")
+    
+    def test_one_off_yields_copy(self):
+        trip = one_off("sched_once", "user_once", "2031-03-01", "2031-03-03")
+        [found] = occurrences(trip, "2031-03-02", "2031-03-02")
+        found["distance"] = 4.2
+        assert found == {**trip, "distance": 4.2}
+        assert "distance" not in trip
+        print("SUCCESS: One-off occurrences don't alias the indexed schedule")
+    
+    def test_until_before_start_rejected(self):
+        validate_recurrence(ROTATION)
+        validate_recurrence({**ROTATION, "recurrence": {"frequency": "daily", "until": "2031-01-01"}})
+        for until in ("2030-12-31", "next year"):
+            with pytest.raises(ValueError):
+                validate_recurrence({**ROTATION, "recurrence": {"frequency": "daily", "until": until}})
+        print("SUCCESS: Invalid until dates rejected")
+
+
+class TestRecurringOverlapIndex:
+    """Test that the index stores envelopes but matches occurrences"""
+    
+    def test_search_expands_occurrences(self):
+        index = OverlapIndex()
+        index.add(ROTATION)
+        assert len(index) == 1
+        
+        hits = index.search(57.15, -2.09, 25, "2031-01-20", "2031-02-05")
+        assert [h[0]["start_date"] for h in hits] == ["2031-01-29"]
+        # Inside the envelope but between rotations
+        assert index.search(57.15, -2.09, 25, "2031-01-16", "2031-01-28") == []
+        print("SUCCESS: Index matches occurrences, not the whole envelope")
+    
+    def test_recurring_query_schedule(self):
+        index = OverlapIndex()
+        index.add(one_off("sched_a", "user_a", "2031-03-01", "2031-03-03"))
+        index.add(one_off("sched_b", "user_b", "2031-03-16", "2031-03-20"))
+        
+        # sched_a falls inside a rotation; sched_b only inside the envelope
+        hits = index.search_schedule(ROTATION, 25, exclude_user_id="user_rig")
+        assert [h[0]["schedule_id"] for h in hits] == ["sched_a"]
+        print("SUCCESS: Recurring trips match only schedules overlapping an occurrence")
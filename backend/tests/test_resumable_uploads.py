@@ -0,0 +1,154 @@
+"""
+Journeyman Dating App - Resumable Upload Tests
+Tests chunk offsets, resuming after a dropped connection and assembly
+"""
+import asyncio
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "journeyman_test")
+
+from starlette.requests import ClientDisconnect
+
+from services import storage, uploads
+from services.uploads import ResumableUploads, ChunkRejected
+
+
+class FakeSessions:
+    """upload_sessions stand-in supporting the operations ResumableUploads uses"""
+    
+    def __init__(self):
+        self.docs = {}
+    
+    def _match(self, doc, query):
+        for field, expected in query.items():
+            if field == "$or":
+                if not any(self._match(doc, option) for option in expected):
+                    return False
+            elif isinstance(expected, dict) and "$lt" in expected:
+                if doc.get(field) is None or not doc[field] < expected["$lt"]:
+                    return False
+            elif doc.get(field) != expected:
+                return False
+        return True
+    
+    async def insert_one(self, doc):
+        self.docs[doc["upload_id"]] = dict(doc)
+    
+    async def find_one(self, query, projection=None):
+        doc = self.docs.get(query["upload_id"])
+        return dict(doc) if doc and self._match(doc, query) else None
+    
+    async def find_one_and_update(self, query, update, projection=None, return_document=None):
+        doc = self.docs.get(query["upload_id"])
+        if not doc or not self._match(doc, query):
+            return None
+        before = dict(doc)
+        doc.update(update.get("$set", {}))
+        for field, value in update.get("$push", {}).items():
+            doc[field] = doc[field] + [value]
+        return dict(doc) if return_document else before
+    
+    async def update_one(self, query, update):
+        doc = self.docs.get(query["upload_id"])
+        if doc and self._match(doc, query):
+            doc.update(update["$set"])
+
+
+async def chunks(data, size=1000, drop_after=None):
+    for i in range(0, len(data), size):
+        if drop_after is not None and i >= drop_after:
+            raise ClientDisconnect()
+        yield data[i:i + size]
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    monkeypatch.setattr(uploads, "PARTS_DIR", tmp_path / "parts")
+    monkeypatch.setattr(storage, "UPLOAD_DIR", tmp_path)
+    monkeypatch.setattr(storage, "s3_client", None)
+    sessions = FakeSessions()
+    monkeypatch.setattr(ResumableUploads, "collection", property(lambda self: sessions))
+    return ResumableUploads()
+
+
+class TestResumableUploads:
+    """Test that a dropped chunk resumes without resending received bytes"""
+    
+    def test_resume_after_drop_and_complete(self, service, tmp_path):
+        data = os.urandom(10_000)
+        
+        async def run():
+            session = await service.create("user_1", "user_1/clip.mp4", "video/mp4", "video", len(data))
+            get = lambda: service.get(session["upload_id"], "user_1")
+            
+            # First chunk arrives whole, the second drops after 3000 of its 6000 bytes
+            offset = await service.append(await get(), 0, chunks(data[:4000]))
+            assert offset == 4000
+            offset = await service.append(await get(), 4000, chunks(data[4000:], drop_after=3000))
+            assert offset == 7000
+            
+            # A stale retry of the second chunk is refused with the offset to resume from
+            with pytest.raises(ChunkRejected) as rejected:
+                await service.append(await get(), 4000, chunks(data[4000:]))
+            assert rejected.value.offset == 7000
+            
+            offset = await service.append(await get(), 7000, chunks(data[7000:]))
+            assert offset == len(data)
+            
+            async def record(stored):
+                return {"media_id": "media_1", **stored}
+            
+            return await service.complete(await get(), record), await get()
+        
+        media, session = asyncio.run(run())
+        assert media["size"] == len(data)
+        assert (tmp_path / "user_1_clip.mp4").read_bytes() == data
+        assert session["status"] == "complete" and session["media_id"] == "media_1"
+        assert not (tmp_path / "parts" / session["upload_id"]).exists()
+        print("SUCCESS: Upload resumed from the server offset and assembled")
+    
+    def test_chunk_past_declared_size_rejected(self, service):
+        async def run():
+            session = await service.create("user_1", "user_1/a.jpg", "image/jpeg", "image", 100)
+            with pytest.raises(ChunkRejected):
+                await service.append(session, 0, chunks(os.urandom(150), size=50))
+            return await service.get(session["upload_id"], "user_1")
+        
+        assert asyncio.run(run())["offset"] == 0
+        print("SUCCESS: Oversized chunk rejected")
+    
+    def test_abandoned_assembly_reclaimed(self, service):
+        data = os.urandom(3000)
+        
+        async def record(stored):
+            return {"media_id": "media_2", **stored}
+        
+        async def run():
+            session = await service.create("user_1", "user_1/b.jpg", "image/jpeg", "image", len(data))
+            await service.append(session, 0, chunks(data))
+            sessions = service.collection.docs
+            
+            # Another request is still assembling: refused, and appends say so
+            sessions[session["upload_id"]].update(
+                status="assembling", assembling_until=datetime.now(timezone.utc) + timedelta(minutes=5)
+            )
+            stuck = await service.get(session["upload_id"], "user_1")
+            with pytest.raises(ChunkRejected, match="already being completed"):
+                await service.complete(stuck, record)
+            with pytest.raises(ChunkRejected, match="being completed"):
+                await service.append(stuck, len(data), chunks(b"x"))
+            
+            # Its worker died and the lease ran out
+            sessions[session["upload_id"]]["assembling_until"] = datetime.now(timezone.utc) - timedelta(seconds=1)
+            media = await service.complete(stuck, record)
+            return media, await service.get(session["upload_id"], "user_1")
+        
+        media, session = asyncio.run(run())
+        assert media["media_id"] == "media_2" and session["status"] == "complete"
+        print("SUCCESS: Upload left assembling by a dead worker completed after its lease")
@@ -0,0 +1,105 @@
+"""
+Journeyman Dating App - Roster Import Tests
+Tests for ICS/JSON roster parsing, validation and the vectorized overlap pass
+"""
+import os
+import random
+import sys
+from datetime import date
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "journeyman_test")
+
+from services.rosters import parse_ics, parse_json_roster, validate_entry
+from services.overlap_index import overlap_pairs
+from utils.helpers import calculate_distance
+
+ROSTER_ICS = """BEGIN:VCALENDAR\r
+VERSION:2.0\r
+BEGIN:VEVENT\r
+SUMMARY:Layover LIS\r
+LOCATION:Lisbon\\, Portugal\r
+DTSTART;VALUE=DATE:20310301\r
+DTEND;VALUE=DATE:20310303\r
+END:VEVENT\r
+BEGIN:VEVENT\r
+SUMMARY:Layover ORD with a very long description that the exporter has\r
+  folded\r
+DTSTART:20310310T220000Z\r
+DTEND:20310311T060000Z\r
+LOCATION:Chicago\r
+GEO:41.8781;-87.6298\r
+END:VEVENT\r
+END:VCALENDAR\r
+"""
+
+
+class TestRosterParsing:
+    """Test that rosters reduce to validated schedule entries"""
+    
+    def test_parse_ics(self):
+        lisbon, chicago = parse_ics(ROSTER_ICS)
+        assert lisbon["destination"] == "Lisbon, Portugal"
+        # All-day DTEND is exclusive
+        assert (lisbon["start_date"], lisbon["end_date"]) == ("2031-03-01", "2031-03-02")
+        assert chicago["title"].endswith("has folded")
+        assert (chicago["start_date"], chicago["end_date"]) == ("2031-03-10", "2031-03-11")
+        assert (chicago["latitude"], chicago["longitude"]) == (41.8781, -87.6298)
+        print("SUCCESS: ICS events parsed")
+    
+    def test_parse_json_roster(self):
+        entries = parse_json_roster({"schedules": [{"destination": "Denver", "start_date": "2031-01-01"}]})
+        assert validate_entry(entries[0])["end_date"] == "2031-01-01"
+        with pytest.raises(ValueError):
+            parse_json_roster({"trips": []})
+        print("SUCCESS: JSON roster parsed")
+    
+    def test_validate_entry_rejects_bad_rows(self):
+        today = date(2031, 1, 1)
+        bad = [
+            {"start_date": "2031-02-01", "end_date": "2031-02-02"},
+            {"destination": "Oslo", "start_date": "2031-02-05", "end_date": "2031-02-01"},
+            {"destination": "Oslo", "start_date": "02/05/2031", "end_date": "2031-02-06"},
+            {"destination": "Oslo", "start_date": "2030-12-01", "end_date": "2030-12-02"},
+            {"destination": "Oslo", "start_date": "2031-02-01", "latitude": 95, "longitude": 10},
+            {"destination": 123, "start_date": "2031-02-01", "end_date": "2031-02-02"},
+            {"destination": "Oslo", "title": ["x"], "start_date": "2031-02-01", "end_date": "2031-02-02"},
+            {"destination": "Oslo", "notes": {"a": 1}, "start_date": "2031-02-01", "end_date": "2031-02-02"},
+        ]
+        for entry in bad:
+            with pytest.raises(ValueError):
+                validate_entry(entry, today)
+        print("SUCCESS: Invalid roster rows rejected")
+
+
+class TestOverlapPairs:
+    """Test the vectorized overlap pass against pairwise checks"""
+    
+    def test_matches_pairwise(self):
+        rng = random.Random(11)
+        
+        def schedule(i):
+            day = rng.randint(1, 28)
+            return {
+                "schedule_id": f"s{i}",
+                "latitude": rng.uniform(40, 42),
+                "longitude": rng.uniform(-75, -73),
+                "start_date": f"2031-04-{day:02d}",
+                "end_date": f"2031-04-{min(28, day + rng.randint(0, 3)):02d}"
+            }
+        
+        roster = [schedule(i) for i in range(30)]
+        pool = [schedule(i) for i in range(500)]
+        
+        expected = set()
+        for i, a in enumerate(roster):
+            for j, b in enumerate(pool):
+                if a["start_date"] <= b["end_date"] and a["end_date"] >= b["start_date"]:
+                    if calculate_distance(a["latitude"], a["longitude"], b["latitude"], b["longitude"]) <= 50:
+                        expected.add((i, j))
+        
+        assert {(i, j) for i, j, _ in overlap_pairs(roster, pool, 50)} == expected
+        print("SUCCESS: Vectorized overlaps match pairwise checks")
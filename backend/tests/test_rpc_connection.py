@@ -0,0 +1,63 @@
+"""
+Journeyman Dating App - RPC Connection Tests
+Tests the per-socket RPC concurrency cap and session re-checks
+"""
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "journeyman_test")
+
+from services.websocket import RpcConnection
+
+
+class TestRpcConnection:
+    """Test that one socket can't run unbounded RPCs or outlive its session"""
+    
+    def test_concurrent_rpcs_capped(self):
+        running, peak = 0, 0
+    
+        async def rpc():
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+    
+        async def run():
+            connection = RpcConnection({"user_id": "u1"}, None, max_concurrent=3)
+            for _ in range(20):
+                await connection.submit(rpc)
+            while connection.tasks:
+                await asyncio.sleep(0.01)
+    
+        asyncio.run(run())
+        assert peak == 3
+        print("SUCCESS: 20 pipelined RPCs never ran more than 3 at once")
+    
+    def test_session_rechecked(self):
+        sessions = [{"user_id": "u1", "name": "Renamed"}, None]
+        checks = []
+    
+        async def authenticate():
+            checks.append(1)
+            return sessions[len(checks) - 1]
+    
+        async def run():
+            connection = RpcConnection({"user_id": "u1"}, authenticate, recheck_seconds=60)
+            fresh = await connection.current_principal()
+            connection._checked_at -= 60
+            # Concurrent frames share one re-check
+            refreshed = await asyncio.gather(*(connection.current_principal() for _ in range(5)))
+            connection._checked_at -= 60
+            revoked = await connection.current_principal()
+            return fresh, refreshed, revoked, await connection.current_principal()
+    
+        fresh, refreshed, revoked, after = asyncio.run(run())
+        assert fresh == {"user_id": "u1"}
+        assert all(p["name"] == "Renamed" for p in refreshed)
+        assert revoked is None and after is None
+        assert len(checks) == 2
+        print("SUCCESS: The principal is re-checked and dropped once the session ends")
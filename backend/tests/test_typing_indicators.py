@@ -0,0 +1,100 @@
+"""
+Journeyman Dating App - Typing Indicator Tests
+Tests for server-side typing coalescing, expiry and rate limiting
+"""
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "journeyman_test")
+
+from services.typing_indicators import TypingTracker
+from utils import helpers
+
+
+class RecordingManager:
+    """Connection manager stand-in that records forwarded typing frames"""
+    
+    def __init__(self):
+        self.sent = []
+    
+    async def send_typing_indicator(self, from_user, to_user, is_typing):
+        self.sent.append((from_user, to_user, is_typing))
+
+
+class TestTypingTracker:
+    """Test that only typing transitions reach the recipient"""
+    
+    def test_keystrokes_coalesce_to_one_start(self):
+        async def run():
+            sink = RecordingManager()
+            tracker = TypingTracker(sink, timeout=5, rate=100, burst=100)
+            for _ in range(20):
+                await tracker.update("alice", "bob", True)
+            await tracker.update("alice", "bob", False)
+            return sink.sent
+        
+        sent = asyncio.run(run())
+        assert sent == [("alice", "bob", True), ("alice", "bob", False)]
+        print("SUCCESS: 20 typing frames forwarded as 2 transitions")
+    
+    def test_typing_expires(self):
+        async def run():
+            sink = RecordingManager()
+            tracker = TypingTracker(sink, timeout=0.05, rate=100, burst=100)
+            await tracker.update("alice", "bob", True)
+            await asyncio.sleep(0.15)
+            return sink.sent, tracker.is_typing("alice", "bob")
+        
+        sent, still_typing = asyncio.run(run())
+        assert sent == [("alice", "bob", True), ("alice", "bob", False)]
+        assert not still_typing
+        print("SUCCESS: Typing state auto-expired")
+    
+    def test_rate_limit_drops_excess_frames(self):
+        async def run():
+            sink = RecordingManager()
+            tracker = TypingTracker(sink, timeout=5, rate=0.001, burst=2)
+            results = [await tracker.update("alice", f"user_{i}", True) for i in range(5)]
+            return results
+        
+        results = asyncio.run(run())
+        assert results == [True, True, False, False, False]
+        print("SUCCESS: Typing frames beyond the burst were dropped")
+    
+    def test_clear_on_send_and_forget(self):
+        async def run():
+            sink = RecordingManager()
+            tracker = TypingTracker(sink, timeout=5, rate=100, burst=100)
+            await tracker.update("alice", "bob", True)
+            await tracker.update("alice", "carol", True)
+            await tracker.clear("alice", "bob")
+            await tracker.clear("alice", "bob")
+            await tracker.forget("alice")
+            return sink.sent
+        
+        sent = asyncio.run(run())
+        assert sent.count(("alice", "bob", False)) == 1
+        assert ("alice", "carol", False) in sent
+        print("SUCCESS: Typing cleared on send and on disconnect")
+
+
+class TestLastActiveThrottle:
+    """Test that last_active writes are throttled without delaying the online flip"""
+    
+    def test_throttled_pruned_and_online_flip(self, monkeypatch):
+        monkeypatch.setattr(helpers, "_last_active_writes", helpers.OrderedDict())
+        online = {"user_id": "u1", "online": True}
+        assert helpers.should_write_last_active(online)
+        assert not helpers.should_write_last_active(online)
+        # Marked offline (e.g. the socket closed): the next request writes straight away
+        assert helpers.should_write_last_active({"user_id": "u1", "online": False})
+        
+        # Entries older than the interval are dropped as others arrive
+        helpers._last_active_writes["u1"] -= helpers.LAST_ACTIVE_WRITE_INTERVAL
+        helpers._last_active_writes.move_to_end("u1", last=False)
+        assert helpers.should_write_last_active({"user_id": "u2", "online": True})
+        assert list(helpers._last_active_writes) == ["u2"]
+        print("SUCCESS: last_active writes throttled, pruned, and never delay going online")
@@ -0,0 +1,159 @@
+"""
+Journeyman Dating App - Unread Counter Tests
+Tests that reconciling counters never overwrites increments that race it
+"""
+import asyncio
+import copy
+import os
+import sys
+
+import pytest
+from pymongo.errors import BulkWriteError
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "journeyman_test")
+
+from services import counters
+from services.counters import UnreadCounters
+
+
+def matches(doc: dict, query: dict) -> bool:
+    for field, condition in query.items():
+        if field == "$or":
+            if not any(matches(doc, q) for q in condition):
+                return False
+        elif field == "$and":
+            if not all(matches(doc, q) for q in condition):
+                return False
+        elif isinstance(condition, dict):
+            if "$exists" in condition and (field in doc) != condition["$exists"]:
+                return False
+            if "$lt" in condition and not (field in doc and doc[field] < condition["$lt"]):
+                return False
+        elif doc.get(field) != condition:
+            return False
+    return True
+
+
+def apply_update(doc: dict, update: dict):
+    for field, value in update.get("$set", {}).items():
+        doc[field] = copy.deepcopy(value)
+    for path, delta in update.get("$inc", {}).items():
+        *parents, leaf = path.split(".")
+        target = doc
+        for part in parents:
+            target = target.setdefault(part, {})
+        target[leaf] = target.get(leaf, 0) + delta
+
+
+class FakeCounters:
+    """Just enough of a collection with a unique user_id index"""
+    
+    def __init__(self):
+        self.docs = {}
+    
+    async def find_one(self, query, projection=None):
+        return copy.deepcopy(self.docs.get(query["user_id"]))
+    
+    async def update_one(self, query, update, upsert=False):
+        self._update(query, update, upsert)
+    
+    async def update_many(self, query, update):
+        for doc in self.docs.values():
+            if matches(doc, query):
+                apply_update(doc, update)
+    
+    async def bulk_write(self, ops, ordered=True):
+        errors = []
+        for i, op in enumerate(ops):
+            if not self._update(op._filter, op._doc, op._upsert):
+                errors.append({"index": i, "code": 11000})
+        if errors:
+            raise BulkWriteError({"writeErrors": errors})
+    
+    def _update(self, query, update, upsert) -> bool:
+        doc = self.docs.get(query["user_id"])
+        if doc is not None and matches(doc, query):
+            apply_update(doc, update)
+        elif doc is None and upsert:
+            self.docs[query["user_id"]] = doc = {"user_id": query["user_id"]}
+            apply_update(doc, update)
+        elif upsert:
+            return False  # Duplicate key
+        return True
+
+
+class FakeSource:
+    def __init__(self, rows, during=None):
+        self.rows = rows
+        self.during = during
+    
+    async def aggregate(self, pipeline):
+        match = pipeline[0]["$match"]
+        wanted = (match.get("user_id") or match.get("recipient_id") or {}).get("$in")
+        for row in self.rows:
+            user_id = row["_id"]["user_id"] if isinstance(row["_id"], dict) else row["_id"]
+            if wanted is None or user_id in wanted:
+                yield row
+        if self.during:
+            during, self.during = self.during, None
+            await during()
+
+
+class FakeDb:
+    def __init__(self, notification_rows, message_rows, during=None):
+        self.notifications = FakeSource(notification_rows)
+        self.messages = FakeSource(message_rows, during)
+
+
+@pytest.fixture
+def store(monkeypatch):
+    collection = FakeCounters()
+    monkeypatch.setattr(UnreadCounters, "collection", property(lambda self: collection))
+    return collection
+
+
+class TestReconcile:
+    """Test that the reconciler repairs drift without causing it"""
+    
+    def test_rebuilds_and_zeroes_stale(self, store, monkeypatch):
+        service = UnreadCounters()
+        monkeypatch.setattr(counters, "db", FakeDb(
+            [{"_id": "alice", "count": 2}],
+            [{"_id": {"user_id": "alice", "conversation_id": "conv_a"}, "count": 3}]
+        ))
+    
+        async def run():
+            await service.add_notifications({"alice": 7, "bob": 4})
+            # Written before the run started, so nothing races the reconcile
+            for doc in store.docs.values():
+                doc["changed_at"] = "2000-01-01T00:00:00+00:00"
+            return await service.reconcile()
+    
+        assert asyncio.run(run()) == 1
+        assert store.docs["alice"]["notifications"] == 2
+        assert store.docs["alice"]["chats"] == {"conv_a": 3} and store.docs["alice"]["chat_total"] == 3
+        assert store.docs["bob"]["notifications"] == 0 and "reconciled_at" in store.docs["bob"]
+        print("SUCCESS: Drifted counters rebuilt and stale ones zeroed")
+    
+    def test_racing_increments_survive(self, store, monkeypatch):
+        service = UnreadCounters()
+    
+        async def concurrent_writes():
+            # A new notification for alice and a new message for carol land mid-count
+            await service.add_notifications({"alice": 1})
+            await service.add_chat("carol", "conv_c", 1)
+    
+        monkeypatch.setattr(counters, "db", FakeDb([{"_id": "alice", "count": 2}], [], during=concurrent_writes))
+    
+        async def run():
+            await service.add_notifications({"alice": 2})
+            store.docs["alice"]["changed_at"] = "2000-01-01T00:00:00+00:00"
+            await service.reconcile()
+    
+        asyncio.run(run())
+        # Not overwritten by the count taken before the increment, nor zeroed as stale
+        assert store.docs["alice"]["notifications"] == 3
+        assert store.docs["carol"]["chat_total"] == 1
+        print("SUCCESS: Increments that race a reconcile are not overwritten")
@@ -1,13 +1,17 @@
 """Utils module index."""
 from .helpers import (
-    get_current_user, get_conversation_id, create_notification,
+    get_current_user, get_user_for_session, authenticate_websocket,
+    get_conversation_id, create_notification, create_message_notification,
     calculate_distance, ICEBREAKER_PROMPTS
 )
 
 __all__ = [
     "get_current_user",
+    "get_user_for_session",
+    "authenticate_websocket",
     "get_conversation_id",
     "create_notification",
+    "create_message_notification",
     "calculate_distance",
     "ICEBREAKER_PROMPTS"
 ]
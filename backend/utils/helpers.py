@@ -1,20 +1,37 @@
 """Helper functions and utilities."""
-from fastapi import Request, HTTPException
+from fastapi import Request, HTTPException, WebSocket
+from typing import Optional
+from collections import OrderedDict
 from datetime import datetime, timezone
 from math import radians, cos, sin, asin, sqrt
+import time
 from services.database import db
 from services.websocket import manager
-from models.schemas import Notification
+from services.notifications import notification_service
 
+# Minimum seconds between last_active writes for the same user
+LAST_ACTIVE_WRITE_INTERVAL = 60
+# user_id -> time of their last write, oldest first; only the last interval's writers are kept
+_last_active_writes: "OrderedDict[str, float]" = OrderedDict()
 
-async def get_current_user(request: Request) -> dict:
-    """Get current authenticated user from session token."""
-    session_token = request.cookies.get("session_token")
-    if not session_token:
-        auth_header = request.headers.get("Authorization")
-        if auth_header and auth_header.startswith("Bearer "):
-            session_token = auth_header.split(" ")[1]
-    
+
+def should_write_last_active(user: dict) -> bool:
+    """
+    True if ``user``'s last_active is due a write. Always true while they are
+    marked offline, so coming back online is never delayed.
+    """
+    now = time.monotonic()
+    while _last_active_writes and next(iter(_last_active_writes.values())) <= now - LAST_ACTIVE_WRITE_INTERVAL:
+        _last_active_writes.popitem(last=False)
+    if user["user_id"] in _last_active_writes and user.get("online"):
+        return False
+    _last_active_writes[user["user_id"]] = now
+    _last_active_writes.move_to_end(user["user_id"])
+    return True
+
+
+async def get_user_for_session(session_token: Optional[str]) -> dict:
+    """Resolve a session token to its user document."""
     if not session_token:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
@@ -34,32 +51,91 @@ async def get_current_user(request: Request) -> dict:
     if not user:
         raise HTTPException(status_code=401, detail="User not found")
     
-    # Update last active
-    await db.users.update_one(
-        {"user_id": user["user_id"]},
-        {"$set": {"last_active": datetime.now(timezone.utc).isoformat(), "online": True}}
-    )
+    return user
+
+
+async def get_current_user(request: Request) -> dict:
+    """Get current authenticated user from session token."""
+    session_token = request.cookies.get("session_token")
+    if not session_token:
+        auth_header = request.headers.get("Authorization")
+        if auth_header and auth_header.startswith("Bearer "):
+            session_token = auth_header.split(" ")[1]
+    
+    user = await get_user_for_session(session_token)
+    
+    # Update last active, at most once per interval so chatty endpoints (typing, badges) don't write every call
+    if should_write_last_active(user):
+        await db.users.update_one(
+            {"user_id": user["user_id"]},
+            {"$set": {"last_active": datetime.now(timezone.utc).isoformat(), "online": True}}
+        )
     
     return user
 
 
+async def authenticate_websocket(websocket: WebSocket) -> Optional[dict]:
+    """
+    Authenticate a WebSocket handshake once, at connect time.
+    
+    Browsers can't set headers on WebSocket requests, so a ``token`` query
+    parameter is accepted alongside the session cookie. Returns None when the
+    handshake carries no valid session.
+    """
+    session_token = websocket.cookies.get("session_token") or websocket.query_params.get("token")
+    if not session_token:
+        auth_header = websocket.headers.get("Authorization")
+        if auth_header and auth_header.startswith("Bearer "):
+            session_token = auth_header.split(" ")[1]
+    
+    if not session_token:
+        return None
+    try:
+        return await get_user_for_session(session_token)
+    except HTTPException:
+        return None
+
+
 def get_conversation_id(user1_id: str, user2_id: str) -> str:
     """Generate consistent conversation ID from two user IDs."""
     sorted_ids = sorted([user1_id, user2_id])
     return f"conv_{sorted_ids[0]}_{sorted_ids[1]}"
 
 
-async def create_notification(user_id: str, notif_type: str, title: str, message: str, data: dict = {}):
-    """Create and send a notification to a user."""
-    notification = Notification(user_id=user_id, type=notif_type, title=title, message=message, data=data)
-    doc = notification.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
-    await db.notifications.insert_one(doc)
-    doc.pop("_id", None)
-    # Send via WebSocket if user is connected
-    if user_id in manager.active_connections:
-        await manager.send_personal_message({"type": "notification", "notification": doc}, user_id)
-    return notification
+async def create_notification(user_id: str, notif_type: str, title: str, message: str, data: dict = {},
+                              from_user: Optional[dict] = None, collapse_key: Optional[str] = None) -> dict:
+    """Queue a notification for a user; it is written and pushed in the background."""
+    return notification_service.enqueue(
+        user_id, notif_type, title, message, data=data, from_user=from_user, collapse_key=collapse_key
+    )
+
+
+async def create_message_notification(user_id: str, sender: dict, conversation_id: str, first_text: str) -> Optional[dict]:
+    """
+    Queue the "new message" notification for a conversation.
+    
+    Nothing is queued when the recipient has the conversation focused. Otherwise
+    unread message notifications roll up into one per conversation that reads
+    "N new messages from X" after the first message.
+    """
+    if manager.is_focused(user_id, conversation_id):
+        return None
+    return notification_service.enqueue(
+        user_id, "new_message", "New Message", first_text,
+        data={"sender_id": sender["user_id"], "conversation_id": conversation_id},
+        from_user=sender, collapse_key=conversation_id
+    )
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """True if the request's If-None-Match names ``etag`` (weak validators compare equal)."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    candidates = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return etag.removeprefix("W/") in candidates
 
 
 def calculate_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
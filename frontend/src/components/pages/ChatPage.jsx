@@ -44,6 +44,9 @@ export const ChatPage = () => {
     const wsUrl = API.replace('https://', 'wss://').replace('http://', 'ws://');
     wsRef.current = new WebSocket(`${wsUrl}/ws/${user?.user_id}`);
     
+    // Tell the server this conversation is on screen so it skips message notifications
+    wsRef.current.onopen = () => sendFocus(!document.hidden);
+    
     wsRef.current.onmessage = (event) => {
       const data = JSON.parse(event.data);
       
@@ -70,6 +73,18 @@ export const ChatPage = () => {
     };
   };
 
+  const sendFocus = (focused) => {
+    if (wsRef.current?.readyState === WebSocket.OPEN) {
+      wsRef.current.send(JSON.stringify(focused ? { type: 'focus', user_id: userId } : { type: 'blur' }));
+    }
+  };
+
+  useEffect(() => {
+    const handleVisibility = () => sendFocus(!document.hidden);
+    document.addEventListener('visibilitychange', handleVisibility);
+    return () => document.removeEventListener('visibilitychange', handleVisibility);
+  }, [userId]);
+
   const sendReadReceipt = (conversationId, senderId) => {
     if (wsRef.current?.readyState === WebSocket.OPEN) {
       wsRef.current.send(JSON.stringify({
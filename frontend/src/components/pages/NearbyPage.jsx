@@ -1,6 +1,6 @@
-import { useState, useEffect, useMemo } from 'react';
+import { useState, useEffect, useMemo, useCallback } from 'react';
 import { useNavigate } from 'react-router-dom';
-import { MapContainer, TileLayer, Marker, Popup, useMap } from 'react-leaflet';
+import { MapContainer, TileLayer, Marker, Popup, useMap, useMapEvents } from 'react-leaflet';
 import L from 'leaflet';
 import 'leaflet/dist/leaflet.css';
 import { useAuth } from '../../context/AuthContext';
@@ -29,6 +29,101 @@ const MapCenterUpdater = ({ center }) => {
   return null;
 };
 
+const avatarUrl = (u) =>
+  u.profile_photo || u.picture || `https://ui-avatars.com/api/?name=${encodeURIComponent(u.name)}&background=1E293B&color=F8FAFC`;
+
+const createUserIcon = (userPhoto, isOnline) => {
+  return L.divIcon({
+    html: `<img src="${userPhoto}" class="map-marker ${isOnline ? 'map-marker-online' : ''}" />`,
+    className: '',
+    iconSize: [50, 50],
+    iconAnchor: [25, 25],
+  });
+};
+
+const createClusterIcon = (cluster) => {
+  const size = Math.min(64, 32 + Math.round(Math.log10(cluster.count) * 12));
+  return L.divIcon({
+    html: `<div class="map-cluster ${cluster.hot_travelers_count ? 'map-cluster-hot' : ''}" style="width:${size}px;height:${size}px">${cluster.count}</div>`,
+    className: '',
+    iconSize: [size, size],
+    iconAnchor: [size / 2, size / 2],
+  });
+};
+
+// Fetches clusters (or, zoomed in, individual markers) for the visible map area
+const ClusteredUsers = ({ onSelect }) => {
+  const [view, setView] = useState({ clusters: [], markers: [] });
+
+  const load = useCallback(async (map) => {
+    const bounds = map.getBounds();
+    const west = ((bounds.getWest() + 540) % 360) - 180;
+    const east = ((bounds.getEast() + 540) % 360) - 180;
+    const params = new URLSearchParams({
+      south: Math.max(-90, bounds.getSouth()),
+      north: Math.min(90, bounds.getNorth()),
+      west: bounds.getEast() - bounds.getWest() >= 360 ? -180 : west,
+      east: bounds.getEast() - bounds.getWest() >= 360 ? 180 : east,
+      zoom: map.getZoom(),
+    });
+    try {
+      setView(await api.get(`/discover/nearby/clusters?${params}`));
+    } catch (err) {
+      console.error('Error:', err);
+    }
+  }, []);
+
+  const map = useMapEvents({ moveend: () => load(map) });
+  useEffect(() => { load(map); }, [load, map]);
+
+  return (
+    <>
+      {view.clusters.map(c => (
+        <Marker
+          key={c.id}
+          position={[c.latitude, c.longitude]}
+          icon={createClusterIcon(c)}
+          eventHandlers={{ click: () => map.setView([c.latitude, c.longitude], map.getZoom() + 2) }}
+        />
+      ))}
+      {view.markers.map(u => (
+        <Marker
+          key={u.user_id}
+          position={[u.latitude, u.longitude]}
+          icon={createUserIcon(avatarUrl(u), u.online)}
+        >
+          <Popup>
+            <div className="map-user-popup">
+              <img src={avatarUrl(u)} alt={u.name} />
+              <h4>{u.name}{u.age && `, ${u.age}`}</h4>
+              <p>{u.distance ? `${u.distance} mi away` : u.location}</p>
+              {u.is_hot_traveler && (
+                <div style={{ 
+                  background: 'linear-gradient(135deg, #FF6B35, #EF4444)', 
+                  color: 'white', 
+                  padding: '4px 10px', 
+                  borderRadius: '12px', 
+                  fontSize: '0.7rem', 
+                  fontWeight: '600',
+                  marginBottom: '8px',
+                  display: 'inline-flex',
+                  alignItems: 'center',
+                  gap: '4px'
+                }}>
+                  🔥 Hot Traveler {u.traveling_to && `→ ${u.traveling_to}`}
+                </div>
+              )}
+              <button onClick={() => onSelect(u)} className="btn-primary">
+                View Profile
+              </button>
+            </div>
+          </Popup>
+        </Marker>
+      ))}
+    </>
+  );
+};
+
 export const NearbyPage = () => {
   const navigate = useNavigate();
   const { user } = useAuth();
@@ -59,15 +154,6 @@ export const NearbyPage = () => {
     return [39.8283, -98.5795]; // Center of US
   }, [location, user]);
 
-  const createUserIcon = (userPhoto, isOnline) => {
-    return L.divIcon({
-      html: `<img src="${userPhoto}" class="map-marker ${isOnline ? 'map-marker-online' : ''}" />`,
-      className: '',
-      iconSize: [50, 50],
-      iconAnchor: [25, 25],
-    });
-  };
-
   const createCurrentLocationIcon = () => {
     return L.divIcon({
       html: `<div class="current-location-marker"></div>`,
@@ -144,47 +230,8 @@ export const NearbyPage = () => {
                 </Marker>
               )}
               
-              {/* Nearby users */}
-              {nearbyUsers.map(u => u.latitude && (
-                <Marker
-                  key={u.user_id}
-                  position={[u.latitude, u.longitude]}
-                  icon={createUserIcon(
-                    u.profile_photo || u.picture || `https://ui-avatars.com/api/?name=${encodeURIComponent(u.name)}&background=1E293B&color=F8FAFC`,
-                    u.online
-                  )}
-                >
-                  <Popup>
-                    <div className="map-user-popup">
-                      <img 
-                        src={u.profile_photo || u.picture || `https://ui-avatars.com/api/?name=${encodeURIComponent(u.name)}`} 
-                        alt={u.name} 
-                      />
-                      <h4>{u.name}{u.age && `, ${u.age}`}</h4>
-                      <p>{u.distance ? `${u.distance} mi away` : u.location}</p>
-                      {u.is_hot_traveler && (
-                        <div style={{ 
-                          background: 'linear-gradient(135deg, #FF6B35, #EF4444)', 
-                          color: 'white', 
-                          padding: '4px 10px', 
-                          borderRadius: '12px', 
-                          fontSize: '0.7rem', 
-                          fontWeight: '600',
-                          marginBottom: '8px',
-                          display: 'inline-flex',
-                          alignItems: 'center',
-                          gap: '4px'
-                        }}>
-                          🔥 Hot Traveler {u.traveling_to && `→ ${u.traveling_to}`}
-                        </div>
-                      )}
-                      <button onClick={() => navigate(`/profile/${u.user_id}`)} className="btn-primary">
-                        View Profile
-                      </button>
-                    </div>
-                  </Popup>
-                </Marker>
-              ))}
+              {/* Nearby users, clustered by the server for the current viewport */}
+              <ClusteredUsers onSelect={(u) => navigate(`/profile/${u.user_id}`)} />
             </MapContainer>
           </div>
         ) : (